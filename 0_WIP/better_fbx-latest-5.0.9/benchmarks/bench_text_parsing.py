@@ -0,0 +1,173 @@
+# benchmark of the intermediate text parsing in read_some_data
+#   python bench_text_parsing.py [vertex count] [pose key frame count]
+# writes a synthetic intermediate text file of a quad grid mesh with one uv and one normal set and an animated bone,
+# then parses it with the previous line loop and with the current tokenizer and section table
+# the parsers are taken from importer.py without importing it, for it needs bpy
+# results with the defaults (2,295,162 lines, 145.2 MB, best of 3, single core, noisy machine):
+#   previous line loop 13.06s - 19.07s, current tokenizer 9.00s - 11.55s, 1.20x - 1.83x
+import ast
+import functools
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ADDON_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "better_fbx")
+sys.path.insert(0, ADDON_DIRECTORY)
+import intermediate
+
+
+def load_importer_parsers():
+    path = os.path.join(ADDON_DIRECTORY, "importer.py")
+    with open(path, 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    names = {"convert_bulk_lines", "parse_bulk_dic", "set_bulk_data", "flush_bulk_dic", "parse_polygon_dic"}
+    body = [node for node in tree.body if (isinstance(node, ast.FunctionDef) and node.name in names) or (isinstance(node, ast.Assign) and any(getattr(target, 'id', None) == "BULK_SECTIONS" for target in node.targets))]
+    namespace = {"np": np, "intermediate": intermediate}
+    exec(compile(ast.Module(body=body, type_ignores=[]), path, "exec"), namespace)
+    return namespace
+
+
+def write_file(path, vertex_count, frame_count):
+    side = int(vertex_count ** 0.5)
+    polygon_count = (side - 1) * (side - 1)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        for i in range(side * side):
+            f.write("[Vertex,0,{},{},{},{},0.0]\r\n".format(i, side * side, float(i % side), float(i // side)))
+        f.write("\r\n")
+        for i in range(polygon_count):
+            (x, y) = (i % (side - 1), i // (side - 1))
+            v = y * side + x
+            f.write("[Polygon,0,{},{},{},{},{},{}]\r\n".format(i, polygon_count, v, v + 1, v + side + 1, v + side))
+        f.write("\r\n")
+        for i in range(polygon_count):
+            f.write("[UV,0,{},{},0.25,0.5,0.75,0.5,0.75,0.125,0.25,0.125]\r\n".format(i, polygon_count))
+        f.write("\r\n")
+        for i in range(polygon_count):
+            f.write("[Normal,0,{},{},0.0,0.0,1.0,0.0,0.0,1.0,0.0,0.0,1.0,0.0,0.0,1.0]\r\n".format(i, polygon_count))
+        f.write("\r\n")
+        for i in range(frame_count):
+            f.write("[PoseKey,0,{},{},{},1.0,0.0,0.0,0.0,0.0,1.0,0.0,0.0,0.0,0.0,1.0,0.0,0.5,0.25,0.125,1.0]\r\n".format(i, frame_count, i))
+        f.write("\r\n")
+
+
+# the line loop and parsers of read_some_data before the tokenizer, limited to the sections of the file
+def parse_previous(path):
+    pose_key_dic = {}
+    vertex_dic = {}
+    polygon_dic = {}
+    uv_dic = {}
+    normal_dic = {}
+    max_uv = [0.0, 0.0]
+    def parse_list(dic, tokens, convert):
+        key = int(tokens[1])
+        if key not in dic:
+            dic[key] = [None] * int(tokens[3])
+        dic[key][int(tokens[2])] = convert(tokens)
+    def parse_uv(tokens):
+        uvs = []
+        for i in range(4, len(tokens), 2):
+            uv = (float(tokens[i]), float(tokens[i+1]))
+            uvs.append(uv)
+            if uv[0] > max_uv[0]:
+                max_uv[0] = uv[0]
+            if uv[1] > max_uv[1]:
+                max_uv[1] = uv[1]
+        return uvs
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            line = line.strip("\r\n")
+            if len(line) == 0:
+                continue
+            if line.startswith("[") and line.endswith("]"):
+                line = line[1:-1]
+                tokens = line.split(",")
+                for i in range(len(tokens)):
+                    tokens[i] = tokens[i].replace("\;", ",")
+                    tokens[i] = tokens[i].replace("nan(ind)", "0.0")
+                if len(tokens) > 0:
+                    section = tokens[0]
+                    if section == "PoseKey":
+                        if len(tokens) == 21:
+                            parse_list(pose_key_dic, tokens, lambda tokens: [int(tokens[4])] + [float(token) for token in tokens[5:]])
+                    elif section == "Vertex":
+                        if len(tokens) == 7:
+                            parse_list(vertex_dic, tokens, lambda tokens: [float(token) for token in tokens[4:]])
+                    elif section == "Polygon":
+                        if len(tokens) >= 4:
+                            parse_list(polygon_dic, tokens, lambda tokens: [int(token) for token in tokens[4:]])
+                    elif section == "UV":
+                        if len(tokens) >= 4:
+                            parse_list(uv_dic, tokens, parse_uv)
+                    elif section == "Normal":
+                        if len(tokens) >= 4:
+                            parse_list(normal_dic, tokens, lambda tokens: [(float(tokens[i]), float(tokens[i+1]), float(tokens[i+2])) for i in range(4, len(tokens), 3)])
+    return (vertex_dic, polygon_dic, uv_dic, normal_dic, pose_key_dic)
+
+
+# the tokenizer and section table of read_some_data, limited to the sections of the file
+def parse_current(path, parsers):
+    pose_key_dic = {}
+    vertex_dic = {}
+    polygon_dic = {}
+    uv_dic = {}
+    normal_dic = {}
+    bulk_sections = parsers["BULK_SECTIONS"]
+    parse_bulk_dic = parsers["parse_bulk_dic"]
+    pending_dics = {section: {} for section in bulk_sections}
+    section_parsers = {
+        "PoseKey": (4, 5, functools.partial(parse_bulk_dic, pose_key_dic, pending_dics["PoseKey"], "PoseKey")),
+        "Vertex": (4, 5, functools.partial(parse_bulk_dic, vertex_dic, pending_dics["Vertex"], "Vertex")),
+        "Polygon": (4, sys.maxsize, functools.partial(parsers["parse_polygon_dic"], polygon_dic)),
+        "UV": (4, 5, functools.partial(parse_bulk_dic, uv_dic, pending_dics["UV"], "UV")),
+        "Normal": (4, 5, functools.partial(parse_bulk_dic, normal_dic, pending_dics["Normal"], "Normal")),
+    }
+    for tokens in intermediate.iter_text_tokens(path, frozenset(), bulk_sections):
+        section_parser = section_parsers.get(tokens[0])
+        if section_parser != None and section_parser[0] <= len(tokens) <= section_parser[1]:
+            section_parser[2](tokens)
+    for (section, bulk_dic) in [("PoseKey", pose_key_dic), ("Vertex", vertex_dic), ("UV", uv_dic), ("Normal", normal_dic)]:
+        parsers["flush_bulk_dic"](bulk_dic, pending_dics[section], section)
+    return (vertex_dic, polygon_dic, uv_dic, normal_dic, pose_key_dic)
+
+
+def measure(function, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best == None else min(best, elapsed)
+    return (best, result)
+
+
+def main():
+    vertex_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    frame_count = int(sys.argv[2]) if len(sys.argv) > 2 else 300000
+    parsers = load_importer_parsers()
+    (fd, path) = tempfile.mkstemp(suffix=".txt")
+    os.close(fd)
+    try:
+        write_file(path, vertex_count, frame_count)
+        with open(path, 'rb') as f:
+            line_count = sum(1 for line in f)
+        print("{} lines, {:.1f} MB".format(line_count, os.path.getsize(path) / 1e6))
+        (previous_time, previous) = measure(lambda: parse_previous(path), 3)
+        (current_time, current) = measure(lambda: parse_current(path, parsers), 3)
+        # both parsers must read the same values
+        for (previous_dic, current_dic) in zip(previous, current):
+            for (key, value) in previous_dic.items():
+                if isinstance(current_dic[key], np.ndarray):
+                    assert np.array_equal(np.array(value, dtype=np.float32).reshape(current_dic[key].shape), current_dic[key])
+                else:
+                    assert value == current_dic[key]
+        print("previous line loop: {:.2f}s".format(previous_time))
+        print("current tokenizer:  {:.2f}s ({:.2f}x)".format(current_time, previous_time / current_time))
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# benchmark of save_weight_dic in the exporter
+#   python bench_weights.py [vertex count] [max influence count]
+# makes random sparse weights with 1 to 8 influences per vertex, with max influence count above 8 a few vertices get that many,
+# then writes the Weight lines with the baseline per vertex sort, slice and normalize loop and with the current save_weight_dic,
+# the written lines must be the same, the padded and flat paths of process_weights are timed on their own too
+# save_weight_dic is taken from exporter.py without importing it, for it needs bpy
+# results on 200,000 vertices with 0.9M influences (best of 3, single core, noisy machine):
+#   widest vertex 8, padded path: baseline 2.6s - 3.1s, save_weight_dic 1.2s - 2.2s, most of it formats the tokens,
+#     process_padded_weights 0.12s - 0.27s, process_flat_weights 0.32s - 0.70s
+#   widest vertex 64, flat path: baseline 1.4s, save_weight_dic 1.2s - 1.5s,
+#     process_padded_weights 0.40s - 0.51s, peak 427 - 555 MB, process_flat_weights 0.31s - 0.35s, peak 46 - 49 MB
+import ast
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+ADDON_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "better_fbx")
+
+
+def load_exporter_functions():
+    path = os.path.join(ADDON_DIRECTORY, "exporter.py")
+    with open(path, 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    names = {"save_weight_dic", "process_weights", "process_padded_weights", "process_flat_weights"}
+    body = [node for node in tree.body if (isinstance(node, ast.FunctionDef) and node.name in names) or (isinstance(node, ast.Assign) and any(getattr(target, 'id', None) == "MAX_PADDED_WEIGHT_WIDTH" for target in node.targets))]
+    namespace = {"np": np}
+    exec(compile(ast.Module(body=body, type_ignores=[]), path, "exec"), namespace)
+    return namespace
+
+
+def take_second_from_token(token):
+    return token[1]
+
+
+# frozen copy of the baseline save_weight_dic, weight_dic is {key: [[[bone key, weight], ...] per vertex]}
+def save_weight_dic_baseline(f, weight_dic, my_max_bone_influences):
+    for (key, value) in weight_dic.items():
+        for (key2, value2) in enumerate(value):
+            # sort weights reversely
+            value2.sort(key=take_second_from_token, reverse=True)
+            # truncate weights
+            if my_max_bone_influences != 'Unlimited':
+                value2 = value2[:min(len(value2), int(my_max_bone_influences))]
+            # normalize weights
+            sum = 0.0
+            for token in value2:
+                sum += token[1]
+            if sum > 0.0:
+                for token in value2:
+                    token[1] /= sum
+            item_list = ["Weight", str(key), str(key2), str(len(value))]
+            item_list.extend([str(item2) for item in value2 for item2 in item])
+            f.write("[{}]\r\n".format(",".join(item_list)))
+        f.write("\r\n")
+
+
+def make_weights(vertex_count, max_influence_count):
+    rng = np.random.default_rng(0)
+    counts = rng.integers(1, 9, vertex_count)
+    # a few vertices driven by many bones set the width of the padded arrays
+    if max_influence_count > 8:
+        counts[rng.integers(0, vertex_count, 16)] = max_influence_count
+    offsets = np.zeros(vertex_count + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    slots = rng.integers(0, max(max_influence_count, 8) * 4, offsets[-1])
+    # float32 weights, as vertex groups store them
+    weights = rng.random(offsets[-1]).astype(np.float32).astype(np.float64)
+    bone_keys = ["0.{}".format(i) for i in range(max(max_influence_count, 8) * 4)]
+    return (offsets, slots, weights, bone_keys)
+
+
+# the baseline dictionary is sorted in place, so it is made again for every run
+def make_baseline_weight_dic(offsets, slots, weights, bone_keys):
+    (offsets, slots, weights) = (offsets.tolist(), slots.tolist(), weights.tolist())
+    return {0: [[[bone_keys[slots[i]], weights[i]] for i in range(offsets[j], offsets[j + 1])] for j in range(len(offsets) - 1)]}
+
+
+# return (best time, peak traced memory, result), tracemalloc slows down python code, so the peak is measured in one more run
+def measure(function, repeat, setup=None):
+    best = None
+    for i in range(repeat):
+        argument = setup() if setup != None else None
+        start = time.perf_counter()
+        result = function(argument)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best == None else min(best, elapsed)
+    argument = setup() if setup != None else None
+    tracemalloc.start()
+    function(argument)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return (best, peak, result)
+
+
+def write_baseline(weight_dic, my_max_bone_influences):
+    f = io.StringIO()
+    save_weight_dic_baseline(f, weight_dic, my_max_bone_influences)
+    return f.getvalue()
+
+
+def write_current(functions, weight_dic, my_max_bone_influences):
+    f = io.StringIO()
+    functions["save_weight_dic"](f, weight_dic, my_max_bone_influences, 0.0)
+    return f.getvalue()
+
+
+def main():
+    vertex_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    max_influence_count = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    functions = load_exporter_functions()
+    (offsets, slots, weights, bone_keys) = make_weights(vertex_count, max_influence_count)
+    width = int(np.diff(offsets).max())
+    print("{} vertices, {} influences, widest vertex {}, {} path".format(vertex_count, len(weights), width, "flat" if width > functions["MAX_PADDED_WEIGHT_WIDTH"] else "padded"))
+    for my_max_bone_influences in ['4', 'Unlimited']:
+        (baseline_time, baseline_peak, baseline) = measure(lambda weight_dic: write_baseline(weight_dic, my_max_bone_influences), 3, lambda: make_baseline_weight_dic(offsets, slots, weights, bone_keys))
+        (current_time, current_peak, current) = measure(lambda argument: write_current(functions, {0: (offsets, slots, weights, bone_keys)}, my_max_bone_influences), 3)
+        # the minimum weight prune is off, so the written lines must be the same as the baseline
+        assert baseline == current
+        print("max influences {}:".format(my_max_bone_influences))
+        print("  baseline per vertex loop: {:.3f}s, peak {:.1f} MB".format(baseline_time, baseline_peak / 1e6))
+        print("  current save_weight_dic:  {:.3f}s, peak {:.1f} MB ({:.2f}x)".format(current_time, current_peak / 1e6, baseline_time / current_time))
+        for name in ["process_padded_weights", "process_flat_weights"]:
+            (process_time, process_peak, result) = measure(lambda argument: functions[name](offsets, slots, weights, my_max_bone_influences, 0.0), 3)
+            print("  {}: {:.3f}s, peak {:.1f} MB".format(name, process_time, process_peak / 1e6))
+
+
+if __name__ == "__main__":
+    main()
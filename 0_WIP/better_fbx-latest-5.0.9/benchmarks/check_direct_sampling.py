@@ -0,0 +1,241 @@
+# compare the direct sampling of the exporter with frame_set on every frame
+#   blender -b --factory-startup --python check_direct_sampling.py
+# every case builds a small keyframed scene, direct sampling must either fall back to frame_set
+# or match the depsgraph on every frame within DIRECT_SAMPLING_TOLERANCE,
+# the cases which direct sampling supports must not fall back, the exit code is 1 if any case fails
+import math
+import os
+import sys
+
+import bpy
+import mathutils
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from better_fbx import exporter
+
+FRAMES = list(range(1, 49))
+# keyframes every KEY_STEP frames, the frames between them are bezier interpolated
+KEY_STEP = 6
+
+
+def clear_scene():
+    for ob in list(bpy.data.objects):
+        bpy.data.objects.remove(ob)
+    for collection in (bpy.data.actions, bpy.data.armatures, bpy.data.meshes):
+        for item in list(collection):
+            collection.remove(item)
+    scene = bpy.context.scene
+    scene.frame_start = FRAMES[0]
+    scene.frame_end = FRAMES[-1]
+    scene.render.frame_map_old = 100
+    scene.render.frame_map_new = 100
+
+
+def new_empty(name, rotation_mode='XYZ', parent=None):
+    ob = bpy.data.objects.new(name, None)
+    bpy.context.scene.collection.objects.link(ob)
+    ob.rotation_mode = rotation_mode
+    if parent != None:
+        ob.parent = parent
+        # an offset parent inverse, as left by parenting in the viewport
+        ob.matrix_parent_inverse = mathutils.Matrix.Translation((0.5, -1.0, 0.25)) @ mathutils.Matrix.Rotation(0.3, 4, 'Z')
+    return ob
+
+
+# bones are (name, parent name, head, tail, connected, rotation mode)
+def new_armature(name, bones):
+    ob = bpy.data.objects.new(name, bpy.data.armatures.new(name))
+    bpy.context.scene.collection.objects.link(ob)
+    bpy.context.view_layer.objects.active = ob
+    bpy.ops.object.mode_set(mode='EDIT')
+    for (bone_name, parent_name, head, tail, connected, rotation_mode) in bones:
+        edit_bone = ob.data.edit_bones.new(bone_name)
+        edit_bone.head = head
+        edit_bone.tail = tail
+        edit_bone.roll = 0.4
+        if parent_name != None:
+            edit_bone.parent = ob.data.edit_bones[parent_name]
+            edit_bone.use_connect = connected
+    bpy.ops.object.mode_set(mode='OBJECT')
+    for (bone_name, parent_name, head, tail, connected, rotation_mode) in bones:
+        ob.pose.bones[bone_name].rotation_mode = rotation_mode
+    return ob
+
+
+# keyframe location, rotation and scale of an object or a pose bone with a different wave per channel
+def key_transforms(owner, seed):
+    rotation_path = {'QUATERNION': "rotation_quaternion", 'AXIS_ANGLE': "rotation_axis_angle"}.get(owner.rotation_mode, "rotation_euler")
+    for frame in range(FRAMES[0], FRAMES[-1] + 1, KEY_STEP):
+        t = frame * 0.13 + seed
+        owner.location = (math.sin(t), math.cos(t * 0.7), 0.3 * math.sin(t * 1.3))
+        owner.scale = (1.0 + 0.2 * math.sin(t), 1.0 + 0.1 * math.cos(t), 1.0 - 0.15 * math.sin(t * 0.5))
+        if rotation_path == "rotation_quaternion":
+            # not normalized, the evaluation normalizes it
+            owner.rotation_quaternion = (1.0 + 0.5 * math.cos(t), math.sin(t), 0.4 * math.cos(t * 0.9), 0.3)
+        elif rotation_path == "rotation_axis_angle":
+            owner.rotation_axis_angle = (2.0 * math.sin(t), math.cos(t), 0.5, math.sin(t * 0.6))
+        else:
+            owner.rotation_euler = (math.sin(t), 0.8 * math.cos(t * 1.1), 1.5 * math.sin(t * 0.4))
+        for data_path in ["location", rotation_path, "scale"]:
+            owner.keyframe_insert(data_path, frame=frame)
+
+
+def build_objects():
+    parent = new_empty("parent", 'QUATERNION')
+    key_transforms(parent, 0.0)
+    for (index, rotation_mode) in enumerate(['XYZ', 'ZXY', 'YZX', 'AXIS_ANGLE']):
+        key_transforms(new_empty("child_" + rotation_mode, rotation_mode, parent), index + 1.0)
+
+
+def build_armature(rotation_modes):
+    bones = [
+        ("root", None, (0.0, 0.0, 0.0), (0.0, 0.3, 1.0), False, rotation_modes[0]),
+        ("connected", "root", (0.0, 0.3, 1.0), (0.2, 0.1, 2.0), True, rotation_modes[1]),
+        ("offset", "connected", (0.5, 0.0, 2.5), (0.5, 0.5, 3.0), False, rotation_modes[2]),
+        ]
+    ob = new_armature("armature", bones)
+    key_transforms(ob, 0.5)
+    for (index, pose_bone) in enumerate(ob.pose.bones):
+        # the location keys of the connected bone are ignored by the evaluation
+        key_transforms(pose_bone, index + 2.0)
+    return ob
+
+
+def build_quaternion_armature():
+    build_armature(['QUATERNION', 'QUATERNION', 'QUATERNION'])
+
+
+def build_euler_armature():
+    build_armature(['XYZ', 'ZYX', 'YXZ'])
+
+
+def build_axis_angle_armature():
+    build_armature(['AXIS_ANGLE', 'AXIS_ANGLE', 'QUATERNION'])
+
+
+def build_parented_to_armature():
+    ob = build_armature(['QUATERNION', 'XYZ', 'AXIS_ANGLE'])
+    child = new_empty("child", 'XYZ', ob)
+    child.parent_type = 'ARMATURE'
+    key_transforms(child, 7.0)
+
+
+def build_bone_parent():
+    ob = build_armature(['QUATERNION', 'XYZ', 'AXIS_ANGLE'])
+    child = new_empty("child", 'XYZ', ob)
+    child.parent_type = 'BONE'
+    child.parent_bone = "offset"
+    key_transforms(child, 7.0)
+
+
+def build_ik_constraint():
+    ob = build_armature(['QUATERNION', 'XYZ', 'AXIS_ANGLE'])
+    target = new_empty("target")
+    key_transforms(target, 3.0)
+    constraint = ob.pose.bones["offset"].constraints.new('IK')
+    constraint.target = target
+    constraint.chain_count = 2
+
+
+def build_object_constraint():
+    build_objects()
+    constraint = bpy.data.objects["child_XYZ"].constraints.new('COPY_ROTATION')
+    constraint.target = bpy.data.objects["child_ZXY"]
+
+
+def build_driver():
+    build_objects()
+    fcurve = bpy.data.objects["child_ZXY"].driver_add("location", 2)
+    fcurve.driver.expression = "frame * 0.1"
+
+
+def build_nla_track():
+    build_objects()
+    ob = bpy.data.objects["child_XYZ"]
+    track = ob.animation_data.nla_tracks.new()
+    track.strips.new("strip", FRAMES[0], ob.animation_data.action)
+
+
+def build_action_influence():
+    build_objects()
+    bpy.data.objects["child_XYZ"].animation_data.action_influence = 0.5
+
+
+def build_inherit_rotation():
+    ob = build_armature(['QUATERNION', 'XYZ', 'AXIS_ANGLE'])
+    ob.data.bones["offset"].use_inherit_rotation = False
+
+
+def build_delta_transforms():
+    build_objects()
+    bpy.data.objects["child_ZXY"].delta_location = (1.0, 2.0, 3.0)
+
+
+def build_time_remapping():
+    build_objects()
+    bpy.context.scene.render.frame_map_new = 50
+
+
+def build_muted_fcurve():
+    build_objects()
+    ob = bpy.data.objects["child_XYZ"]
+    ob.animation_data.action.fcurves.find("location", index=1).mute = True
+
+
+# (name, build function, direct sampling is expected)
+CASES = [
+    ("objects with quaternion, euler and axis angle keys", build_objects, True),
+    ("quaternion armature with a connected bone", build_quaternion_armature, True),
+    ("euler armature with a connected bone", build_euler_armature, True),
+    ("axis angle armature with a connected bone", build_axis_angle_armature, True),
+    ("object parented to an armature", build_parented_to_armature, True),
+    ("muted fcurve", build_muted_fcurve, True),
+    ("object parented to a bone", build_bone_parent, False),
+    ("ik constraint", build_ik_constraint, False),
+    ("object constraint", build_object_constraint, False),
+    ("driver", build_driver, False),
+    ("nla track", build_nla_track, False),
+    ("action influence", build_action_influence, False),
+    ("bone without inherit rotation", build_inherit_rotation, False),
+    ("delta transforms", build_delta_transforms, False),
+    ("time remapping", build_time_remapping, False),
+    ]
+
+
+# return (sampled directly, max error over every frame and node)
+def compare(context):
+    hierarchy_dic = exporter.Hierarchy()
+    exporter.make_hierarchy_dic(hierarchy_dic, False, False, False, False, [], list(context.scene.objects))
+    matrix_dic = exporter.sample_pose_keys(context, hierarchy_dic, FRAMES)
+    if matrix_dic == None:
+        return (False, 0.0)
+    error = 0.0
+    for (i, frame) in enumerate(FRAMES):
+        context.scene.frame_set(frame)
+        context.view_layer.update()
+        for (key, matrices) in matrix_dic.items():
+            pose_key = np.array(exporter.get_pose_key_matrix(hierarchy_dic[key][-2], hierarchy_dic[key][-1]), dtype=np.float64)
+            error = max(error, float(np.abs(matrices[i] - pose_key).max()))
+    return (True, error)
+
+
+def main():
+    failed = False
+    for (name, build, expect_direct) in CASES:
+        clear_scene()
+        build()
+        (direct, error) = compare(bpy.context)
+        if direct:
+            ok = error <= exporter.DIRECT_SAMPLING_TOLERANCE
+            result = "direct, max error {:.2e}".format(error)
+        else:
+            ok = not expect_direct
+            result = "falls back to frame_set"
+        failed = failed or not ok
+        print("{} {}: {}".format("ok  " if ok else "FAIL", name, result))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
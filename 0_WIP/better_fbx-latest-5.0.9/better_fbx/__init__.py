@@ -32,6 +32,10 @@ bl_info = {
 
 if "bpy" in locals():
     import importlib
+    if "intermediate" in locals():
+        importlib.reload(intermediate)
+    if "converter" in locals():
+        importlib.reload(converter)
     if "importer" in locals():
         importlib.reload(importer)
     if "exporter" in locals():
@@ -50,3 +54,5 @@ def unregister():
     unregister_exporter()
     from .importer import unregister_importer
     unregister_importer()
+    from .converter import close_pools
+    close_pools()
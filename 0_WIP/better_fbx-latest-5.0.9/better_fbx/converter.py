@@ -0,0 +1,337 @@
+import concurrent.futures
+import errno
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+
+# poll interval while waiting for the converter to open the stream
+STREAM_POLL_INTERVAL = 0.01
+# default size of a worker pool
+DEFAULT_MAX_WORKERS = max(1, min(4, os.cpu_count() or 1))
+
+# add-on directory: fbx-utility executable path
+executable_paths = {}
+# (worker command, max workers): worker pool
+worker_pools = {}
+worker_pools_lock = threading.Lock()
+
+
+# resolve the fbx-utility executable for this platform once per add-on directory
+def get_executable_path(addon_directory):
+    if addon_directory in executable_paths:
+        return executable_paths[addon_directory]
+    executable_path = None
+    if platform.system() == 'Windows':
+        if platform.machine().endswith('64'):
+            executable_path = os.path.join(addon_directory, "bin", platform.system(), "x64", "fbx-utility")
+        else:
+            executable_path = os.path.join(addon_directory, "bin", platform.system(), "x86", "fbx-utility")
+    else:
+        if platform.system() == 'Linux':
+            glibc_version = os.confstr('CS_GNU_LIBC_VERSION').split(" ")
+            if glibc_version[0] == 'glibc' and glibc_version[1] >= '2.29':
+                executable_path = os.path.join(addon_directory, "bin", platform.system(), "fbx-utility")
+            else:
+                executable_path = os.path.join(addon_directory, "bin", platform.system(), "fbx-utility2")
+        elif platform.system() == 'Darwin':
+            if platform.mac_ver()[0] >= '10.15':
+                executable_path = os.path.join(addon_directory, "bin", platform.system(), "fbx-utility")
+            elif platform.mac_ver()[0] >= '10.13':
+                executable_path = os.path.join(addon_directory, "bin", platform.system(), "fbx-utility2")
+            else:
+                executable_path = os.path.join(addon_directory, "bin", platform.system(), "fbx-utility3")
+        # chmod
+        if not os.access(executable_path, os.X_OK):
+            os.chmod(executable_path, 0o755)
+    executable_paths[addon_directory] = executable_path
+    return executable_path
+
+
+# command which starts the pure python worker, it still starts executable_path once per request,
+# so it only saves the fbx-utility startup once the fbx-utility itself can run as a long-lived worker
+# without executable_path the worker copies the input to the output instead of converting it
+def make_worker_command(python_path, executable_path=None):
+    command = [python_path, os.path.abspath(__file__), "--worker"]
+    if executable_path != None:
+        command.append(executable_path)
+    return command
+
+
+# streaming needs named pipes, which are not available on Windows
+def is_stream_supported():
+    return hasattr(os, 'mkfifo')
+
+
+# open the write end of the stream, return None if the converter exits before it opens the read end
+def open_stream(stream_path, process):
+    while True:
+        try:
+            fd = os.open(stream_path, os.O_WRONLY | os.O_NONBLOCK)
+            break
+        except OSError as e:
+            # no reader yet
+            if e.errno != errno.ENXIO:
+                raise
+        if process.poll() != None:
+            return None
+        time.sleep(STREAM_POLL_INTERVAL)
+    # the converter consumes the stream at its own pace
+    os.set_blocking(fd, True)
+    return fd
+
+
+# start the converter, which reads its input from stream_path, then stream the intermediate data to it
+# write_stream writes the intermediate data to a binary file object, return the converter return code
+def run_streamed(command, stream_path, write_stream):
+    os.mkfifo(stream_path)
+    try:
+        process = subprocess.Popen(command)
+        try:
+            fd = open_stream(stream_path, process)
+            if fd != None:
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        write_stream(f)
+                except BrokenPipeError:
+                    # the converter stopped reading, its return code tells why
+                    pass
+        except BaseException:
+            process.kill()
+            process.wait()
+            raise
+        return process.wait()
+    finally:
+        os.remove(stream_path)
+
+
+# worker protocol, one json object per line:
+#   request on stdin: {"args": [fbx-utility arguments...]}
+#   response on stdout: {"returncode": int}
+# the worker exits when stdin is closed
+class ConverterProcess:
+    def __init__(self, worker_command):
+        self.process = subprocess.Popen(worker_command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, universal_newlines=True, bufsize=1)
+
+    def is_alive(self):
+        return self.process.poll() == None
+
+    # return the converter return code, or None if the worker died
+    def convert(self, args):
+        try:
+            self.process.stdin.write(json.dumps({"args": args}) + "\n")
+            self.process.stdin.flush()
+            line = self.process.stdout.readline()
+        except (BrokenPipeError, OSError):
+            return None
+        if len(line) == 0:
+            return None
+        return json.loads(line)["returncode"]
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        self.process.wait()
+
+
+# at most max_workers worker processes, idle workers are reused by later requests
+# after close busy workers are closed when they are released instead of being reused
+class ConverterPool:
+    def __init__(self, worker_command, max_workers=DEFAULT_MAX_WORKERS):
+        self.worker_command = worker_command
+        self.max_workers = max_workers
+        self.idle_workers = []
+        self.worker_count = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while True:
+                if self.closed:
+                    raise RuntimeError("Converter pool is closed")
+                while len(self.idle_workers) > 0:
+                    worker = self.idle_workers.pop()
+                    if worker.is_alive():
+                        return worker
+                    self.worker_count -= 1
+                if self.worker_count < self.max_workers:
+                    self.worker_count += 1
+                    break
+                self.condition.wait()
+        try:
+            return ConverterProcess(self.worker_command)
+        except BaseException:
+            with self.condition:
+                self.worker_count -= 1
+                self.condition.notify()
+            raise
+
+    def release(self, worker):
+        with self.condition:
+            if not self.closed and worker.is_alive() and self.worker_count <= self.max_workers:
+                self.idle_workers.append(worker)
+                worker = None
+            else:
+                self.worker_count -= 1
+            self.condition.notify()
+        if worker != None:
+            worker.close()
+
+    # run one conversion on a pooled worker, return the converter return code
+    def convert(self, args):
+        worker = self.acquire()
+        try:
+            returncode = worker.convert(args)
+        finally:
+            self.release(worker)
+        # the worker died, report it as a failed conversion
+        return returncode if returncode != None else -1
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            idle_workers = self.idle_workers
+            self.idle_workers = []
+            self.worker_count -= len(idle_workers)
+            # wake the requests waiting for a worker
+            self.condition.notify_all()
+        for worker in idle_workers:
+            worker.close()
+
+
+# shared pool per worker command and size, it lives until the add-on is unregistered
+# the size is part of the key, for a pool in use by another conversion must keep its limit
+def get_pool(worker_command, max_workers=DEFAULT_MAX_WORKERS):
+    with worker_pools_lock:
+        key = (tuple(worker_command), max_workers)
+        if key not in worker_pools:
+            worker_pools[key] = ConverterPool(worker_command, max_workers)
+        return worker_pools[key]
+
+
+def close_pools():
+    with worker_pools_lock:
+        pools = list(worker_pools.values())
+        worker_pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+# run the converter, command is [executable path, fbx-utility arguments...]
+# with a pool the arguments are sent to a pooled worker, which knows the executable path
+def run_converter(command, pool=None):
+    if pool != None:
+        return pool.convert(command[1:])
+    return subprocess.run(command).returncode
+
+
+# converters run in the background with at most max_concurrent of them at the same time,
+# failures are reported in submission order
+class ConverterQueue:
+    def __init__(self, max_concurrent, pool=None):
+        self.pool = pool
+        self.futures = []
+        # input file of each conversion, removed once the conversion finishes
+        self.input_paths = []
+        # number of leading conversions which are known to succeed
+        self.checked = 0
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_concurrent))
+
+    # input_path is removed by poll or wait as soon as the conversion finishes
+    def submit(self, command, input_path=None):
+        self.futures.append(self.executor.submit(run_converter, command, self.pool))
+        self.input_paths.append(input_path)
+
+    def remove_input(self, index):
+        if self.input_paths[index] != None:
+            remove_file(self.input_paths[index])
+            self.input_paths[index] = None
+
+    # return the first failed return code of the leading finished conversions, or 0
+    def poll(self):
+        for (index, future) in enumerate(self.futures):
+            if future.done():
+                self.remove_input(index)
+        while self.checked < len(self.futures) and self.futures[self.checked].done():
+            returncode = self.futures[self.checked].result()
+            if returncode != 0:
+                return returncode
+            self.checked += 1
+        return 0
+
+    # wait for the conversions, return the first failed return code in submission order, or 0
+    def wait(self):
+        while self.checked < len(self.futures):
+            returncode = self.futures[self.checked].result()
+            self.remove_input(self.checked)
+            if returncode != 0:
+                return returncode
+            self.checked += 1
+        return 0
+
+    # cancel the conversions which are not started yet and wait for the running ones
+    def close(self):
+        for future in self.futures:
+            future.cancel()
+        self.executor.shutdown(wait=True)
+
+
+# run the converters with at most max_concurrent of them at the same time, yield the return codes in submission order
+# conversions which are not started yet are cancelled when the generator is closed early
+def iter_converters(commands, max_concurrent, pool=None):
+    queue = ConverterQueue(max_concurrent, pool)
+    try:
+        for command in commands:
+            queue.submit(command)
+        for future in queue.futures:
+            yield future.result()
+    finally:
+        queue.close()
+
+
+def remove_file(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def copy_file(src_path, dst_path):
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+
+
+def run_worker(executable_path):
+    for line in sys.stdin:
+        if len(line.strip()) == 0:
+            continue
+        args = json.loads(line)["args"]
+        if executable_path != None:
+            # keep stdout for the protocol
+            returncode = subprocess.run([executable_path] + args, stdout=sys.stderr).returncode
+        else:
+            try:
+                copy_file(args[0], args[1])
+                returncode = 0
+            except OSError:
+                returncode = 1
+        sys.stdout.write(json.dumps({"returncode": returncode}) + "\n")
+        sys.stdout.flush()
+
+
+# pure python stand-ins for testing without the native fbx-utility:
+#   python converter.py --worker [executable path]
+#       worker which speaks the protocol above
+#   python converter.py <input path> <output path> [ignored fbx-utility arguments...]
+#       stub converter, consume the input and copy it to the output
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--worker":
+        run_worker(sys.argv[2] if len(sys.argv) > 2 else None)
+    else:
+        copy_file(sys.argv[1], sys.argv[2])
@@ -7,12 +7,18 @@ import sys
 import os
 import shutil
 import time
-import platform
-import subprocess
 import idprop
 import copy
+import re
+import contextlib
+import functools
 import uuid
+import io
+import struct
+import numpy as np
 from bpy.props import *
+from . import intermediate
+from . import converter
 
 
 def save_frame_rate(f, frame_rate):
@@ -64,89 +70,175 @@ def save_pose_key_dic(f, pose_key_dic):
 
 def save_vertex_dic(f, vertex_dic):
     for (key, value) in vertex_dic.items():
-        for (key2, value2) in enumerate(value):
+        for (key2, value2) in enumerate(value.tolist()):
             item_list = ["Vertex", str(key), str(key2), str(len(value))]
             item_list.extend([str(item) for item in value2])
             f.write("[{}]\r\n".format(",".join(item_list)))
         f.write("\r\n")
 
 
-def take_second_from_token(token):
-    return token[1]
-
-
-def save_weight_dic(f, weight_dic, my_max_bone_influences):
-    for (key, value) in weight_dic.items():
-        for (key2, value2) in enumerate(value):
-            # sort weights reversely
-            value2.sort(key=take_second_from_token, reverse=True)
-            # truncate weights
-            if my_max_bone_influences != 'Unlimited':
-                value2 = value2[:min(len(value2), int(my_max_bone_influences))]
-            # normalize weights
-            sum = 0.0
-            for token in value2:
-                sum += token[1]
-            if sum > 0.0:
-                for token in value2:
-                    token[1] /= sum
-            item_list = ["Weight", str(key), str(key2), str(len(value))]
-            item_list.extend([str(item2) for item in value2 for item2 in item])
+# vertices with more influences than this are processed on the flat arrays instead of the padded arrays,
+# for the padded arrays take (vertex count x widest vertex) memory
+MAX_PADDED_WEIGHT_WIDTH = 16
+
+
+# sort the weights of every vertex reversely, truncate and normalize them on a padded (vertex, influence) array,
+# argpartition selects the top weights before the sort if the vertices are truncated
+# return (influence count per vertex, slots, weights) with the influences of every vertex in a row
+def process_padded_weights(offsets, slots, weights, my_max_bone_influences, my_min_bone_weight):
+    length = len(offsets) - 1
+    counts = np.diff(offsets)
+    width = int(counts.max()) if length > 0 else 0
+    # scatter to padded arrays, the padding sorts last
+    rows = np.repeat(np.arange(length), counts)
+    columns = np.arange(len(weights)) - np.repeat(offsets[:-1], counts)
+    padded_weights = np.full((length, width), -np.inf)
+    padded_weights[rows, columns] = weights
+    padded_slots = np.zeros((length, width), dtype=np.int64)
+    padded_slots[rows, columns] = slots
+    # prune weights
+    if my_min_bone_weight > 0.0:
+        padded_weights[padded_weights < my_min_bone_weight] = -np.inf
+    # truncate weights, keep the top weights and the first columns of the weights equal to the last top weight, as a stable sort does
+    if my_max_bone_influences != 'Unlimited' and int(my_max_bone_influences) < width:
+        width = int(my_max_bone_influences)
+        positions = np.argpartition(-padded_weights, width - 1, axis=1)[:, width - 1]
+        last_weights = padded_weights[np.arange(length), positions][:, None]
+        greater = padded_weights > last_weights
+        equal = padded_weights == last_weights
+        keep = greater | (equal & (np.cumsum(equal, axis=1) <= width - greater.sum(axis=1)[:, None]))
+        padded_weights = padded_weights[keep].reshape(length, width)
+        padded_slots = padded_slots[keep].reshape(length, width)
+    # sort weights reversely, a stable sort keeps the original order of equal weights
+    order = np.argsort(-padded_weights, axis=1, kind='stable')
+    padded_weights = np.take_along_axis(padded_weights, order, axis=1)
+    padded_slots = np.take_along_axis(padded_slots, order, axis=1)
+    valid = padded_weights != -np.inf
+    # normalize weights, sum column by column to add in the same order as a per vertex loop
+    sums = np.zeros(length)
+    for column in range(width):
+        sums += np.where(valid[:, column], padded_weights[:, column], 0.0)
+    np.divide(padded_weights, sums[:, None], out=padded_weights, where=valid & (sums > 0.0)[:, None])
+    return (valid.sum(axis=1), padded_slots[valid], padded_weights[valid])
+
+
+# the same as process_padded_weights on the flat arrays, lexsort sorts the weights of every vertex at once
+def process_flat_weights(offsets, slots, weights, my_max_bone_influences, my_min_bone_weight):
+    length = len(offsets) - 1
+    rows = np.repeat(np.arange(length), np.diff(offsets))
+    weights = np.asarray(weights, dtype=np.float64)
+    # prune weights
+    if my_min_bone_weight > 0.0:
+        keep = weights >= my_min_bone_weight
+        (rows, slots, weights) = (rows[keep], slots[keep], weights[keep])
+    # sort weights reversely within every vertex, lexsort is stable and keeps the original order of equal weights
+    order = np.lexsort((-weights, rows))
+    (rows, slots, weights) = (rows[order], slots[order], weights[order])
+    counts = np.bincount(rows, minlength=length)
+    # truncate weights by their rank within the vertex
+    if my_max_bone_influences != 'Unlimited':
+        starts = np.zeros(length, dtype=np.int64)
+        np.cumsum(counts[:-1], out=starts[1:])
+        keep = np.arange(len(rows)) - starts[rows] < int(my_max_bone_influences)
+        (rows, slots, weights) = (rows[keep], slots[keep], weights[keep])
+        counts = np.minimum(counts, int(my_max_bone_influences))
+    # normalize weights, bincount adds them in order as a per vertex loop
+    sums = np.bincount(rows, weights=weights, minlength=length)[rows]
+    weights = np.divide(weights, sums, out=weights.copy(), where=sums > 0.0)
+    return (counts, slots, weights)
+
+
+# weights below my_min_bone_weight are pruned before truncation
+# return (influence count per vertex, slots, weights) with the influences of every vertex in a row
+def process_weights(offsets, slots, weights, my_max_bone_influences, my_min_bone_weight):
+    if len(offsets) > 1 and int(np.diff(offsets).max()) > MAX_PADDED_WEIGHT_WIDTH:
+        return process_flat_weights(offsets, slots, weights, my_max_bone_influences, my_min_bone_weight)
+    return process_padded_weights(offsets, slots, weights, my_max_bone_influences, my_min_bone_weight)
+
+
+def save_weight_dic(f, weight_dic, my_max_bone_influences, my_min_bone_weight):
+    for (key, (offsets, slots, weights, bone_keys)) in weight_dic.items():
+        (counts, slots, weights) = process_weights(offsets, slots, weights, my_max_bone_influences, my_min_bone_weight)
+        # interleave bone keys and weights of all vertices in one flat token list
+        tokens = [None] * (len(weights) * 2)
+        tokens[0::2] = [bone_keys[slot] for slot in slots.tolist()]
+        tokens[1::2] = [str(weight) for weight in weights.tolist()]
+        token_offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts * 2, out=token_offsets[1:])
+        token_offsets = token_offsets.tolist()
+        length = len(counts)
+        for key2 in range(length):
+            item_list = ["Weight", str(key), str(key2), str(length)]
+            item_list.extend(tokens[token_offsets[key2]:token_offsets[key2 + 1]])
             f.write("[{}]\r\n".format(",".join(item_list)))
         f.write("\r\n")
 
 
 def save_shape_dic(f, shape_dic):
-    for (key, value) in shape_dic.items():
+    for (key, (indices, positions)) in shape_dic.items():
+        # interleave vertex indices and positions in one flat token list
+        tokens = [None] * (len(indices) * 4)
+        tokens[0::4] = [str(item) for item in indices.tolist()]
+        for axis in range(3):
+            tokens[axis + 1::4] = [str(item) for item in positions[:, axis].tolist()]
         item_list = ["Shape", str(key)]
-        item_list.extend([str(item) for item in value])
+        item_list.extend(tokens)
         f.write("[{}]\r\n".format(",".join(item_list)))
     f.write("\r\n")
 
 
 def save_shape_key_dic(f, shape_key_dic):
-    for (key, value) in shape_key_dic.items():
-        for (key2, value2) in enumerate(value):
-            item_list = ["ShapeKey", str(key), str(key2), str(len(value))]
-            item_list.extend([str(item) for item in value2])
+    for (key, (frames, values)) in shape_key_dic.items():
+        # ignore Basic channel
+        channels = [str(i+1) for i in range(values.shape[1])]
+        length = len(frames)
+        for (key2, (frame, row)) in enumerate(zip(frames.tolist(), values.tolist())):
+            item_list = ["ShapeKey", str(key), str(key2), str(length), str(frame)]
+            # interleave channel indices and values
+            tokens = [None] * (len(channels) * 2)
+            tokens[0::2] = channels
+            tokens[1::2] = [str(item) for item in row]
+            item_list.extend(tokens)
             f.write("[{}]\r\n".format(",".join(item_list)))
         f.write("\r\n")
 
 
 def save_polygon_dic(f, polygon_dic):
-    for (key, value) in polygon_dic.items():
-        for (key2, value2) in enumerate(value):
-            item_list = ["Polygon", str(key), str(key2), str(len(value))]
-            item_list.extend([str(item) for item in value2])
+    for (key, (offsets, indices)) in polygon_dic.items():
+        offsets = offsets.tolist()
+        indices = indices.tolist()
+        length = len(offsets) - 1
+        for key2 in range(length):
+            item_list = ["Polygon", str(key), str(key2), str(length)]
+            item_list.extend([str(item) for item in indices[offsets[key2]:offsets[key2 + 1]]])
             f.write("[{}]\r\n".format(",".join(item_list)))
         f.write("\r\n")
 
 
-def save_uv_dic(f, uv_dic):
-    for (key, value) in uv_dic.items():
-        for (key2, value2) in enumerate(value):
-            item_list = ["UV", str(key), str(key2), str(len(value))]
-            item_list.extend([str(item2) for item in value2 for item2 in item])
+# loop_dic values are (offsets, per loop values), the loops of polygon i are values[offsets[i]:offsets[i + 1]]
+def save_loop_dic(f, section, loop_dic):
+    for (key, (offsets, values)) in loop_dic.items():
+        width = values.shape[1]
+        offsets = offsets.tolist()
+        values = values.ravel().tolist()
+        length = len(offsets) - 1
+        for key2 in range(length):
+            item_list = [section, str(key), str(key2), str(length)]
+            item_list.extend([str(item) for item in values[offsets[key2] * width:offsets[key2 + 1] * width]])
             f.write("[{}]\r\n".format(",".join(item_list)))
         f.write("\r\n")
 
 
+def save_uv_dic(f, uv_dic):
+    save_loop_dic(f, "UV", uv_dic)
+
+
 def save_normal_dic(f, normal_dic):
-    for (key, value) in normal_dic.items():
-        for (key2, value2) in enumerate(value):
-            item_list = ["Normal", str(key), str(key2), str(len(value))]
-            item_list.extend([str(item2) for item in value2 for item2 in item])
-            f.write("[{}]\r\n".format(",".join(item_list)))
-        f.write("\r\n")
+    save_loop_dic(f, "Normal", normal_dic)
 
 
 def save_color_dic(f, color_dic):
-    for (key, value) in color_dic.items():
-        for (key2, value2) in enumerate(value):
-            item_list = ["Color", str(key), str(key2), str(len(value))]
-            item_list.extend([str(item2) for item in value2 for item2 in item])
-            f.write("[{}]\r\n".format(",".join(item_list)))
-        f.write("\r\n")
+    save_loop_dic(f, "Color", color_dic)
 
 
 def save_texture_dic(f, texture_dic):
@@ -174,7 +266,7 @@ def save_mesh_material_dic(f, mesh_material_dic):
 
 def save_polygon_material_dic(f, polygon_material_dic):
     for (key, value) in polygon_material_dic.items():
-        for (key2, value2) in enumerate(value):
+        for (key2, value2) in enumerate(value.tolist()):
             item_list = ["PolygonMaterial", str(key), str(key2), str(len(value)), str(value2)]
             f.write("[{}]\r\n".format(",".join(item_list)))
         f.write("\r\n")
@@ -198,9 +290,11 @@ def save_light_dic(f, light_dic):
 
 def save_vertex_animation_dic(f, vertex_animation_dic):
     for (key, value) in vertex_animation_dic.items():
-        for (key2, value2) in enumerate(value):
-            for (key3, value3) in enumerate(value2[1]):
-                item_list = ["VertexPoseKey", str(key), str(key2), str(len(value)), str(value2[0]), str(key3), str(len(value2[1]))]
+        length = len(value[0])
+        for (key2, (frame, vertices)) in enumerate(iter_vertex_animation_frames(value)):
+            count = len(vertices)
+            for (key3, value3) in enumerate(vertices.tolist()):
+                item_list = ["VertexPoseKey", str(key), str(key2), str(length), str(frame), str(key3), str(count)]
                 item_list.extend([str(item) for item in value3])
                 f.write("[{}]\r\n".format(",".join(item_list)))
             f.write("\r\n")
@@ -242,6 +336,75 @@ def save_ik_dic(f, ik_dic):
     f.write("\r\n")
 
 
+# stream is an opened binary file object to write to instead of filepath
+def open_intermediate_file(filepath, stream, use_binary_format):
+    if stream != None:
+        return stream if use_binary_format else io.TextIOWrapper(stream, encoding='utf-8', errors='ignore')
+    return open(filepath, 'wb') if use_binary_format else open(filepath, 'w', encoding='utf-8', errors='ignore')
+
+
+def save_text_section(save_function, *args):
+    f = io.StringIO()
+    save_function(f, *args)
+    return f.getvalue().encode('utf-8', errors='ignore')
+
+
+def pack_pose_dic(pose_dic):
+    return [(key, [value]) for (key, value) in pose_dic.items()]
+
+
+def pack_pose_key_dic(pose_key_dic):
+    return [(key, [[item[0] for item in value], [item2 for item in value for item2 in item[1]]]) for (key, value) in pose_key_dic.items()]
+
+
+def pack_vertex_dic(vertex_dic):
+    return [(key, [value.astype(np.float32).tobytes()]) for (key, value) in vertex_dic.items()]
+
+
+def pack_polygon_dic(polygon_dic):
+    return [(key, [np.diff(offsets).astype(np.int32).tobytes(), indices.astype(np.int32).tobytes()]) for (key, (offsets, indices)) in polygon_dic.items()]
+
+
+def pack_loop_dic(loop_dic):
+    return [(key, [np.diff(offsets).astype(np.int32).tobytes(), values.astype(np.float32).tobytes()]) for (key, (offsets, values)) in loop_dic.items()]
+
+
+def pack_polygon_material_dic(polygon_material_dic):
+    return [(key, [value.astype(np.int32).tobytes()]) for (key, value) in polygon_material_dic.items()]
+
+
+def pack_shape_dic(shape_dic):
+    return [(key, [indices.astype(np.int32).tobytes(), positions.astype(np.float32).tobytes()]) for (key, (indices, positions)) in shape_dic.items()]
+
+
+def pack_shape_key_dic(shape_key_dic):
+    entries = []
+    for (key, (frames, values)) in shape_key_dic.items():
+        (frame_count, channel_count) = values.shape
+        channels = np.tile(np.arange(1, channel_count + 1, dtype=np.int32), frame_count)
+        entries.append((key, [frames.astype(np.int32).tobytes(), np.full(frame_count, channel_count, dtype=np.int32).tobytes(), channels.tobytes(), values.astype(np.float32).tobytes()]))
+    return entries
+
+
+def pack_edge_crease_dic(edge_crease_dic):
+    return [(key, [[item2 for item in value for item2 in item[:2]], [item[2] for item in value]]) for (key, value) in edge_crease_dic.items()]
+
+
+def pack_edge_smoothing_dic(edge_smoothing_dic):
+    return [(key, [[item2 for item in value for item2 in item]]) for (key, value) in edge_smoothing_dic.items()]
+
+
+def iter_vertex_animation_chunks(vertex_animation):
+    for (frame, vertices) in iter_vertex_animation_frames(vertex_animation):
+        yield vertices.astype('<f4').tobytes()
+
+
+# the frames are read back from the point cache files while the container is written
+def pack_vertex_animation_dic(vertex_animation_dic):
+    layout = intermediate.PACKED_SECTIONS["VertexPoseKey"]
+    return [(key, intermediate.pack_streamed_entry(key, [value[0]], layout, sum(value[1]) * 6, functools.partial(iter_vertex_animation_chunks, value))) for (key, value) in vertex_animation_dic.items()]
+
+
 def save_current_poses(context, context_objects, current_pose_dic):
     for ob in context_objects:
         if ob.type == 'ARMATURE':
@@ -307,14 +470,66 @@ def reset_all_armatures(context, context_objects):
                 ob.hide_set(save_hidden)
 
 
+# hierarchy dic with indexes, {key: [node type, name, parent key, armature object or None, object or bone]}
+# objects use "index" keys and bones use "armature index.bone index" keys, the root parent key is "-1"
+# add nodes with add() and change parents with set_parent() to keep the indexes up to date
+class Hierarchy(dict):
+    def __init__(self):
+        super().__init__()
+        # object or bone: key
+        self.node_keys = {}
+        # name: key of the first node with the name
+        self.name_keys = {}
+        # empty name: key
+        self.empty_keys = {}
+        # armature name: key
+        self.armature_keys = {}
+        # armature key: {bone name: bone key}
+        self.bone_keys = {}
+        # object: keys of the object and its bones
+        self.object_keys = {}
+        # parent key: [child key]
+        self.children = {}
+
+    def add(self, key, value):
+        self[key] = value
+        (node_type, name, parent_key, ob_parent, ob) = value
+        self.node_keys.setdefault(ob, key)
+        self.name_keys.setdefault(name, key)
+        if node_type == 'EMPTY':
+            self.empty_keys.setdefault(name, key)
+        elif node_type == 'ARMATURE':
+            self.armature_keys.setdefault(name, key)
+            self.bone_keys.setdefault(key, {})
+        elif node_type == 'BONE':
+            # bones are added right after their armature, with the armature key as parent key
+            self.bone_keys.setdefault(parent_key, {}).setdefault(name, key)
+        self.object_keys.setdefault(ob if ob_parent == None else ob_parent, []).append(key)
+        self.children.setdefault(parent_key, []).append(key)
+
+    def set_parent(self, key, parent_key):
+        value = self[key]
+        if value[2] == parent_key:
+            return
+        self.children[value[2]].remove(key)
+        self.children.setdefault(parent_key, []).append(key)
+        value[2] = parent_key
+
+    def get_children(self, key):
+        return self.children.get(key, [])
+
+    def get_object_keys(self, ob):
+        return self.object_keys.get(ob, [])
+
+
 def fix_parent_for_rigify_bones(hierarchy_dic):
     # try setting parent for each bone in hierarchy
     for (key, value) in hierarchy_dic.items():
         # fix parent for bone
         if value[0] == 'BONE':
             ob = value[-1]
+            bone_keys = hierarchy_dic.bone_keys[hierarchy_dic.node_keys[value[-2]]]
             parent_node = ob.parent
-            found = False
             while parent_node != None:
                 parent_name = parent_node.name
                 # fix parent name to match deform bone
@@ -322,31 +537,22 @@ def fix_parent_for_rigify_bones(hierarchy_dic):
                     parent_name = "DEF-{}".format(parent_name[4:])
                 # ignore itself
                 if value[1] != parent_name:
-                    for (key2, value2) in hierarchy_dic.items():
-                        if value2[1] == parent_name:
-                            hierarchy_dic[key][2] = key2
-                            found = True
-                            break
-                    if found:
+                    # prefer the bone of the same armature over any other node with the name
+                    if parent_name in bone_keys:
+                        hierarchy_dic.set_parent(key, bone_keys[parent_name])
+                        break
+                    if parent_name in hierarchy_dic.name_keys:
+                        hierarchy_dic.set_parent(key, hierarchy_dic.name_keys[parent_name])
                         break
                 parent_node = parent_node.parent
 
 
 def get_hierarchy_key_from_empty_name(hierarchy_dic, empty_name):
-    for (key, value) in hierarchy_dic.items():
-        if value[0] == 'EMPTY' and value[1] == empty_name:
-            return key
-    return None
+    return hierarchy_dic.empty_keys.get(empty_name)
 
 
 def get_hierarchy_key_from_armature_key_and_bone_name(hierarchy_dic, armature_key, bone_name):
-    for (key, value) in hierarchy_dic.items():
-        if value[0] == 'BONE':
-            tokens = key.split(".")
-            if len(tokens) == 2 and tokens[0] == armature_key:
-                if value[1] == bone_name:
-                    return key
-    return armature_key
+    return hierarchy_dic.bone_keys.get(armature_key, {}).get(bone_name, armature_key)
 
 
 def make_hierarchy_dic(hierarchy_dic, use_only_deform_bones, use_rigify_armature, use_rigify_root_bone, use_only_selected_deform_bones, block_list, context_objects):
@@ -355,7 +561,7 @@ def make_hierarchy_dic(hierarchy_dic, use_only_deform_bones, use_rigify_armature
             # ignore mesh with zero polygons
             if ob.type == 'MESH' and len(ob.data.polygons) == 0:
                 continue
-            hierarchy_dic[str(index)] = ['LIGHT' if ob.type == 'LAMP' or ob.type == 'LIGHT' else ob.type, ob.name, str(-1), None, ob]
+            hierarchy_dic.add(str(index), ['LIGHT' if ob.type == 'LAMP' or ob.type == 'LIGHT' else ob.type, ob.name, str(-1), None, ob])
             # add bones of the armature
             if ob.type == 'ARMATURE':
                 for (index2, bone) in enumerate(ob.data.bones):
@@ -364,7 +570,7 @@ def make_hierarchy_dic(hierarchy_dic, use_only_deform_bones, use_rigify_armature
                         (bone.use_deform and use_only_selected_deform_bones and bone.select) or \
                         (use_rigify_armature and use_rigify_root_bone and bone.name == "root"):
                         # ip like identifier
-                        hierarchy_dic[".".join([str(index), str(index2)])] = ["BONE", bone.name, str(index), ob, bone]
+                        hierarchy_dic.add(".".join([str(index), str(index2)]), ["BONE", bone.name, str(index), ob, bone])
                     # add to block list
                     if use_only_deform_bones and bone.use_deform and use_only_selected_deform_bones and not bone.select:
                         block_list.append((ob.name, bone.name))
@@ -372,18 +578,14 @@ def make_hierarchy_dic(hierarchy_dic, use_only_deform_bones, use_rigify_armature
     for (key, value) in hierarchy_dic.items():
         ob = value[-1]
         parent_node = ob.parent
-        found = False
         while parent_node != None:
-            for (key2, value2) in hierarchy_dic.items():
-                if value2[-1] == parent_node:
-                    # object attach to bone
-                    if value[0] != 'BONE' and ob.parent_bone != "" and ob.parent_type == 'BONE':
-                        hierarchy_dic[key][2] = get_hierarchy_key_from_armature_key_and_bone_name(hierarchy_dic, key2, ob.parent_bone)
-                    else:
-                        hierarchy_dic[key][2] = key2
-                    found = True
-                    break
-            if found:
+            if parent_node in hierarchy_dic.node_keys:
+                key2 = hierarchy_dic.node_keys[parent_node]
+                # object attach to bone
+                if value[0] != 'BONE' and ob.parent_bone != "" and ob.parent_type == 'BONE':
+                    hierarchy_dic.set_parent(key, get_hierarchy_key_from_armature_key_and_bone_name(hierarchy_dic, key2, ob.parent_bone))
+                else:
+                    hierarchy_dic.set_parent(key, key2)
                 break
             parent_node = parent_node.parent
     # fix parents for Rigify armature
@@ -425,9 +627,9 @@ def make_vertex_dic(vertex_dic, ob, exist_object_dic):
         # make vertex dic
         index = len(vertex_dic)
         length = len(ob.data.vertices)
-        vertex_dic[index] = [None] * length
-        for (i, vertex) in enumerate(ob.data.vertices):
-            vertex_dic[index][i] = (vertex.co[0], vertex.co[1], vertex.co[2])
+        co = np.empty(length * 3, dtype=np.float32)
+        ob.data.vertices.foreach_get("co", co)
+        vertex_dic[index] = co.reshape(length, 3)
         exist_object_dic[keyword] = index
     return index
 
@@ -488,52 +690,107 @@ def make_custom_property_dic(custom_property_dic, ob, exist_object_dic):
     return index
 
 
-def make_vertex_animation_dic(vertex_animation_dic, ob, exist_object_dic, use_vertex_space, my_vertex_frame_start, my_vertex_frame_end):
+def make_vertex_animation_dic(vertex_animation_dic, ob, exist_object_dic, use_vertex_space, my_vertex_frame_start, my_vertex_frame_end, use_isolated_evaluation):
     keyword = ('VertexPoseKey', ob.data.vertices)
     if keyword in exist_object_dic:
         index = exist_object_dic[keyword]
     else:
-        # make vertex animation dic
+        # make vertex animation dic, (frames, vertex count per frame, position file path, normal file path)
+        # every frame goes to the point cache files as soon as it is evaluated, so only one frame is kept in memory
         index = len(vertex_animation_dic)
-        vertex_animation_dic[index] = []
+        spill_path = os.path.join(os.path.dirname(__file__), "data", uuid.uuid4().hex)
+        frames = []
+        counts = []
+        vertex_animation_dic[index] = (frames, counts, spill_path + "-positions.pc2", spill_path + "-normals.pc2")
         # we use the user defined range to avoid too many data exported
         (action_start, action_end) = (my_vertex_frame_start, my_vertex_frame_end)
-        for frame in range(action_start, action_end+1):
-            bpy.context.scene.frame_set(frame)
-            if bpy.app.version < (2, 80):
-                bpy.context.scene.update()
-            else:
-                bpy.context.view_layer.update()
-            if bpy.app.version < (2, 80):
-                me = ob.to_mesh(bpy.context.scene, apply_modifiers=True, settings='PREVIEW')
-            else:
-                depsgraph = bpy.context.evaluated_depsgraph_get()
-                ob_eval = ob.evaluated_get(depsgraph)
-                me = ob_eval.to_mesh()
-            #me.calc_normals()
-            vertex_matrix = ob.matrix_world
-            normal_matrix = ob.matrix_world.inverted().transposed()
-            length = len(me.vertices)
-            vertex_animation_dic[index].append([])
-            vertex_animation_dic[index][-1].append(frame)
-            vertex_animation_dic[index][-1].append([None] * length)
-            for (i, vertex) in enumerate(me.vertices):
-                if bpy.app.version < (2, 80):
-                    position = vertex.co if use_vertex_space == "local" else vertex_matrix * vertex.co
-                    normal = vertex.normal if use_vertex_space == "local" else normal_matrix * vertex.normal
-                else:
-                    position = vertex.co if use_vertex_space == "local" else vertex_matrix @ vertex.co
-                    normal = vertex.normal if use_vertex_space == "local" else normal_matrix @ vertex.normal
-                vertex_animation_dic[index][-1][-1][i] = [position[0], position[1], position[2], normal[0], normal[1], normal[2]]
-            if bpy.app.version < (2, 80):
-                pass
-            else:
-                ob_eval.to_mesh_clear()
+        try:
+            with open(vertex_animation_dic[index][2], 'wb') as position_file, open(vertex_animation_dic[index][3], 'wb') as normal_file, isolate_evaluation(bpy.context, [ob], use_isolated_evaluation):
+                # the header is rewritten when the sample count is known
+                intermediate.write_pc2_header(position_file, 0, action_start, 0)
+                intermediate.write_pc2_header(normal_file, 0, action_start, 0)
+                for frame in range(action_start, action_end+1):
+                    bpy.context.scene.frame_set(frame)
+                    if bpy.app.version < (2, 80):
+                        bpy.context.scene.update()
+                    else:
+                        bpy.context.view_layer.update()
+                    if bpy.app.version < (2, 80):
+                        me = ob.to_mesh(bpy.context.scene, apply_modifiers=True, settings='PREVIEW')
+                    else:
+                        depsgraph = bpy.context.evaluated_depsgraph_get()
+                        ob_eval = ob.evaluated_get(depsgraph)
+                        me = ob_eval.to_mesh()
+                    #me.calc_normals()
+                    length = len(me.vertices)
+                    positions = np.empty(length * 3, dtype=np.float32)
+                    normals = np.empty(length * 3, dtype=np.float32)
+                    me.vertices.foreach_get("co", positions)
+                    me.vertices.foreach_get("normal", normals)
+                    positions = positions.reshape(length, 3)
+                    normals = normals.reshape(length, 3)
+                    if use_vertex_space != "local":
+                        # the 4th component of the vectors is 1.0, as in mathutils
+                        vertex_matrix = np.array(ob.matrix_world, dtype=np.float64)
+                        normal_matrix = np.array(ob.matrix_world.inverted().transposed(), dtype=np.float64)
+                        positions = (positions @ vertex_matrix[:3, :3].T + vertex_matrix[:3, 3]).astype(np.float32)
+                        normals = (normals @ normal_matrix[:3, :3].T + normal_matrix[:3, 3]).astype(np.float32)
+                    position_file.write(positions.astype('<f4').tobytes())
+                    normal_file.write(normals.astype('<f4').tobytes())
+                    frames.append(frame)
+                    counts.append(length)
+                    if bpy.app.version < (2, 80):
+                        pass
+                    else:
+                        ob_eval.to_mesh_clear()
+                # the files are valid point caches as long as the vertex count does not change
+                for f in (position_file, normal_file):
+                    f.seek(0)
+                    intermediate.write_pc2_header(f, counts[0] if len(counts) > 0 else 0, action_start, len(frames))
+        except BaseException:
+            # the entry is incomplete, remove its point cache files before the error goes on
+            for path in vertex_animation_dic.pop(index)[2:]:
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
         exist_object_dic[keyword] = index
     return index
 
 
-def make_shape_dic(shape_dic, ob, exist_object_dic):
+# yield (frame, positions and normals of the frame as a (vertex x 6) array) from the point cache files, one frame at a time
+def iter_vertex_animation_frames(vertex_animation):
+    (frames, counts, position_path, normal_path) = vertex_animation
+    header_size = struct.calcsize(intermediate.PC2_HEADER_FORMAT)
+    with open(position_path, 'rb') as position_file, open(normal_path, 'rb') as normal_file:
+        position_file.seek(header_size)
+        normal_file.seek(header_size)
+        for (frame, count) in zip(frames, counts):
+            positions = np.fromfile(position_file, dtype='<f4', count=count * 3).reshape(count, 3)
+            normals = np.fromfile(normal_file, dtype='<f4', count=count * 3).reshape(count, 3)
+            yield (frame, np.hstack((positions, normals)))
+
+
+def remove_vertex_animation_dic(vertex_animation_dic):
+    for (frames, counts, position_path, normal_path) in vertex_animation_dic.values():
+        for path in (position_path, normal_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+# mathutils treats two vectors as equal if every component differs by at most FLT_EPSILON or by at most 1 ulp
+def get_changed_vertices(co, basis_co, my_shape_key_threshold):
+    difference = np.abs(co - basis_co)
+    bits = co.view(np.int32).astype(np.int64)
+    basis_bits = basis_co.view(np.int32).astype(np.int64)
+    equal = (difference <= np.finfo(np.float32).eps) | (((bits < 0) == (basis_bits < 0)) & (np.abs(bits - basis_bits) <= 1))
+    changed = ~equal
+    # ignore float noise below the user defined threshold
+    if my_shape_key_threshold > 0.0:
+        changed &= difference > my_shape_key_threshold
+    return np.flatnonzero(changed.any(axis=1)).astype(np.int32)
+
+
+def make_shape_dic(shape_dic, ob, exist_object_dic, my_shape_key_threshold):
     keyword = ('Shape', ob.data.vertices)
     if keyword in exist_object_dic:
         name_index_pairs = exist_object_dic[keyword]
@@ -543,28 +800,58 @@ def make_shape_dic(shape_dic, ob, exist_object_dic):
         if ob.data.shape_keys != None:
             # we only export relative shape keys
             if ob.data.shape_keys.use_relative == True:
-                bm = bmesh.new()
-                bm.from_mesh(ob.data)
-                # we assume that the first shape is the basis shape
-                basis = bm.verts.layers.shape.values()[0]
-                for (i, layer) in enumerate(bm.verts.layers.shape.values()):
-                    # ignore the basis shape
-                    if i != 0:
-                        index = len(shape_dic)
-                        shape_dic[index] = []
-                        for (j, vertex) in enumerate(bm.verts):
-                            if vertex[layer] != vertex[basis]:
-                                shape_dic[index].append(j)
-                                shape_dic[index].append(vertex[layer].x)
-                                shape_dic[index].append(vertex[layer].y)
-                                shape_dic[index].append(vertex[layer].z)
-                        name_index_pairs.append((layer.name, index))
-                bm.free  # free and prevent further access
+                length = len(ob.data.vertices)
+                basis_co = None
+                co = np.empty(length * 3, dtype=np.float32)
+                for (i, block) in enumerate(ob.data.shape_keys.key_blocks):
+                    block.data.foreach_get("co", co)
+                    # we assume that the first shape is the basis shape
+                    if i == 0:
+                        basis_co = co.reshape(length, 3).copy()
+                        continue
+                    # store the absolute positions of the changed vertices
+                    indices = get_changed_vertices(co.reshape(length, 3), basis_co, my_shape_key_threshold)
+                    index = len(shape_dic)
+                    shape_dic[index] = (indices, co.reshape(length, 3)[indices])
+                    name_index_pairs.append((block.name, index))
         exist_object_dic[keyword] = name_index_pairs
     return name_index_pairs
 
 
-def make_shape_key_dic(context, hierarchy_dic, shape_key_dic, ob, my_animation_offset, my_animation_type, exist_object_dic):
+# evaluate the action on every shape key channel, return a (frame x channel) array, the basis channel is ignored
+def sample_shape_key_action(shape_keys, action, frames):
+    # resolve the fcurve of every channel once instead of once per frame
+    fcurves = {}
+    for fcurve in action.fcurves:
+        if fcurve.array_index == 0 and fcurve.data_path not in fcurves:
+            fcurves[fcurve.data_path] = fcurve
+    key_blocks = shape_keys.key_blocks.values()[1:]
+    values = np.zeros((len(frames), len(key_blocks)), dtype=np.float64)
+    for (i, block) in enumerate(key_blocks):
+        fcurve = fcurves.get(block.path_from_id("value"))
+        # channels without fcurve stay 0.0
+        if fcurve != None:
+            evaluate = fcurve.evaluate
+            values[:, i] = [evaluate(frame) for frame in frames]
+    return values
+
+
+# bake the shape key values frame by frame, return a (frame x channel) array, the basis channel is ignored
+def sample_shape_key_drivers(context, shape_keys, frames):
+    key_blocks = shape_keys.key_blocks
+    values = np.zeros((len(frames), len(key_blocks)), dtype=np.float32)
+    for (i, frame) in enumerate(frames):
+        # set frame
+        context.scene.frame_set(frame)
+        if bpy.app.version < (2, 80):
+            bpy.context.scene.update()
+        else:
+            bpy.context.view_layer.update()
+        key_blocks.foreach_get("value", values[i])
+    return values[:, 1:]
+
+
+def make_shape_key_dic(context, hierarchy_dic, shape_key_dic, ob, my_animation_offset, my_animation_type, exist_object_dic, use_isolated_evaluation):
     shape_key_data = None
     if ob.data.shape_keys != None:
         if ob.data.shape_keys.animation_data != None:
@@ -578,59 +865,104 @@ def make_shape_key_dic(context, hierarchy_dic, shape_key_dic, ob, my_animation_o
     else:
         action_name = None
         index = None
-        # make shape key dic
+        # make shape key dic, (frames, channel values per frame)
         if ob.data.shape_keys != None:
             if ob.data.shape_keys.animation_data != None:
                 if ob.data.shape_keys.animation_data.action != None:
+                    action = ob.data.shape_keys.animation_data.action
                     index = len(shape_key_dic)
-                    shape_key_dic[index] = []
-                    action_name = ob.data.shape_keys.animation_data.action.name
-                    (action_start, action_end) = [int(x) for x in ob.data.shape_keys.animation_data.action.frame_range]
-                    for frame in range(action_start, action_end+1):
-                        values = []
-                        for (i, block) in enumerate(ob.data.shape_keys.key_blocks.values()):
-                            # ignore Basic channel
-                            if i > 0:
-                                fcurve = ob.data.shape_keys.animation_data.action.fcurves.find(data_path=block.path_from_id("value"))
-                                if fcurve == None:
-                                    values.append(0.0)
-                                else:
-                                    values.append(fcurve.evaluate(frame))
-                        shape_key_dic[index].append([])
-                        shape_key_dic[index][-1].append(frame + my_animation_offset)
-                        for i in range(len(values)):
-                            # ignore Basic channel
-                            shape_key_dic[index][-1].append(i+1)
-                            shape_key_dic[index][-1].append(values[i])
+                    action_name = action.name
+                    (action_start, action_end) = [int(x) for x in action.frame_range]
+                    frames = range(action_start, action_end+1)
+                    values = sample_shape_key_action(ob.data.shape_keys, action, frames)
+                    shape_key_dic[index] = (np.arange(action_start, action_end+1) + my_animation_offset, values)
                 elif ob.data.shape_keys.animation_data.drivers != None:
                     (action_start, action_end) = get_pose_key_range(context, hierarchy_dic, my_animation_type)
                     # exists any pose key
                     if action_start != None and action_end != None:
                         index = len(shape_key_dic)
-                        shape_key_dic[index] = []
                         action_name = "baked shape key"
-                        for frame in range(action_start, action_end+1):
-                            # set frame
-                            context.scene.frame_set(frame)
-                            if bpy.app.version < (2, 80):
-                                bpy.context.scene.update()
-                            else:
-                                bpy.context.view_layer.update()
-                            values = []
-                            for (i, block) in enumerate(ob.data.shape_keys.key_blocks.values()):
-                                # ignore Basic channel
-                                if i > 0:
-                                    values.append(block.value)
-                            shape_key_dic[index].append([])
-                            shape_key_dic[index][-1].append(frame + my_animation_offset)
-                            for i in range(len(values)):
-                                # ignore Basic channel
-                                shape_key_dic[index][-1].append(i+1)
-                                shape_key_dic[index][-1].append(values[i])
+                        frames = range(action_start, action_end+1)
+                        with isolate_evaluation(context, [ob], use_isolated_evaluation):
+                            values = sample_shape_key_drivers(context, ob.data.shape_keys, frames)
+                        shape_key_dic[index] = (np.arange(action_start, action_end+1) + my_animation_offset, values)
         exist_object_dic[keyword] = (action_name, index)
     return (action_name, index)
 
 
+# map every vertex group of the object to its weight slots, a slot is an (armature key, bone key) pair
+# a vertex group adds its weight to the bones it is merged into by the block list, then to its own bone
+# return ([slot indices per vertex group index], [bone key per slot])
+def make_group_slot_table(ob, bone_dictionary, block_dictionary):
+    # we support multiple armatures
+    armature_names = []
+    for mod in ob.modifiers:
+        if type(mod) == bpy.types.ArmatureModifier:
+            # ignore empty modifiers
+            if mod.object != None:
+                armature_names.append(mod.object.name)
+    slot_dictionary = {}
+    group_slots = []
+    for group in ob.vertex_groups:
+        group_name = group.name
+        armature_key = None
+        bone_key = None
+        slot_keys = []
+        for armature_name in armature_names:
+            # merge vertex weights if the vertex group is in block list
+            block = (armature_name, group_name)
+            if block in block_dictionary:
+                slot_keys.append(block_dictionary[block])
+            elif armature_name in bone_dictionary:
+                temp_armature_key = bone_dictionary[armature_name][0]
+                if group_name in bone_dictionary[armature_name][1]:
+                    armature_key = temp_armature_key
+                    bone_key = bone_dictionary[armature_name][1][group_name]
+        if armature_key != None and bone_key != None:
+            slot_keys.append((armature_key, bone_key))
+        group_slots.append([slot_dictionary.setdefault(slot_key, len(slot_dictionary)) for slot_key in slot_keys])
+    bone_keys = [None] * len(slot_dictionary)
+    for ((armature_key, bone_key), slot) in slot_dictionary.items():
+        bone_keys[slot] = bone_key
+    return (group_slots, bone_keys)
+
+
+# return (offsets, slots, weights, bone keys), the weights of vertex i are weights[offsets[i]:offsets[i + 1]] on bone_keys[slots[...]]
+# the slots of a vertex keep the order they first appear in, weights of the same slot are summed in order
+def make_sparse_weights(ob, group_slots, bone_keys):
+    length = len(ob.data.vertices)
+    slot_count = len(bone_keys)
+    elements = [(vertex.index, group.group, group.weight) for vertex in ob.data.vertices for group in vertex.groups if group.group < len(group_slots)]
+    if slot_count == 0 or len(elements) == 0:
+        return (np.zeros(length + 1, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64), bone_keys)
+    element_array = np.array(elements, dtype=np.float64)
+    element_vertices = element_array[:, 0].astype(np.int64)
+    element_groups = element_array[:, 1].astype(np.int64)
+    element_weights = element_array[:, 2]
+    # group index to slot range lookup table
+    slot_counts = np.array([len(slots) for slots in group_slots], dtype=np.int64)
+    slot_offsets = np.zeros(len(group_slots) + 1, dtype=np.int64)
+    np.cumsum(slot_counts, out=slot_offsets[1:])
+    slot_table = np.array([slot for slots in group_slots for slot in slots], dtype=np.int64)
+    # expand every element to the slots of its group
+    counts = slot_counts[element_groups]
+    total = int(counts.sum())
+    starts = np.zeros(len(counts), dtype=np.int64)
+    np.cumsum(counts[:-1], out=starts[1:])
+    slots = slot_table[np.repeat(slot_offsets[element_groups] - starts, counts) + np.arange(total, dtype=np.int64)]
+    vertices = np.repeat(element_vertices, counts)
+    weights = np.repeat(element_weights, counts)
+    # merge the weights of the same vertex and slot
+    (unique_keys, first_indices, inverse) = np.unique(vertices * slot_count + slots, return_index=True, return_inverse=True)
+    sums = np.zeros(len(unique_keys), dtype=np.float64)
+    np.add.at(sums, inverse.ravel(), weights)
+    order = np.argsort(first_indices, kind='stable')
+    unique_keys = unique_keys[order]
+    offsets = np.zeros(length + 1, dtype=np.int64)
+    np.cumsum(np.bincount(unique_keys // slot_count, minlength=length), out=offsets[1:])
+    return (offsets, unique_keys % slot_count, sums[order], bone_keys)
+
+
 def make_weight_dic(hierarchy_dic, weight_dic, ob, exist_object_dic, bone_dictionary, block_dictionary):
     keyword = ('Weight', ob.data.vertices)
     if keyword in exist_object_dic:
@@ -648,71 +980,36 @@ def make_weight_dic(hierarchy_dic, weight_dic, ob, exist_object_dic, bone_dictio
         if bound_to_any_armature:
             if len(ob.vertex_groups) > 0:
                 index = len(weight_dic)
-                length = len(ob.data.vertices)
-                weight_dic[index] = [None] * length
-                for (i, vertex) in enumerate(ob.data.vertices):
-                    temp_list = []
-                    for group in vertex.groups:
-                        group_index = group.group
-                        group_weight = group.weight
-                        group_name = ob.vertex_groups[group_index].name
-                        # search in dictionary
-                        armature_key = None
-                        bone_key = None
-                        # we support multiple armatures
-                        for mod in ob.modifiers:
-                            if type(mod) == bpy.types.ArmatureModifier:
-                                # ignore empty modifiers
-                                if mod.object != None:
-                                    armature_name = mod.object.name
-                                    # merge vertex weights if the vertex group is in block list
-                                    block = (armature_name, group_name)
-                                    if block in block_dictionary:
-                                        merged = False
-                                        # linear search in current vertex's weight list
-                                        for item in temp_list:
-                                            # vertex weight already exists
-                                            if block_dictionary[block][0] == item[0] and block_dictionary[block][1] == item[1]:
-                                                item[2] += group_weight
-                                                merged = True
-                                                break
-                                        # vertex weight not exists
-                                        if not merged:
-                                            temp_list.append([block_dictionary[block][0], block_dictionary[block][1], group_weight])
-                                    elif armature_name in bone_dictionary:
-                                        temp_armature_key = bone_dictionary[armature_name][0]
-                                        if group_name in bone_dictionary[armature_name][1]:
-                                            armature_key = temp_armature_key
-                                            bone_key = bone_dictionary[armature_name][1][group_name]
-                        # vertex has weight
-                        if armature_key != None and bone_key != None:
-                            merged = False
-                            # linear search in current vertex's weight list
-                            for item in temp_list:
-                                # vertex weight already exists
-                                if armature_key == item[0] and bone_key == item[1]:
-                                    item[2] += group_weight
-                                    merged = True
-                                    break
-                            # vertex weight not exists
-                            if not merged:
-                                temp_list.append([armature_key, bone_key, group_weight])
-                    # save to weight dic
-                    weight_dic[index][i] = []
-                    for item in temp_list:
-                        weight_dic[index][i].append([item[1], item[2]])
+                (group_slots, bone_keys) = make_group_slot_table(ob, bone_dictionary, block_dictionary)
+                weight_dic[index] = make_sparse_weights(ob, group_slots, bone_keys)
         exist_object_dic[keyword] = index
     return index
 
 
+# return (offsets, loop indices) of the polygons, the loops of polygon i are loop_indices[offsets[i]:offsets[i + 1]]
+def get_polygon_loops(me):
+    length = len(me.polygons)
+    loop_starts = np.empty(length, dtype=np.int32)
+    loop_totals = np.empty(length, dtype=np.int32)
+    me.polygons.foreach_get("loop_start", loop_starts)
+    me.polygons.foreach_get("loop_total", loop_totals)
+    offsets = np.zeros(length + 1, dtype=np.int32)
+    np.cumsum(loop_totals, out=offsets[1:])
+    loop_indices = np.arange(offsets[-1], dtype=np.int32)
+    # loops are usually stored polygon by polygon
+    if not np.array_equal(loop_starts, offsets[:-1]):
+        loop_indices += np.repeat(loop_starts - offsets[:-1], loop_totals)
+    return (offsets, loop_indices)
+
+
 def make_polygon_dic(polygon_dic, ob, exist_object_dic):
     if ob.data.polygons in exist_object_dic:
         return exist_object_dic[ob.data.polygons]
     index = len(polygon_dic)
-    length = len(ob.data.polygons)
-    polygon_dic[index] = [None] * length
-    for (i, polygon) in enumerate(ob.data.polygons):
-        polygon_dic[index][i] = [ob.data.loops[loop_index].vertex_index for loop_index in polygon.loop_indices]
+    (offsets, loop_indices) = get_polygon_loops(ob.data)
+    vertex_indices = np.empty(len(ob.data.loops), dtype=np.int32)
+    ob.data.loops.foreach_get("vertex_index", vertex_indices)
+    polygon_dic[index] = (offsets, vertex_indices[loop_indices])
     exist_object_dic[ob.data.polygons] = (ob.name, index)
     return (ob.name, index)
 
@@ -724,16 +1021,13 @@ def make_uv_dic(uv_dic, ob, exist_object_dic):
     else:
         # make uv dic
         name_index_pairs = []
-        bm = bmesh.new()
-        bm.from_mesh(ob.data)
-        for layer in bm.loops.layers.uv.values():
+        (offsets, loop_indices) = get_polygon_loops(ob.data)
+        for layer in ob.data.uv_layers:
             index = len(uv_dic)
-            length = len(ob.data.polygons)
-            uv_dic[index] = [None] * length
-            for (i, face) in enumerate(bm.faces):
-                uv_dic[index][i] = [(loop[layer].uv[0], loop[layer].uv[1]) for loop in face.loops]
+            uvs = np.empty(len(ob.data.loops) * 2, dtype=np.float32)
+            layer.data.foreach_get("uv", uvs)
+            uv_dic[index] = (offsets, uvs.reshape(-1, 2)[loop_indices])
             name_index_pairs.append((layer.name, index))
-        bm.free  # free and prevent further access
         exist_object_dic[keyword] = name_index_pairs
     return name_index_pairs
 
@@ -743,12 +1037,12 @@ def make_normal_dic(normal_dic, ob, exist_object_dic):
     if keyword in exist_object_dic:
         return exist_object_dic[keyword]
     index = len(normal_dic)
-    length = len(ob.data.polygons)
-    normal_dic[index] = [None] * length
+    (offsets, loop_indices) = get_polygon_loops(ob.data)
+    normals = np.empty(len(ob.data.loops) * 3, dtype=np.float32)
     # generate polygon loop normals
     ob.data.calc_normals_split()
-    for (i, polygon) in enumerate(ob.data.polygons):
-        normal_dic[index][i] = [tuple(ob.data.loops[loop_index].normal) for loop_index in polygon.loop_indices]
+    ob.data.loops.foreach_get("normal", normals)
+    normal_dic[index] = (offsets, normals.reshape(-1, 3)[loop_indices])
     # free polygon loop normals
     ob.data.free_normals_split()
     exist_object_dic[keyword] = index
@@ -761,9 +1055,8 @@ def make_polygon_material_dic(polygon_material_dic, ob, exist_object_dic):
         return exist_object_dic[keyword]
     index = len(polygon_material_dic)
     length = len(ob.data.polygons)
-    polygon_material_dic[index] = [None] * length
-    for (i, polygon) in enumerate(ob.data.polygons):
-        polygon_material_dic[index][i] = polygon.material_index
+    polygon_material_dic[index] = np.empty(length, dtype=np.int32)
+    ob.data.polygons.foreach_get("material_index", polygon_material_dic[index])
     exist_object_dic[keyword] = index
     return index
 
@@ -773,21 +1066,19 @@ def make_color_dic(color_dic, ob, exist_object_dic):
     if keyword in exist_object_dic:
         name_index_pairs = exist_object_dic[keyword]
     else:
-        # make uv dic
+        # make color dic
         name_index_pairs = []
-        bm = bmesh.new()
-        bm.from_mesh(ob.data)
-        for layer in bm.loops.layers.color.values():
+        (offsets, loop_indices) = get_polygon_loops(ob.data)
+        for layer in ob.data.vertex_colors:
             index = len(color_dic)
-            length = len(ob.data.polygons)
-            color_dic[index] = [None] * length
-            for (i, face) in enumerate(bm.faces):
-                if bpy.app.version < (2, 80):
-                    color_dic[index][i] = [(loop[layer][0], loop[layer][1], loop[layer][2], 1.0) for loop in face.loops]
-                else:
-                    color_dic[index][i] = [(loop[layer][0], loop[layer][1], loop[layer][2], loop[layer][3]) for loop in face.loops]
+            colors = np.ones((len(ob.data.loops), 4), dtype=np.float32)
+            # blender 2.7x colors have no alpha
+            width = 3 if bpy.app.version < (2, 80) else 4
+            layer_colors = np.empty(len(ob.data.loops) * width, dtype=np.float32)
+            layer.data.foreach_get("color", layer_colors)
+            colors[:, :width] = layer_colors.reshape(-1, width)
+            color_dic[index] = (offsets, colors[loop_indices])
             name_index_pairs.append((layer.name, index))
-        bm.free  # free and prevent further access
         exist_object_dic[keyword] = name_index_pairs
     return name_index_pairs
 
@@ -1047,35 +1338,22 @@ def make_ik_dic(hierarchy_dic, ik_dic, ob, exist_object_dic):
 def make_block_dictionary(hierarchy_dic, bone_dictionary, block_list, use_rigify_armature):
     block_dictionary = {}
     for block in block_list:
-        for (key, value) in hierarchy_dic.items():
-            if value[0] == 'ARMATURE':
-                armature_key = key
-                armature_name = value[1]
-                # armature matched
-                if armature_name == block[0]:
-                    ob = value[-1]
-                    # search valid deform bone recusively in bone list
-                    parent_node = ob.data.bones[block[1]].parent
-                    found = False
-                    while parent_node != None:
-                        parent_name = parent_node.name
-                        # fix parent name to match deform bone
-                        if use_rigify_armature:
-                            if parent_name.startswith("ORG-") or parent_name.startswith("MCH-"):
-                                parent_name = "DEF-{}".format(parent_name[4:])
-                        for (key2, value2) in hierarchy_dic.items():
-                            if value2[0] == 'BONE':
-                                tokens = key2.split(".")
-                                if len(tokens) == 2 and tokens[0] == armature_key:
-                                    bone_key = key2
-                                    bone_name = value2[1]
-                                    if bone_name == parent_name:
-                                        block_dictionary[block] = (armature_key, bone_key)
-                                        found = True
-                                        break
-                        if found == True:
-                            break
-                        parent_node = parent_node.parent
+        # armature matched
+        if block[0] in bone_dictionary:
+            (armature_key, dictionary) = bone_dictionary[block[0]]
+            ob = hierarchy_dic[armature_key][-1]
+            # search valid deform bone recusively in bone list
+            parent_node = ob.data.bones[block[1]].parent
+            while parent_node != None:
+                parent_name = parent_node.name
+                # fix parent name to match deform bone
+                if use_rigify_armature:
+                    if parent_name.startswith("ORG-") or parent_name.startswith("MCH-"):
+                        parent_name = "DEF-{}".format(parent_name[4:])
+                if parent_name in dictionary:
+                    block_dictionary[block] = (armature_key, dictionary[parent_name])
+                    break
+                parent_node = parent_node.parent
     return block_dictionary
 
 
@@ -1083,23 +1361,12 @@ def make_block_dictionary(hierarchy_dic, bone_dictionary, block_list, use_rigify
 # we use the dictionary to get armature key and bone key by armature name and bone name
 def make_bone_dictionary(hierarchy_dic):
     bone_dictionary = {}
-    for (key, value) in hierarchy_dic.items():
-        if value[0] == 'ARMATURE':
-            armature_key = key
-            armature_name = value[1]
-            dictionary = {}
-            for (key2, value2) in hierarchy_dic.items():
-                if value2[0] == 'BONE':
-                    tokens = key2.split(".")
-                    if len(tokens) == 2 and tokens[0] == armature_key:
-                        bone_key = key2
-                        bone_name = value2[1]
-                        dictionary[bone_name] = bone_key
-            bone_dictionary[armature_name] = (armature_key, dictionary)
+    for (armature_name, armature_key) in hierarchy_dic.armature_keys.items():
+        bone_dictionary[armature_name] = (armature_key, dict(hierarchy_dic.bone_keys[armature_key]))
     return bone_dictionary
 
 
-def make_generic_node_dic(context, hierarchy_dic, node_dic, default_pose_dic, bind_pose_dic, vertex_dic, weight_dic, shape_dic, shape_key_dic, polygon_dic, uv_dic, normal_dic, color_dic, polygon_material_dic, texture_dic, material_dic, mesh_material_dic, exist_object_dic, use_animation, my_animation_offset, my_animation_type, block_list, use_rigify_armature, camera_dic, light_dic, vertex_animation_dic, use_vertex_animation, use_vertex_format, use_vertex_space, my_vertex_frame_start, my_vertex_frame_end, custom_property_dic, edge_crease_dic, use_edge_crease, my_edge_crease_scale, my_edge_smoothing, edge_smoothing_dic, applied_mesh_dic, ik_dic, use_embed_media, use_copy_texture, subdirname, packed_texture_filenames):
+def make_generic_node_dic(context, hierarchy_dic, node_dic, default_pose_dic, bind_pose_dic, vertex_dic, weight_dic, shape_dic, shape_key_dic, polygon_dic, uv_dic, normal_dic, color_dic, polygon_material_dic, texture_dic, material_dic, mesh_material_dic, exist_object_dic, use_animation, my_animation_offset, my_animation_type, block_list, use_rigify_armature, camera_dic, light_dic, vertex_animation_dic, use_vertex_animation, use_vertex_format, use_vertex_space, my_vertex_frame_start, my_vertex_frame_end, custom_property_dic, edge_crease_dic, use_edge_crease, my_edge_crease_scale, my_edge_smoothing, edge_smoothing_dic, applied_mesh_dic, ik_dic, use_embed_media, use_copy_texture, subdirname, packed_texture_filenames, my_shape_key_threshold, use_isolated_evaluation):
     bone_dictionary = make_bone_dictionary(hierarchy_dic)
     block_dictionary = make_block_dictionary(hierarchy_dic, bone_dictionary, block_list, use_rigify_armature)
     # make material dic in the first pass, for we need it in the second pass
@@ -1130,11 +1397,11 @@ def make_generic_node_dic(context, hierarchy_dic, node_dic, default_pose_dic, bi
             if index != None:
                 make_node(node_dic, key, 'Weight', '', index)
             if use_vertex_animation:
-                index = make_vertex_animation_dic(vertex_animation_dic, ob, exist_object_dic, use_vertex_space, my_vertex_frame_start, my_vertex_frame_end)
+                index = make_vertex_animation_dic(vertex_animation_dic, ob, exist_object_dic, use_vertex_space, my_vertex_frame_start, my_vertex_frame_end, use_isolated_evaluation)
                 make_node(node_dic, key, 'VertexPoseKey', '', index)
                 make_node(node_dic, key, 'VertexFormat', use_vertex_format, -1)
                 make_node(node_dic, key, 'VertexSpace', use_vertex_space, -1)
-            name_index_pairs = make_shape_dic(shape_dic, ob, exist_object_dic)
+            name_index_pairs = make_shape_dic(shape_dic, ob, exist_object_dic, my_shape_key_threshold)
             for (shape_name, index) in name_index_pairs:
                 make_node(node_dic, key, 'Shape', shape_name, index)
             if not use_vertex_animation and use_animation:
@@ -1148,11 +1415,11 @@ def make_generic_node_dic(context, hierarchy_dic, node_dic, default_pose_dic, bi
                                     ob.data.shape_keys.animation_data.action = action
                                     action_changed = True
                             if action_changed:
-                                (action_name, index) = make_shape_key_dic(context, hierarchy_dic, shape_key_dic, ob, my_animation_offset, my_animation_type, exist_object_dic)
+                                (action_name, index) = make_shape_key_dic(context, hierarchy_dic, shape_key_dic, ob, my_animation_offset, my_animation_type, exist_object_dic, use_isolated_evaluation)
                                 if action_name != None and index != None:
                                     make_node(node_dic, key, 'ShapeKey', action_name, index)
                 else:
-                    (action_name, index) = make_shape_key_dic(context, hierarchy_dic, shape_key_dic, ob, my_animation_offset, my_animation_type, exist_object_dic)
+                    (action_name, index) = make_shape_key_dic(context, hierarchy_dic, shape_key_dic, ob, my_animation_offset, my_animation_type, exist_object_dic, use_isolated_evaluation)
                     if action_name != None and index != None:
                         make_node(node_dic, key, 'ShapeKey', action_name, index)
             (mesh_name, index) = make_polygon_dic(polygon_dic, ob, exist_object_dic)
@@ -1185,10 +1452,7 @@ def make_generic_node_dic(context, hierarchy_dic, node_dic, default_pose_dic, bi
             index = make_light_dic(light_dic, ob, exist_object_dic)
             make_node(node_dic, key, 'Light', '', index)
         elif value[0] == 'BONE':
-            tokens = key.split(".")
-            armature_key = tokens[0]
-            armature_node = hierarchy_dic[armature_key]
-            armature = armature_node[-1]
+            armature = value[-2]
             bone_name = value[1]
             pose_bone = armature.pose.bones[bone_name]
             index = make_ik_dic(hierarchy_dic, ik_dic, pose_bone, exist_object_dic)
@@ -1232,31 +1496,41 @@ def get_nla_frame_range(context, ob):
     return (frame_start, frame_end)
 
 
-def make_pose_key_dic(context, node_dic, key, pose_key_dic, ob_parent, ob, frame_count, frame, frame_index, my_animation_type, my_animation_offset):
-    if frame == 0:
-        index = len(pose_key_dic)
-        if ob_parent == None:
-            if my_animation_type == 'Actions':
-                action_name = ob.animation_data.action.name
-            elif my_animation_type == 'Tracks':
-                action_name = get_nla_track_name(context, ob)
-            else:
-                action_name = ob.animation_data.action.name if not (ob.animation_data.use_nla and len(ob.animation_data.nla_tracks) > 0) else get_nla_track_name(context, ob)
+def make_pose_key_index(context, node_dic, key, pose_key_dic, ob_parent, ob, frame_count, my_animation_type):
+    index = len(pose_key_dic)
+    if ob_parent == None:
+        if my_animation_type == 'Actions':
+            action_name = ob.animation_data.action.name
+        elif my_animation_type == 'Tracks':
+            action_name = get_nla_track_name(context, ob)
         else:
-            if my_animation_type == 'Actions':
-                action_name = ob_parent.animation_data.action.name
-            elif my_animation_type == 'Tracks':
-                action_name = get_nla_track_name(context, ob_parent)
-            else:
-                action_name = ob_parent.animation_data.action.name if not (ob_parent.animation_data.use_nla and len(ob_parent.animation_data.nla_tracks) > 0) else get_nla_track_name(context, ob_parent)
-        pose_key_dic[index] = [None] * frame_count
-        make_node(node_dic, key, 'PoseKey', action_name, index)
+            action_name = ob.animation_data.action.name if not (ob.animation_data.use_nla and len(ob.animation_data.nla_tracks) > 0) else get_nla_track_name(context, ob)
     else:
-        index = node_dic[key]['PoseKey'][-1][1]
+        if my_animation_type == 'Actions':
+            action_name = ob_parent.animation_data.action.name
+        elif my_animation_type == 'Tracks':
+            action_name = get_nla_track_name(context, ob_parent)
+        else:
+            action_name = ob_parent.animation_data.action.name if not (ob_parent.animation_data.use_nla and len(ob_parent.animation_data.nla_tracks) > 0) else get_nla_track_name(context, ob_parent)
+    pose_key_dic[index] = [None] * frame_count
+    make_node(node_dic, key, 'PoseKey', action_name, index)
+    return index
+
+
+# the evaluated matrix of an object or a bone at the current frame
+def get_pose_key_matrix(ob_parent, ob):
     if bpy.app.version < (2, 80):
-        pose_key = (ob.matrix_world if ob.type not in ['CAMERA', 'LIGHT'] else ob.matrix_world * mathutils.Matrix.Rotation(math.radians(90.0), 4, 'Y' if ob.type == 'CAMERA' else 'X')) if ob_parent == None else ob_parent.matrix_world * ob_parent.pose.bones[ob.name].matrix
+        return (ob.matrix_world if ob.type not in ['CAMERA', 'LIGHT'] else ob.matrix_world * mathutils.Matrix.Rotation(math.radians(90.0), 4, 'Y' if ob.type == 'CAMERA' else 'X')) if ob_parent == None else ob_parent.matrix_world * ob_parent.pose.bones[ob.name].matrix
+    else:
+        return (ob.matrix_world if ob.type not in ['CAMERA', 'LIGHT'] else ob.matrix_world @ mathutils.Matrix.Rotation(math.radians(90.0), 4, 'Y' if ob.type == 'CAMERA' else 'X')) if ob_parent == None else ob_parent.matrix_world @ ob_parent.pose.bones[ob.name].matrix
+
+
+def make_pose_key_dic(context, node_dic, key, pose_key_dic, ob_parent, ob, frame_count, frame, frame_index, my_animation_type, my_animation_offset):
+    if frame == 0:
+        index = make_pose_key_index(context, node_dic, key, pose_key_dic, ob_parent, ob, frame_count, my_animation_type)
     else:
-        pose_key = (ob.matrix_world if ob.type not in ['CAMERA', 'LIGHT'] else ob.matrix_world @ mathutils.Matrix.Rotation(math.radians(90.0), 4, 'Y' if ob.type == 'CAMERA' else 'X')) if ob_parent == None else ob_parent.matrix_world @ ob_parent.pose.bones[ob.name].matrix
+        index = node_dic[key]['PoseKey'][-1][1]
+    pose_key = get_pose_key_matrix(ob_parent, ob)
     temp_list = [frame_index + my_animation_offset, []]
     for row in pose_key.transposed():
         for item in row:
@@ -1295,29 +1569,383 @@ def get_pose_key_range(context, hierarchy_dic, my_animation_type):
     return (min_action_start, max_action_end)
 
 
-def make_pose_key_node_dic(context, hierarchy_dic, node_dic, pose_key_dic, my_animation_type, my_animation_offset):
-    (action_start, action_end) = get_pose_key_range(context, hierarchy_dic, my_animation_type)
+# direct sampling evaluates the action fcurves of plain keyframed objects and bones without frame_set,
+# anything which needs the depsgraph (constraints, drivers, nla, bone parenting, ...) falls back to frame_set
+
+# tolerance of the check against the depsgraph, the matrices are composed in double precision instead of float
+DIRECT_SAMPLING_TOLERANCE = 1e-4
+
+
+def has_pose_keys(ob):
+    return ob.animation_data != None and ((ob.animation_data.use_nla and len(ob.animation_data.nla_tracks) > 0) or ob.animation_data.action != None)
+
+
+# return {(data path, array index): fcurve} of the active action, or None if the transforms are not only driven by it
+def get_direct_fcurve_map(ob):
+    fcurve_map = {}
+    for animation_data in (ob.animation_data, ob.data.animation_data if isinstance(ob.data, bpy.types.Armature) else None):
+        if animation_data == None:
+            continue
+        if len(animation_data.drivers) > 0:
+            return None
+        if animation_data.use_nla and len(animation_data.nla_tracks) > 0:
+            return None
+        # the action is blended with the current values
+        if getattr(animation_data, "action_influence", 1.0) != 1.0 or getattr(animation_data, "action_blend_type", 'REPLACE') != 'REPLACE':
+            return None
+    if ob.animation_data != None and ob.animation_data.action != None:
+        for fcurve in ob.animation_data.action.fcurves:
+            # muted fcurves are not evaluated, the property keeps its value
+            if fcurve.mute or (fcurve.group != None and fcurve.group.mute):
+                continue
+            fcurve_map.setdefault((fcurve.data_path, fcurve.array_index), fcurve)
+    return fcurve_map
+
+
+# return a (frame x len(current)) array, the channels without fcurve keep their current value
+def sample_fcurve_channels(fcurve_map, data_path, current, frames):
+    values = np.empty((len(frames), len(current)), dtype=np.float64)
+    values[:] = tuple(current)
+    for i in range(len(current)):
+        fcurve = fcurve_map.get((data_path, i))
+        if fcurve != None:
+            evaluate = fcurve.evaluate
+            values[:, i] = [evaluate(frame) for frame in frames]
+    return values
+
+
+def quaternion_to_matrices(quaternions):
+    length = np.linalg.norm(quaternions, axis=1)
+    # a zero quaternion is the identity rotation
+    quaternions = np.where(length[:, None] > 0.0, quaternions / np.where(length > 0.0, length, 1.0)[:, None], (1.0, 0.0, 0.0, 0.0))
+    (w, x, y, z) = quaternions.T
+    return np.stack((
+        np.stack((1.0 - 2.0 * (y * y + z * z), 2.0 * (x * y - w * z), 2.0 * (x * z + w * y)), axis=1),
+        np.stack((2.0 * (x * y + w * z), 1.0 - 2.0 * (x * x + z * z), 2.0 * (y * z - w * x)), axis=1),
+        np.stack((2.0 * (x * z - w * y), 2.0 * (y * z + w * x), 1.0 - 2.0 * (x * x + y * y)), axis=1)), axis=1)
+
+
+def axis_angle_to_matrices(axis_angles):
+    angle = axis_angles[:, 0]
+    length = np.linalg.norm(axis_angles[:, 1:], axis=1)
+    # a zero axis is the identity rotation
+    axis = axis_angles[:, 1:] / np.where(length > 0.0, length, 1.0)[:, None]
+    angle = np.where(length > 0.0, angle, 0.0)
+    (c, s) = (np.cos(angle)[:, None, None], np.sin(angle)[:, None, None])
+    cross = np.zeros((len(axis), 3, 3))
+    cross[:, 0, 1] = -axis[:, 2]
+    cross[:, 0, 2] = axis[:, 1]
+    cross[:, 1, 0] = axis[:, 2]
+    cross[:, 1, 2] = -axis[:, 0]
+    cross[:, 2, 0] = -axis[:, 1]
+    cross[:, 2, 1] = axis[:, 0]
+    return c * np.eye(3) + s * cross + (1.0 - c) * axis[:, :, None] * axis[:, None, :]
+
+
+# the first axis of the rotation mode is applied first
+def euler_to_matrices(eulers, rotation_mode):
+    matrices = np.broadcast_to(np.eye(3), (len(eulers), 3, 3))
+    for axis_name in rotation_mode:
+        i = "XYZ".index(axis_name)
+        (j, k) = ((i + 1) % 3, (i + 2) % 3)
+        (c, s) = (np.cos(eulers[:, i]), np.sin(eulers[:, i]))
+        rotation = np.zeros((len(eulers), 3, 3))
+        rotation[:, i, i] = 1.0
+        rotation[:, j, j] = c
+        rotation[:, j, k] = -s
+        rotation[:, k, j] = s
+        rotation[:, k, k] = c
+        matrices = rotation @ matrices
+    return matrices
+
+
+# return the (frame x 4 x 4) location @ rotation @ scale matrices of an object or a pose bone
+def sample_basis_matrices(fcurve_map, owner, frames):
+    location = sample_fcurve_channels(fcurve_map, owner.path_from_id("location"), owner.location, frames)
+    scale = sample_fcurve_channels(fcurve_map, owner.path_from_id("scale"), owner.scale, frames)
+    if owner.rotation_mode == 'QUATERNION':
+        rotation = quaternion_to_matrices(sample_fcurve_channels(fcurve_map, owner.path_from_id("rotation_quaternion"), owner.rotation_quaternion, frames))
+    elif owner.rotation_mode == 'AXIS_ANGLE':
+        rotation = axis_angle_to_matrices(sample_fcurve_channels(fcurve_map, owner.path_from_id("rotation_axis_angle"), owner.rotation_axis_angle, frames))
+    else:
+        rotation = euler_to_matrices(sample_fcurve_channels(fcurve_map, owner.path_from_id("rotation_euler"), owner.rotation_euler, frames), owner.rotation_mode)
+    matrices = np.zeros((len(frames), 4, 4), dtype=np.float64)
+    matrices[:, :3, :3] = rotation * scale[:, None, :]
+    matrices[:, :3, 3] = location
+    matrices[:, 3, 3] = 1.0
+    return matrices
+
+
+def is_direct_sampling_supported(ob):
+    if len(ob.constraints) > 0:
+        return False
+    # the simulation moves the object
+    if getattr(ob, "rigid_body", None) != None:
+        return False
+    if ob.parent != None and ob.parent_type not in ['OBJECT', 'ARMATURE']:
+        return False
+    # delta transforms are not composed
+    if tuple(ob.delta_location) != (0.0, 0.0, 0.0) or tuple(ob.delta_rotation_euler) != (0.0, 0.0, 0.0) or tuple(ob.delta_rotation_quaternion) != (1.0, 0.0, 0.0, 0.0) or tuple(ob.delta_scale) != (1.0, 1.0, 1.0):
+        return False
+    return True
+
+
+# return the (frame x 4 x 4) world matrices of the object, or None if the object needs the depsgraph
+def sample_world_matrices(ob, frames, world_matrix_dic):
+    if ob in world_matrix_dic:
+        return world_matrix_dic[ob]
+    world_matrix_dic[ob] = None
+    if not is_direct_sampling_supported(ob):
+        return None
+    fcurve_map = get_direct_fcurve_map(ob)
+    if fcurve_map == None:
+        return None
+    # delta transforms are animated
+    if any([data_path.startswith("delta_") for (data_path, array_index) in fcurve_map.keys()]):
+        return None
+    matrices = sample_basis_matrices(fcurve_map, ob, frames)
+    if ob.parent != None:
+        parent_matrices = sample_world_matrices(ob.parent, frames, world_matrix_dic)
+        if parent_matrices is None:
+            return None
+        matrices = parent_matrices @ np.array(ob.matrix_parent_inverse, dtype=np.float64) @ matrices
+    world_matrix_dic[ob] = matrices
+    return matrices
+
+
+# return the (frame x 4 x 4) armature space matrix of the pose bone, or None if the pose bone needs the depsgraph
+def sample_pose_bone_matrices(ob, pose_bone, fcurve_map, frames, pose_matrix_dic):
+    if pose_bone.name in pose_matrix_dic:
+        return pose_matrix_dic[pose_bone.name]
+    pose_matrix_dic[pose_bone.name] = None
+    bone = pose_bone.bone
+    if len(pose_bone.constraints) > 0:
+        return None
+    inherit_scale = bone.inherit_scale if hasattr(bone, "inherit_scale") else ('FULL' if bone.use_inherit_scale else 'NONE')
+    if not bone.use_inherit_rotation or inherit_scale != 'FULL' or not bone.use_local_location or getattr(bone, "use_relative_parent", False):
+        return None
+    basis_matrices = sample_basis_matrices(fcurve_map, pose_bone, frames)
+    # the location of a connected bone is ignored, its head stays at the tail of the parent
+    if bone.use_connect:
+        basis_matrices[:, :3, 3] = 0.0
+    matrices = np.array(bone.matrix_local, dtype=np.float64) @ basis_matrices
+    if pose_bone.parent != None:
+        parent_matrices = sample_pose_bone_matrices(ob, pose_bone.parent, fcurve_map, frames, pose_matrix_dic)
+        if parent_matrices is None:
+            return None
+        # parent pose @ inverted parent rest @ rest @ basis
+        matrices = parent_matrices @ np.linalg.inv(np.array(bone.parent.matrix_local, dtype=np.float64)) @ matrices
+    pose_matrix_dic[pose_bone.name] = matrices
+    return matrices
+
+
+# return {key: (frame x 4 x 4) pose key matrices} of the nodes which have pose keys, or None if any of them needs the depsgraph
+def sample_pose_keys(context, hierarchy_dic, frames):
+    # the scene time is not the frame number with time remapping
+    if context.scene.render.frame_map_old != context.scene.render.frame_map_new:
+        return None
+    world_matrix_dic = {}
+    # armature: (fcurve map, {bone name: matrices})
+    armature_dic = {}
+    matrix_dic = {}
+    for (key, value) in hierarchy_dic.items():
+        ob_parent = value[-2]
+        ob = value[-1]
+        if ob_parent == None:
+            if not has_pose_keys(ob):
+                continue
+            matrices = sample_world_matrices(ob, frames, world_matrix_dic)
+            if matrices is None:
+                return None
+            if ob.type in ['CAMERA', 'LIGHT']:
+                matrices = matrices @ np.array(mathutils.Matrix.Rotation(math.radians(90.0), 4, 'Y' if ob.type == 'CAMERA' else 'X'), dtype=np.float64)
+        else:
+            if not has_pose_keys(ob_parent):
+                continue
+            armature_matrices = sample_world_matrices(ob_parent, frames, world_matrix_dic)
+            if armature_matrices is None or ob_parent.data.pose_position != 'POSE':
+                return None
+            if ob_parent not in armature_dic:
+                # ik and spline ik constraints move the parent bones of their owner too
+                if any([len(pose_bone.constraints) > 0 for pose_bone in ob_parent.pose.bones]):
+                    return None
+                armature_dic[ob_parent] = (get_direct_fcurve_map(ob_parent), {})
+            (fcurve_map, pose_matrix_dic) = armature_dic[ob_parent]
+            matrices = sample_pose_bone_matrices(ob_parent, ob_parent.pose.bones[ob.name], fcurve_map, frames, pose_matrix_dic)
+            if matrices is None:
+                return None
+            matrices = armature_matrices @ matrices
+        matrix_dic[key] = matrices
+    return matrix_dic
+
+
+# compare the sampled matrices with the depsgraph on the first, middle and last frames
+def validate_pose_keys(context, hierarchy_dic, matrix_dic, frames):
+    for i in sorted(set([0, len(frames) // 2, len(frames) - 1])):
+        context.scene.frame_set(frames[i])
+        if bpy.app.version < (2, 80):
+            bpy.context.scene.update()
+        else:
+            bpy.context.view_layer.update()
+        for (key, matrices) in matrix_dic.items():
+            pose_key = np.array(get_pose_key_matrix(hierarchy_dic[key][-2], hierarchy_dic[key][-1]), dtype=np.float64)
+            if not np.allclose(matrices[i], pose_key, rtol=DIRECT_SAMPLING_TOLERANCE, atol=DIRECT_SAMPLING_TOLERANCE):
+                return False
+    return True
+
+
+def make_sampled_pose_key_node_dic(context, hierarchy_dic, node_dic, pose_key_dic, matrix_dic, frames, my_animation_type, my_animation_offset):
+    for (key, matrices) in matrix_dic.items():
+        value = hierarchy_dic[key]
+        index = make_pose_key_index(context, node_dic, key, pose_key_dic, value[-2], value[-1], len(frames), my_animation_type)
+        # column major, as the transposed rows of the matrix
+        items = matrices.astype(np.float32).transpose(0, 2, 1).reshape(len(frames), 16).tolist()
+        pose_key_dic[index] = [[frame + my_animation_offset, item] for (frame, item) in zip(frames, items)]
+
+
+# constraints, drivers and simulations move the object or its bones between the keyframes of its action
+def is_moved_between_keyframes(ob):
+    if len(ob.constraints) > 0 or getattr(ob, "rigid_body", None) != None:
+        return True
+    if ob.pose != None and any([len(pose_bone.constraints) > 0 for pose_bone in ob.pose.bones]):
+        return True
+    for animation_data in (ob.animation_data, ob.data.animation_data if isinstance(ob.data, bpy.types.Armature) else None):
+        if animation_data != None and len(animation_data.drivers) > 0:
+            return True
+    return False
+
+
+# return the keyframe times of the fcurve, the hold frames of its constant segments and the extremes of its curved segments,
+# or None if the fcurve has modifiers, which can move the curve away from its keyframes
+def get_keyframe_times(fcurve):
+    if len(fcurve.modifiers) > 0:
+        return None
+    points = fcurve.keyframe_points
+    co = np.empty(len(points) * 2, dtype=np.float64)
+    points.foreach_get("co", co)
+    key_frames = co[0::2]
+    times = set([int(round(frame)) for frame in key_frames.tolist()])
+    for i in range(len(points) - 1):
+        (start, end) = (int(math.ceil(key_frames[i])), int(math.floor(key_frames[i + 1])))
+        interpolation = points[i].interpolation
+        if interpolation == 'CONSTANT':
+            # the value is held until the frame before the next keyframe
+            times.add(max(start, end - 1))
+        elif interpolation != 'LINEAR' and end - start > 1:
+            inner_frames = list(range(start + 1, end))
+            evaluate = fcurve.evaluate
+            values = [evaluate(frame) for frame in inner_frames]
+            times.add(inner_frames[int(np.argmin(values))])
+            times.add(inner_frames[int(np.argmax(values))])
+    return times
+
+
+# return the frames to sample between action_start and action_end, both included:
+#   ALL: every frame
+#   KEYFRAMES: the keyframe times of the objects and their parents, every frame if any of them uses nla tracks or fcurve modifiers
+#   STRIDE: every my_sampling_stride frame
+#   ADAPTIVE: every frame, they are reduced after sampling
+def make_frame_plan(hierarchy_dic, action_start, action_end, my_sampling_mode, my_sampling_stride):
+    all_frames = list(range(action_start, action_end + 1))
+    if len(all_frames) == 0:
+        return all_frames
+    if my_sampling_mode == 'STRIDE':
+        frames = list(range(action_start, action_end + 1, my_sampling_stride))
+        if frames[-1] != action_end:
+            frames.append(action_end)
+        return frames
+    if my_sampling_mode == 'KEYFRAMES':
+        times = set([action_start, action_end])
+        visited = set()
+        for value in hierarchy_dic.values():
+            ob = value[-1] if value[-2] == None else value[-2]
+            while ob != None and ob not in visited:
+                visited.add(ob)
+                if is_moved_between_keyframes(ob):
+                    return all_frames
+                if ob.animation_data != None:
+                    if ob.animation_data.use_nla and len(ob.animation_data.nla_tracks) > 0:
+                        return all_frames
+                    if ob.animation_data.action != None:
+                        for fcurve in ob.animation_data.action.fcurves:
+                            keyframe_times = get_keyframe_times(fcurve)
+                            if keyframe_times == None:
+                                return all_frames
+                            times.update(keyframe_times)
+                ob = ob.parent
+        return sorted([frame for frame in times if action_start <= frame <= action_end])
+    return all_frames
+
+
+# return the sorted positions of the rows to keep, so that linear interpolation between the kept rows
+# reproduces every dropped row within tolerance, the first and last rows are always kept
+def reduce_samples(values, tolerance):
+    keep = np.zeros(len(values), dtype=bool)
+    keep[0] = True
+    keep[-1] = True
+    segments = [(0, len(values) - 1)]
+    while len(segments) > 0:
+        (i, j) = segments.pop()
+        if j - i < 2:
+            continue
+        t = (np.arange(i + 1, j) - i) / (j - i)
+        error = np.abs(values[i + 1:j] - (values[i] + t[:, None] * (values[j] - values[i]))).max(axis=1)
+        k = int(np.argmax(error))
+        if error[k] > tolerance:
+            k += i + 1
+            keep[k] = True
+            segments.append((i, k))
+            segments.append((k, j))
+    return np.flatnonzero(keep).tolist()
+
+
+# drop the frames which every pose key of the sweep interpolates linearly within my_sampling_error
+def reduce_pose_key_dic(pose_key_dic, indices, my_sampling_error):
+    if len(indices) == 0:
+        return
+    values = np.concatenate([np.array([item[1] for item in pose_key_dic[index]], dtype=np.float64) for index in indices], axis=1)
+    positions = reduce_samples(values, my_sampling_error)
+    for index in indices:
+        pose_key_dic[index] = [pose_key_dic[index][position] for position in positions]
+
+
+def sample_pose_key_node_dic(context, hierarchy_dic, node_dic, pose_key_dic, frames, my_animation_type, my_animation_offset, use_direct_sampling):
+    if use_direct_sampling and my_animation_type != 'Tracks' and len(frames) > 0:
+        matrix_dic = sample_pose_keys(context, hierarchy_dic, frames)
+        if matrix_dic != None and validate_pose_keys(context, hierarchy_dic, matrix_dic, frames):
+            make_sampled_pose_key_node_dic(context, hierarchy_dic, node_dic, pose_key_dic, matrix_dic, frames, my_animation_type, my_animation_offset)
+            return
+    for (position, frame) in enumerate(frames):
+        # set frame
+        context.scene.frame_set(frame)
+        if bpy.app.version < (2, 80):
+            bpy.context.scene.update()
+        else:
+            bpy.context.view_layer.update()
+        for (key, value) in hierarchy_dic.items():
+            ob_parent = value[-2]
+            ob = value[-1]
+            node_type = value[0]
+            if ob_parent == None:
+                # object has animation
+                if ob.animation_data != None and ((ob.animation_data.use_nla and len(ob.animation_data.nla_tracks) > 0) or ob.animation_data.action != None):
+                    make_pose_key_dic(context, node_dic, key, pose_key_dic, ob_parent, ob, len(frames), position, frame, my_animation_type, my_animation_offset)
+            else:
+                # object has animation
+                if ob_parent.animation_data != None and ((ob_parent.animation_data.use_nla and len(ob_parent.animation_data.nla_tracks) > 0) or ob_parent.animation_data.action != None):
+                    make_pose_key_dic(context, node_dic, key, pose_key_dic, ob_parent, ob, len(frames), position, frame, my_animation_type, my_animation_offset)
+
+
+# frame_range overrides the range of the animations in the hierarchy
+def make_pose_key_node_dic(context, hierarchy_dic, node_dic, pose_key_dic, my_animation_type, my_animation_offset, use_direct_sampling, my_sampling_mode, my_sampling_stride, my_sampling_error, frame_range=None):
+    (action_start, action_end) = get_pose_key_range(context, hierarchy_dic, my_animation_type) if frame_range == None else frame_range
     # exists any pose key
     if action_start != None and action_end != None:
-        for frame in range(action_start, action_end + 1):
-            # set frame
-            context.scene.frame_set(frame)
-            if bpy.app.version < (2, 80):
-                bpy.context.scene.update()
-            else:
-                bpy.context.view_layer.update()
-            for (key, value) in hierarchy_dic.items():
-                ob_parent = value[-2]
-                ob = value[-1]
-                node_type = value[0]
-                if ob_parent == None:
-                    # object has animation
-                    if ob.animation_data != None and ((ob.animation_data.use_nla and len(ob.animation_data.nla_tracks) > 0) or ob.animation_data.action != None):
-                        make_pose_key_dic(context, node_dic, key, pose_key_dic, ob_parent, ob, action_end + 1 - action_start, frame - action_start, frame, my_animation_type, my_animation_offset)
-                else:
-                    # object has animation
-                    if ob_parent.animation_data != None and ((ob_parent.animation_data.use_nla and len(ob_parent.animation_data.nla_tracks) > 0) or ob_parent.animation_data.action != None):
-                        make_pose_key_dic(context, node_dic, key, pose_key_dic, ob_parent, ob, action_end + 1 - action_start, frame - action_start, frame, my_animation_type, my_animation_offset)
+        frames = make_frame_plan(hierarchy_dic, action_start, action_end, my_sampling_mode, my_sampling_stride)
+        first_index = len(pose_key_dic)
+        sample_pose_key_node_dic(context, hierarchy_dic, node_dic, pose_key_dic, frames, my_animation_type, my_animation_offset, use_direct_sampling)
+        if my_sampling_mode == 'ADAPTIVE':
+            reduce_pose_key_dic(pose_key_dic, list(range(first_index, len(pose_key_dic))), my_sampling_error)
 
 
 # Unity will eat the armature node when the skinned meshes are the children of the armature nodes, to preserve the armature node, we need to move the skinned meshes out of the armature node.
@@ -1326,12 +1954,9 @@ def fix_compatibility_for_unity(hierarchy_dic):
         node_type = value[0]
         if node_type == 'ARMATURE':
             parent_key = value[2]
-            for (key2, value2) in hierarchy_dic.items():
-                node_type2 = value2[0]
-                if node_type2 == 'MESH':
-                    parent_key2 = value2[2]
-                    if parent_key2 == key:
-                        value2[2] = parent_key
+            for key2 in list(hierarchy_dic.get_children(key)):
+                if hierarchy_dic[key2][0] == 'MESH':
+                    hierarchy_dic.set_parent(key2, parent_key)
 
 
 def make_applied_mesh_dic(context, origin_object_dic, applied_mesh_dic, context_objects, use_include_armature_deform_modifier):
@@ -1385,28 +2010,86 @@ def remove_applied_mesh_dic(origin_object_dic, applied_mesh_dic):
     for applied_mesh in applied_mesh_dic.values():
         bpy.data.meshes.remove(applied_mesh)
 
-def make_all_actions(context, hierarchy_dic, node_dic, pose_key_dic, context_objects, my_animation_type, my_animation_offset):
+# bone name of a pose bone fcurve, quotes and backslashes are escaped
+BONE_DATA_PATH_PATTERN = re.compile(r'pose\.bones\["((?:[^"\\]|\\.)*)"\]')
+
+
+# return the bone names and the other data paths of the fcurves of the action
+def get_action_data_paths(action):
+    bone_names = set()
+    data_paths = set()
+    for fcurve in action.fcurves:
+        match = BONE_DATA_PATH_PATTERN.match(fcurve.data_path)
+        if match != None:
+            bone_names.add(match.group(1).replace('\\"', '"').replace('\\\\', '\\'))
+        else:
+            data_paths.add(fcurve.data_path)
+    return (bone_names, data_paths)
+
+
+def is_animated_by(ob, bone_names, data_paths):
+    if ob.pose != None:
+        for bone_name in bone_names:
+            if bone_name in ob.pose.bones:
+                return True
+    for data_path in data_paths:
+        try:
+            ob.path_resolve(data_path)
+            return True
+        except ValueError:
+            pass
+    return False
+
+
+# return {action: [objects the action animates]}, an action animates an object if a data path of its fcurves resolves on the object
+def make_action_index(context_objects):
+    action_index = {}
+    for action in bpy.data.actions:
+        # ignore shape key actions, the id_root of shape key is 'KEY'
+        if action.id_root == 'OBJECT':
+            (bone_names, data_paths) = get_action_data_paths(action)
+            action_index[action] = [ob for ob in context_objects if ob.animation_data != None and is_animated_by(ob, bone_names, data_paths)]
+    return action_index
+
+
+# return the hierarchy entries of the object and its bones
+def get_object_hierarchy_dic(hierarchy_dic, ob):
+    return {key: hierarchy_dic[key] for key in hierarchy_dic.get_object_keys(ob)}
+
+
+# every object is sampled once per action which animates it, over the frame range of the action
+def make_all_actions(context, hierarchy_dic, node_dic, pose_key_dic, context_objects, my_animation_type, my_animation_offset, use_direct_sampling, my_sampling_mode, my_sampling_stride, my_sampling_error):
+    action_index = make_action_index(context_objects)
     for ob in context_objects:
         if ob.animation_data != None:
+            object_hierarchy_dic = get_object_hierarchy_dic(hierarchy_dic, ob)
+            # nothing to sample
+            if len(object_hierarchy_dic) == 0:
+                continue
             save_action = ob.animation_data.action
-            for action in bpy.data.actions:
-                # ignore shape key actions, the id_root of shape key is 'KEY'
-                if action.id_root == 'OBJECT':
+            for (action, objects) in action_index.items():
+                if ob in objects:
                     ob.animation_data.action = action
-                    make_pose_key_node_dic(context, hierarchy_dic, node_dic, pose_key_dic, my_animation_type, my_animation_offset)
+                    frame_range = [int(x) for x in action.frame_range]
+                    make_pose_key_node_dic(context, object_hierarchy_dic, node_dic, pose_key_dic, my_animation_type, my_animation_offset, use_direct_sampling, my_sampling_mode, my_sampling_stride, my_sampling_error, frame_range)
             ob.animation_data.action = save_action
 
-def make_all_nla_tracks(context, hierarchy_dic, node_dic, pose_key_dic, context_objects, my_animation_type, my_animation_offset):
+# every object is sampled once per nla track, over the frame range of the track
+def make_all_nla_tracks(context, hierarchy_dic, node_dic, pose_key_dic, context_objects, my_animation_type, my_animation_offset, use_direct_sampling, my_sampling_mode, my_sampling_stride, my_sampling_error):
     for ob in context_objects:
         if ob.animation_data != None:
             if ob.animation_data.use_nla and len(ob.animation_data.nla_tracks) > 0:
+                object_hierarchy_dic = get_object_hierarchy_dic(hierarchy_dic, ob)
+                # nothing to sample
+                if len(object_hierarchy_dic) == 0:
+                    continue
                 save_mutes = [False] * len(ob.animation_data.nla_tracks)
                 ob.animation_data.nla_tracks.foreach_get('mute', save_mutes)
                 all_mutes = [True] * len(ob.animation_data.nla_tracks)
                 for i in range(len(ob.animation_data.nla_tracks)):
                     ob.animation_data.nla_tracks.foreach_set('mute', all_mutes)
                     ob.animation_data.nla_tracks[i].mute = False
-                    make_pose_key_node_dic(context, hierarchy_dic, node_dic, pose_key_dic, my_animation_type, my_animation_offset)
+                    make_pose_key_node_dic(context, object_hierarchy_dic, node_dic, pose_key_dic, my_animation_type, my_animation_offset, use_direct_sampling, my_sampling_mode, my_sampling_stride, my_sampling_error, get_nla_frame_range(context, ob))
                 ob.animation_data.nla_tracks.foreach_set('mute', save_mutes)
 
 def concatenate_all(node_dic, pose_key_dic, shape_key_dic):
@@ -1429,24 +2112,174 @@ def concatenate_all(node_dic, pose_key_dic, shape_key_dic):
             elif key2 == 'ShapeKey':
                 if len(value2) > 1:
                     concatenate_index = len(shape_key_dic)
-                    shape_key_dic[concatenate_index] = []
+                    frame_list = []
+                    value_list = []
                     frame_offset = 0
                     for item in value2:
-                        to_concatenate_index = item[1]
-                        for shape_key in shape_key_dic[to_concatenate_index]:
-                            shape_key_dic[concatenate_index].append([])
-                            shape_key_dic[concatenate_index][-1].append(frame_offset + shape_key[0] - shape_key_dic[to_concatenate_index][0][0] + 1)
-                            shape_key_dic[concatenate_index][-1].extend(shape_key[1:])
-                        frame_offset += shape_key_dic[to_concatenate_index][-1][0] - shape_key_dic[to_concatenate_index][0][0] + 1
+                        (frames, values) = shape_key_dic[item[1]]
+                        frame_list.append(frame_offset + frames - frames[0] + 1)
+                        value_list.append(values)
+                        frame_offset += int(frames[-1] - frames[0]) + 1
+                    shape_key_dic[concatenate_index] = (np.concatenate(frame_list), np.concatenate(value_list))
                     # clear all actions
                     node_dic[key][key2] = []
                     # add the concatenated action
                     make_node(node_dic, key, 'ShapeKey', "Concatenated ShapeKey Action", concatenate_index)
 
-def write_some_data(context, filepath, context_objects, use_animation, my_animation_offset, my_animation_type, use_only_deform_bones, use_rigify_armature, use_rigify_root_bone, use_only_selected_deform_bones, my_max_bone_influences, use_vertex_animation, use_vertex_format, use_vertex_space, my_vertex_frame_start, my_vertex_frame_end, use_edge_crease, my_edge_crease_scale, my_edge_smoothing, use_apply_modifiers, use_include_armature_deform_modifier, use_concatenate_all, use_embed_media, use_copy_texture, subdirname, packed_texture_filenames):
+# return the objects and every object they depend on: parents, modifier and constraint objects, driver targets
+def get_evaluation_dependencies(context_objects):
+    objects = []
+    visited = set()
+    pending = list(context_objects)
+    while len(pending) > 0:
+        ob = pending.pop()
+        if ob in visited:
+            continue
+        visited.add(ob)
+        objects.append(ob)
+        if ob.parent != None:
+            pending.append(ob.parent)
+        owners = list(ob.modifiers) + list(ob.constraints)
+        if ob.pose != None:
+            for pose_bone in ob.pose.bones:
+                owners.extend(pose_bone.constraints)
+        for owner in owners:
+            for prop in owner.bl_rna.properties:
+                if prop.type == 'POINTER':
+                    value = getattr(owner, prop.identifier)
+                    if isinstance(value, bpy.types.Object):
+                        pending.append(value)
+            # armature constraint
+            for target in getattr(owner, "targets", []):
+                if isinstance(getattr(target, "target", None), bpy.types.Object):
+                    pending.append(target.target)
+        animation_data_list = [ob.animation_data]
+        if ob.data != None:
+            animation_data_list.append(getattr(ob.data, "animation_data", None))
+            shape_keys = getattr(ob.data, "shape_keys", None)
+            if shape_keys != None:
+                animation_data_list.append(shape_keys.animation_data)
+        for animation_data in animation_data_list:
+            if animation_data != None:
+                for driver in animation_data.drivers:
+                    for variable in driver.driver.variables:
+                        for target in variable.targets:
+                            if isinstance(target.id, bpy.types.Object):
+                                pending.append(target.id)
+    return objects
+
+
+# link the objects and their dependencies to a temporary scene and make it the active scene,
+# frame_set and view layer updates then skip every unrelated object of the original scene
+# only the frame sweeps run in it, anything else may read scene settings which are not copied
+@contextlib.contextmanager
+def isolate_evaluation(context, context_objects, use_isolated_evaluation):
+    # the depsgraph of the window scene writes back to the original objects, 2.7x has no window scene
+    if not use_isolated_evaluation or bpy.app.version < (2, 80) or context.window == None:
+        yield
+        return
+    scene = context.scene
+    temp_scene = bpy.data.scenes.new(name="better_fbx_isolated_evaluation")
+    try:
+        for attribute in ['frame_start', 'frame_end', 'frame_step', 'frame_current']:
+            setattr(temp_scene, attribute, getattr(scene, attribute))
+        # settings which change the evaluation
+        for attribute in ['engine', 'fps', 'fps_base', 'frame_map_old', 'frame_map_new', 'use_simplify', 'simplify_subdivision']:
+            setattr(temp_scene.render, attribute, getattr(scene.render, attribute))
+        for ob in get_evaluation_dependencies(context_objects):
+            temp_scene.collection.objects.link(ob)
+        context.window.scene = temp_scene
+        try:
+            yield
+        finally:
+            context.window.scene = scene
+    finally:
+        bpy.data.scenes.remove(temp_scene)
+
+
+def get_hierarchy_depth(hierarchy_dic, key):
+    depth = 0
+    while key in hierarchy_dic:
+        key = hierarchy_dic[key][2]
+        depth += 1
+    return depth
+
+
+# (frame x 4 x 4) matrices of column major pose values
+def make_pose_matrices(values):
+    return np.array(values, dtype=np.float64).reshape(-1, 4, 4).transpose(0, 2, 1)
+
+
+# drop the pose key tracks whose local matrices stay at the default pose and collapse the other constant tracks to their first and last keys,
+# children are visited first and a track is only changed if no child keeps a track of the same action, so no remaining track depends on a changed parent,
+# the last track of an action is never dropped, return (dropped track count, collapsed track count)
+def remove_static_pose_keys(hierarchy_dic, node_dic, pose_key_dic, default_pose_dic, my_static_track_tolerance):
+    # (key, action name): pose key index, None if the node has several tracks of the action
+    tracks = {}
+    for (key, value) in node_dic.items():
+        for (name, index) in value.get('PoseKey', []):
+            tracks[(key, name)] = index if (key, name) not in tracks else None
+    # track count per action, child track count per (parent key, action name)
+    action_counts = {}
+    child_counts = {}
+    for (key, name) in tracks.keys():
+        action_counts[name] = action_counts.get(name, 0) + 1
+        parent_key = hierarchy_dic[key][2]
+        child_counts[(parent_key, name)] = child_counts.get((parent_key, name), 0) + 1
+    default_matrices = {key: make_pose_matrices(default_pose_dic[value['DefaultPose'][0][1]])[0] for (key, value) in node_dic.items() if 'DefaultPose' in value}
+    dropped_indices = set()
+    collapsed_count = 0
+    for (key, name) in sorted(tracks.keys(), key=lambda track: -get_hierarchy_depth(hierarchy_dic, track[0])):
+        index = tracks[(key, name)]
+        parent_key = hierarchy_dic[key][2]
+        if index == None or child_counts.get((key, name), 0) > 0 or key not in default_matrices:
+            continue
+        frames = [item[0] for item in pose_key_dic[index]]
+        matrices = make_pose_matrices([item[1] for item in pose_key_dic[index]])
+        parent_index = tracks.get((parent_key, name))
+        if parent_key in hierarchy_dic:
+            if parent_key not in default_matrices or ((parent_key, name) in tracks and parent_index == None):
+                continue
+            if parent_index != None:
+                # the local matrices need the parent matrix of the same frames
+                if [item[0] for item in pose_key_dic[parent_index]] != frames:
+                    continue
+                parent_matrices = make_pose_matrices([item[1] for item in pose_key_dic[parent_index]])
+            else:
+                parent_matrices = default_matrices[parent_key][None]
+            matrices = np.linalg.solve(parent_matrices, matrices)
+            default_matrix = np.linalg.solve(default_matrices[parent_key], default_matrices[key])
+        else:
+            default_matrix = default_matrices[key]
+        if np.abs(matrices - matrices[0]).max() > my_static_track_tolerance:
+            continue
+        if np.abs(matrices[0] - default_matrix).max() <= my_static_track_tolerance and action_counts[name] > 1:
+            node_dic[key]['PoseKey'].remove([name, index])
+            dropped_indices.add(index)
+            action_counts[name] -= 1
+            child_counts[(parent_key, name)] -= 1
+        # a collapsed parent would change the frames of the children
+        elif parent_index == None and len(frames) > 2:
+            pose_key_dic[index] = [pose_key_dic[index][0], pose_key_dic[index][-1]]
+            collapsed_count += 1
+    # renumber the remaining pose keys
+    if len(dropped_indices) > 0:
+        pose_key_list = [(index, value) for (index, value) in pose_key_dic.items() if index not in dropped_indices]
+        pose_key_dic.clear()
+        index_dic = {}
+        for (index, value) in pose_key_list:
+            index_dic[index] = len(pose_key_dic)
+            pose_key_dic[len(pose_key_dic)] = value
+        for value in node_dic.values():
+            for item in value.get('PoseKey', []):
+                item[1] = index_dic[item[1]]
+    return (len(dropped_indices), collapsed_count)
+
+
+def write_some_data(context, filepath, context_objects, use_animation, my_animation_offset, my_animation_type, use_direct_sampling, my_sampling_mode, my_sampling_stride, my_sampling_error, use_remove_static_tracks, my_static_track_tolerance, use_isolated_evaluation, use_only_deform_bones, use_rigify_armature, use_rigify_root_bone, use_only_selected_deform_bones, my_max_bone_influences, my_min_bone_weight, my_shape_key_threshold, use_vertex_animation, use_vertex_format, use_vertex_space, my_vertex_frame_start, my_vertex_frame_end, use_edge_crease, my_edge_crease_scale, my_edge_smoothing, use_apply_modifiers, use_include_armature_deform_modifier, use_concatenate_all, use_embed_media, use_copy_texture, subdirname, packed_texture_filenames, use_binary_format, stream=None):
     print("running write_some_data...")
     print("="*30)
-    hierarchy_dic = {}
+    hierarchy_dic = Hierarchy()
     default_pose_dic = {}
     bind_pose_dic = {}
     pose_key_dic = {}
@@ -1491,49 +2324,89 @@ def write_some_data(context, filepath, context_objects, use_animation, my_animat
     if use_apply_modifiers and not use_include_armature_deform_modifier:
         make_applied_mesh_dic(context, origin_object_dic, applied_mesh_dic, context_objects, use_include_armature_deform_modifier)
     make_hierarchy_dic(hierarchy_dic, use_only_deform_bones, use_rigify_armature, use_rigify_root_bone, use_only_selected_deform_bones, block_list, context_objects)
-    make_generic_node_dic(context, hierarchy_dic, node_dic, default_pose_dic, bind_pose_dic, vertex_dic, weight_dic, shape_dic, shape_key_dic, polygon_dic, uv_dic, normal_dic, color_dic, polygon_material_dic, texture_dic, material_dic, mesh_material_dic, exist_object_dic, use_animation, my_animation_offset, my_animation_type, block_list, use_rigify_armature, camera_dic, light_dic, vertex_animation_dic, use_vertex_animation, use_vertex_format, use_vertex_space, my_vertex_frame_start, my_vertex_frame_end, custom_property_dic, edge_crease_dic, use_edge_crease, my_edge_crease_scale, my_edge_smoothing, edge_smoothing_dic, applied_mesh_dic, ik_dic, use_embed_media, use_copy_texture, subdirname, packed_texture_filenames)
-    # make all actions
-    if not use_vertex_animation and use_animation:
-        if my_animation_type == 'Actions':
-            make_all_actions(context, hierarchy_dic, node_dic, pose_key_dic, context_objects, my_animation_type, my_animation_offset)
-        elif my_animation_type == 'Tracks':
-            make_all_nla_tracks(context, hierarchy_dic, node_dic, pose_key_dic, context_objects, my_animation_type, my_animation_offset)
+    try:
+        make_generic_node_dic(context, hierarchy_dic, node_dic, default_pose_dic, bind_pose_dic, vertex_dic, weight_dic, shape_dic, shape_key_dic, polygon_dic, uv_dic, normal_dic, color_dic, polygon_material_dic, texture_dic, material_dic, mesh_material_dic, exist_object_dic, use_animation, my_animation_offset, my_animation_type, block_list, use_rigify_armature, camera_dic, light_dic, vertex_animation_dic, use_vertex_animation, use_vertex_format, use_vertex_space, my_vertex_frame_start, my_vertex_frame_end, custom_property_dic, edge_crease_dic, use_edge_crease, my_edge_crease_scale, my_edge_smoothing, edge_smoothing_dic, applied_mesh_dic, ik_dic, use_embed_media, use_copy_texture, subdirname, packed_texture_filenames, my_shape_key_threshold, use_isolated_evaluation)
+        # make all actions
+        if not use_vertex_animation and use_animation:
+            # the frame sweeps only evaluate the exported objects and their dependencies if isolated evaluation is enabled
+            with isolate_evaluation(context, context_objects, use_isolated_evaluation):
+                if my_animation_type == 'Actions':
+                    make_all_actions(context, hierarchy_dic, node_dic, pose_key_dic, context_objects, my_animation_type, my_animation_offset, use_direct_sampling, my_sampling_mode, my_sampling_stride, my_sampling_error)
+                elif my_animation_type == 'Tracks':
+                    make_all_nla_tracks(context, hierarchy_dic, node_dic, pose_key_dic, context_objects, my_animation_type, my_animation_offset, use_direct_sampling, my_sampling_mode, my_sampling_stride, my_sampling_error)
+                else:
+                    make_pose_key_node_dic(context, hierarchy_dic, node_dic, pose_key_dic, my_animation_type, my_animation_offset, use_direct_sampling, my_sampling_mode, my_sampling_stride, my_sampling_error)
+        # concatenate all actions
+        if not use_vertex_animation and use_animation:
+            if my_animation_type != 'Active':
+                if use_concatenate_all:
+                    concatenate_all(node_dic, pose_key_dic, shape_key_dic)
+        # remove any applied meshes
+        remove_applied_mesh_dic(origin_object_dic, applied_mesh_dic)
+        fix_compatibility_for_unity(hierarchy_dic)
+        # remove the pose key tracks which do not move
+        if not use_vertex_animation and use_animation and use_remove_static_tracks:
+            (dropped_count, collapsed_count) = remove_static_pose_keys(hierarchy_dic, node_dic, pose_key_dic, default_pose_dic, my_static_track_tolerance)
+            print("removed {} static pose key tracks, collapsed {} constant pose key tracks".format(dropped_count, collapsed_count))
+        if use_binary_format:
+            sections = []
+            sections.append(("FrameRate", save_text_section(save_frame_rate, frame_rate)))
+            sections.append(("Hierarchy", save_text_section(save_hierarchy_dic, hierarchy_dic)))
+            sections.append(("Node", save_text_section(save_node_dic, node_dic)))
+            sections.append(("DefaultPose", intermediate.pack_section("DefaultPose", pack_pose_dic(default_pose_dic))))
+            sections.append(("BindPose", intermediate.pack_section("BindPose", pack_pose_dic(bind_pose_dic))))
+            sections.append(("PoseKey", intermediate.pack_section("PoseKey", pack_pose_key_dic(pose_key_dic))))
+            sections.append(("Vertex", intermediate.pack_section("Vertex", pack_vertex_dic(vertex_dic))))
+            sections.append(("Weight", save_text_section(save_weight_dic, weight_dic, my_max_bone_influences, my_min_bone_weight)))
+            sections.append(("Shape", intermediate.pack_section("Shape", pack_shape_dic(shape_dic))))
+            sections.append(("ShapeKey", intermediate.pack_section("ShapeKey", pack_shape_key_dic(shape_key_dic))))
+            sections.append(("Polygon", intermediate.pack_section("Polygon", pack_polygon_dic(polygon_dic))))
+            sections.append(("UV", intermediate.pack_section("UV", pack_loop_dic(uv_dic))))
+            sections.append(("Normal", intermediate.pack_section("Normal", pack_loop_dic(normal_dic))))
+            sections.append(("Color", intermediate.pack_section("Color", pack_loop_dic(color_dic))))
+            sections.append(("PolygonMaterial", intermediate.pack_section("PolygonMaterial", pack_polygon_material_dic(polygon_material_dic))))
+            sections.append(("Texture", save_text_section(save_texture_dic, texture_dic)))
+            sections.append(("Material", save_text_section(save_material_dic, material_dic)))
+            sections.append(("MeshMaterial", save_text_section(save_mesh_material_dic, mesh_material_dic)))
+            sections.append(("Camera", save_text_section(save_camera_dic, camera_dic)))
+            sections.append(("Light", save_text_section(save_light_dic, light_dic)))
+            sections.append(("VertexPoseKey", pack_vertex_animation_dic(vertex_animation_dic)))
+            sections.append(("CustomProperty", save_text_section(save_custom_property_dic, custom_property_dic)))
+            sections.append(("EdgeCrease", intermediate.pack_section("EdgeCrease", pack_edge_crease_dic(edge_crease_dic))))
+            sections.append(("EdgeSmoothing", intermediate.pack_section("EdgeSmoothing", pack_edge_smoothing_dic(edge_smoothing_dic))))
+            sections.append(("IK", save_text_section(save_ik_dic, ik_dic)))
+            with open_intermediate_file(filepath, stream, use_binary_format) as f:
+                intermediate.write_binary_file(f, sections)
         else:
-            make_pose_key_node_dic(context, hierarchy_dic, node_dic, pose_key_dic, my_animation_type, my_animation_offset)
-    # concatenate all actions
-    if not use_vertex_animation and use_animation:
-        if my_animation_type != 'Active':
-            if use_concatenate_all:
-                concatenate_all(node_dic, pose_key_dic, shape_key_dic)
-    # remove any applied meshes
-    remove_applied_mesh_dic(origin_object_dic, applied_mesh_dic)
-    fix_compatibility_for_unity(hierarchy_dic)
-    with open(filepath, 'w', encoding='utf-8', errors='ignore') as f:
-        save_frame_rate(f, frame_rate)
-        save_hierarchy_dic(f, hierarchy_dic)
-        save_node_dic(f, node_dic)
-        save_default_pose_dic(f, default_pose_dic)
-        save_bind_pose_dic(f, bind_pose_dic)
-        save_pose_key_dic(f, pose_key_dic)
-        save_vertex_dic(f, vertex_dic)
-        save_weight_dic(f, weight_dic, my_max_bone_influences)
-        save_shape_dic(f, shape_dic)
-        save_shape_key_dic(f, shape_key_dic)
-        save_polygon_dic(f, polygon_dic)
-        save_uv_dic(f, uv_dic)
-        save_normal_dic(f, normal_dic)
-        save_color_dic(f, color_dic)
-        save_polygon_material_dic(f, polygon_material_dic)
-        save_texture_dic(f, texture_dic)
-        save_material_dic(f, material_dic)
-        save_mesh_material_dic(f, mesh_material_dic)
-        save_camera_dic(f, camera_dic)
-        save_light_dic(f, light_dic)
-        save_vertex_animation_dic(f, vertex_animation_dic)
-        save_custom_property_dic(f, custom_property_dic)
-        save_edge_crease_dic(f, edge_crease_dic)
-        save_edge_smoothing_dic(f, edge_smoothing_dic)
-        save_ik_dic(f, ik_dic)
+            with open_intermediate_file(filepath, stream, use_binary_format) as f:
+                save_frame_rate(f, frame_rate)
+                save_hierarchy_dic(f, hierarchy_dic)
+                save_node_dic(f, node_dic)
+                save_default_pose_dic(f, default_pose_dic)
+                save_bind_pose_dic(f, bind_pose_dic)
+                save_pose_key_dic(f, pose_key_dic)
+                save_vertex_dic(f, vertex_dic)
+                save_weight_dic(f, weight_dic, my_max_bone_influences, my_min_bone_weight)
+                save_shape_dic(f, shape_dic)
+                save_shape_key_dic(f, shape_key_dic)
+                save_polygon_dic(f, polygon_dic)
+                save_uv_dic(f, uv_dic)
+                save_normal_dic(f, normal_dic)
+                save_color_dic(f, color_dic)
+                save_polygon_material_dic(f, polygon_material_dic)
+                save_texture_dic(f, texture_dic)
+                save_material_dic(f, material_dic)
+                save_mesh_material_dic(f, mesh_material_dic)
+                save_camera_dic(f, camera_dic)
+                save_light_dic(f, light_dic)
+                save_vertex_animation_dic(f, vertex_animation_dic)
+                save_custom_property_dic(f, custom_property_dic)
+                save_edge_crease_dic(f, edge_crease_dic)
+                save_edge_smoothing_dic(f, edge_smoothing_dic)
+                save_ik_dic(f, ik_dic)
+    finally:
+        # remove the point cache files of the vertex animations, even if the export fails
+        remove_vertex_animation_dic(vertex_animation_dic)
     # set to current frame
     context.scene.frame_set(current_frame)
     restore_current_poses(context, context_objects, current_pose_dic)
@@ -1711,6 +2584,14 @@ class BetterExportFbx(Operator, ExportHelper):
             default=False,
             )
 
+    my_shape_key_threshold: FloatProperty(
+        name = "Shape Key Threshold",
+        description = "Ignore shape key vertices which move less than this distance from the basis shape on every axis, 0 keeps every changed vertex",
+        default = 0.0,
+        min = 0.0,
+        max = 1.0,
+        precision = 6)
+
     my_animation_type: EnumProperty(
             name="Animation Type",
             description="Single animation or multiple animations",
@@ -1738,6 +2619,13 @@ class BetterExportFbx(Operator, ExportHelper):
             default='Unlimited',
             )
 
+    my_min_bone_weight: FloatProperty(
+        name = "Min Bone Weight",
+        description = "Remove bone influences below this weight before truncating and normalizing, 0 keeps all influences",
+        default = 0.0,
+        min = 0.0,
+        max = 1.0)
+
     use_rigify_armature: BoolProperty(
             name="Rigify Armature",
             description="Make game-friendly armature for Rigify Auto-Rigging System",
@@ -1803,6 +2691,13 @@ class BetterExportFbx(Operator, ExportHelper):
             default=False,
             )
 
+    my_max_concurrent_conversions: IntProperty(
+        name = "Max Concurrent Conversions",
+        description = "Maximum number of files converted at the same time when exporting to separate files",
+        default = converter.DEFAULT_MAX_WORKERS,
+        min = 1,
+        max = 64)
+
     my_material_style: EnumProperty(
             name="Material Style",
             description="How to map texture images to FBX's standard material property names",
@@ -1831,6 +2726,57 @@ class BetterExportFbx(Operator, ExportHelper):
             maxlen=255,  # Max internal buffer length, longer would be clamped.
             )
 
+    use_direct_sampling: BoolProperty(
+            name="Direct Sampling",
+            description="Experimental, sample plain keyframed objects and bones from their fcurves without evaluating the scene on every frame, anything with constraints, drivers or NLA tracks is evaluated frame by frame",
+            default=False,
+            )
+
+    my_sampling_mode: EnumProperty(
+            name="Sampling",
+            description="Which frames of the object and bone animations are exported",
+            items=(('ALL', "Every Frame", "Export every frame"),
+                   ('KEYFRAMES', "Keyframes", "Export the keyframes, the hold frames of constant segments and the extremes of curved segments, objects with NLA tracks or fcurve modifiers export every frame"),
+                   ('STRIDE', "Fixed Stride", "Export every Nth frame and the last frame"),
+                   ('ADAPTIVE', "Adaptive", "Export the frames which linear interpolation can not reproduce within the sampling error")),
+            default='ALL',
+            )
+
+    my_sampling_stride: IntProperty(
+        name = "Sampling Stride",
+        description = "Export every Nth frame when sampling with a fixed stride",
+        default = 2,
+        min = 1,
+        max = 1000)
+
+    my_sampling_error: FloatProperty(
+        name = "Sampling Error",
+        description = "Maximum error of any matrix component of the dropped frames when sampling adaptively",
+        default = 0.001,
+        min = 0.0,
+        max = 1.0,
+        precision = 4)
+
+    use_remove_static_tracks: BoolProperty(
+            name="Remove Static Tracks",
+            description="Remove the object and bone animations which stay at the default pose and reduce the other constant animations to their first and last keyframes",
+            default=False,
+            )
+
+    my_static_track_tolerance: FloatProperty(
+        name = "Static Track Tolerance",
+        description = "Maximum change of any local matrix component of a static animation",
+        default = 0.00001,
+        min = 0.0,
+        max = 1.0,
+        precision = 6)
+
+    use_isolated_evaluation: BoolProperty(
+            name="Isolated Evaluation",
+            description="Experimental, evaluate only the exported objects and their dependencies in a temporary scene while sampling frames, unrelated objects of the scene are not evaluated",
+            default=False,
+            )
+
     use_simplify_keyframe: BoolProperty(
             name="Simplify Keyframe",
             description="Simplify keyframe values by removing similar keyframe values",
@@ -1844,6 +2790,29 @@ class BetterExportFbx(Operator, ExportHelper):
         min = 0.0001,
         max = 10000.0)
 
+    use_binary_format: BoolProperty(
+            name="Binary Intermediate Format",
+            description="Write the intermediate data as a packed binary container instead of text, the fbx-utility must support the binary container",
+            default=False,
+            options={'HIDDEN'},
+            )
+
+    use_stream_conversion: BoolProperty(
+            name="Stream To Converter",
+            description="Start the fbx-utility first and stream the intermediate data to it through a named pipe instead of a temporary file, the fbx-utility must read its input sequentially",
+            default=False,
+            options={'HIDDEN'},
+            )
+
+    my_converter_mode: EnumProperty(
+            name="Converter Mode",
+            description="How the fbx-utility is run",
+            items=(('DIRECT', "Direct", "Start a new fbx-utility process for every file"),
+                   ('WORKER', "Worker", "Send every file to a pool of worker processes, the bundled worker still starts a new fbx-utility process for every file")),
+            default='DIRECT',
+            options={'HIDDEN'},
+            )
+
     def draw(self, context):
         layout = self.layout
 
@@ -1876,6 +2845,7 @@ class BetterExportFbx(Operator, ExportHelper):
         box.prop(self, 'use_only_deform_bones')
         box.prop(self, 'use_only_selected_deform_bones')
         box.prop(self, 'my_max_bone_influences')
+        box.prop(self, 'my_min_bone_weight')
 
         box = layout.box()
         box.label(text="Animation Options:")
@@ -1883,6 +2853,13 @@ class BetterExportFbx(Operator, ExportHelper):
         box.prop(self, 'my_animation_offset')
         box.prop(self, 'my_animation_type')
         box.prop(self, 'use_concatenate_all')
+        box.prop(self, 'use_direct_sampling')
+        box.prop(self, 'my_sampling_mode')
+        box.prop(self, 'my_sampling_stride')
+        box.prop(self, 'my_sampling_error')
+        box.prop(self, 'use_remove_static_tracks')
+        box.prop(self, 'my_static_track_tolerance')
+        box.prop(self, 'use_isolated_evaluation')
         box.prop(self, 'use_simplify_keyframe')
         box.prop(self, 'my_simplify_keyframe_factor')
 
@@ -1905,6 +2882,7 @@ class BetterExportFbx(Operator, ExportHelper):
         box.prop(self, 'use_apply_modifiers')
         box.prop(self, 'use_include_armature_deform_modifier')
         box.prop(self, 'use_triangulate')
+        box.prop(self, 'my_shape_key_threshold')
 
         box = layout.box()
         box.label(text="Edge Options:")
@@ -1915,6 +2893,7 @@ class BetterExportFbx(Operator, ExportHelper):
         box = layout.box()
         box.label(text="Batch Options:")
         box.prop(self, 'my_separate_files')
+        box.prop(self, 'my_max_concurrent_conversions')
 
 
     def clean_temporary_files(self, subdirname, output_path, packed_texture_filenames):
@@ -1937,32 +2916,58 @@ class BetterExportFbx(Operator, ExportHelper):
                     os.remove(unpacked_texture_filename)
 
 
+    def get_converter_pool(self, executable_path):
+        if self.my_converter_mode != 'WORKER':
+            return None
+        python_path = getattr(bpy.app, "binary_path_python", sys.executable)
+        return converter.get_pool(converter.make_worker_command(python_path, executable_path), self.my_max_concurrent_conversions)
+
+    def make_converter_command(self, executable_path, output_path, filepath):
+        return [executable_path, output_path, filepath, str(self.my_scale), self.my_fbx_format, self.my_fbx_version, self.my_fbx_axis, "None", "None", "True" if self.use_optimize_for_game_engine else "False", "True" if self.use_ignore_armature_node else "False", "True" if self.use_reset_mesh_origin else "False", "None", "True" if self.use_triangulate else "False", "None", self.my_edge_smoothing, "True" if self.use_embed_media else "False", str(self.my_simplify_keyframe_factor) if self.use_simplify_keyframe else "0.0", self.my_material_style]
+
+    def make_write_args(self, context, output_path, context_objects, subdirname, packed_texture_filenames):
+        return [context, output_path, context_objects, self.use_animation, self.my_animation_offset, self.my_animation_type, self.use_direct_sampling, self.my_sampling_mode, self.my_sampling_stride, self.my_sampling_error, self.use_remove_static_tracks, self.my_static_track_tolerance, self.use_isolated_evaluation, True if self.use_rigify_armature or self.use_only_selected_deform_bones else self.use_only_deform_bones, self.use_rigify_armature, self.use_rigify_root_bone, self.use_only_selected_deform_bones, self.my_max_bone_influences, self.my_min_bone_weight, self.my_shape_key_threshold, self.use_vertex_animation, self.use_vertex_format, self.use_vertex_space, self.my_vertex_frame_start, self.my_vertex_frame_end, self.use_edge_crease, self.my_edge_crease_scale, self.my_edge_smoothing, self.use_apply_modifiers, self.use_include_armature_deform_modifier, self.use_concatenate_all, self.use_embed_media, self.use_copy_texture, subdirname, packed_texture_filenames, self.use_binary_format]
+
+    # write the intermediate data and convert it to filepath, return the converter return code
+    def write_and_convert(self, context, executable_path, pool, output_path, filepath, context_objects, subdirname, packed_texture_filenames):
+        write_args = self.make_write_args(context, output_path, context_objects, subdirname, packed_texture_filenames)
+        command = self.make_converter_command(executable_path, output_path, filepath)
+        # the converter starts while the scene is extracted
+        if self.use_stream_conversion and converter.is_stream_supported():
+            return converter.run_streamed(command, output_path, lambda stream: write_some_data(*write_args, stream))
+        write_some_data(*write_args)
+        return converter.run_converter(command, pool)
+
+    # extract the next object while the previous objects are converted, every object has its own output
+    # return the first failed converter return code in object order, or 0
+    def write_and_convert_separately(self, context, executable_path, pool, dirname, context_objects, subdirname, packed_texture_filenames):
+        queue = converter.ConverterQueue(self.my_max_concurrent_conversions, pool)
+        output_paths = []
+        try:
+            for context_object in context_objects:
+                # stop extracting after a failure
+                returncode = queue.poll()
+                if returncode != 0:
+                    return returncode
+                # add extension if not exists
+                filepath = bpy.path.ensure_ext(os.path.join(dirname, context_object.name), self.my_file_type)
+                output_path = os.path.join(os.path.dirname(__file__), "data", uuid.uuid4().hex + (".bin" if self.use_binary_format else ".txt"))
+                output_paths.append(output_path)
+                write_some_data(*self.make_write_args(context, output_path, [context_object], subdirname, packed_texture_filenames))
+                # the intermediate file is removed as soon as its conversion finishes
+                queue.submit(self.make_converter_command(executable_path, output_path, filepath), output_path)
+            return queue.wait()
+        finally:
+            # wait for running converters, then remove the intermediate files which were not converted
+            queue.close()
+            for output_path in output_paths:
+                converter.remove_file(output_path)
+
     def execute(self, context):
         start_time = time.time()
         # do the job in background
-        executable_path = None
-        if platform.system() == 'Windows':
-            if platform.machine().endswith('64'):
-                executable_path = os.path.join(os.path.dirname(__file__), "bin", platform.system(), "x64", "fbx-utility")
-            else:
-                executable_path = os.path.join(os.path.dirname(__file__), "bin", platform.system(), "x86", "fbx-utility")
-        else:
-            if platform.system() == 'Linux':
-                glibc_version = os.confstr('CS_GNU_LIBC_VERSION').split(" ")
-                if glibc_version[0] == 'glibc' and glibc_version[1] >= '2.29':
-                    executable_path = os.path.join(os.path.dirname(__file__), "bin", platform.system(), "fbx-utility")
-                else:
-                    executable_path = os.path.join(os.path.dirname(__file__), "bin", platform.system(), "fbx-utility2")
-            elif platform.system() == 'Darwin':
-                if platform.mac_ver()[0] >= '10.15':
-                    executable_path = os.path.join(os.path.dirname(__file__), "bin", platform.system(), "fbx-utility")
-                elif platform.mac_ver()[0] >= '10.13':
-                    executable_path = os.path.join(os.path.dirname(__file__), "bin", platform.system(), "fbx-utility2")
-                else:
-                    executable_path = os.path.join(os.path.dirname(__file__), "bin", platform.system(), "fbx-utility3")
-            # chmod
-            if not os.access(executable_path, os.X_OK):
-                os.chmod(executable_path, 0o755)
+        executable_path = converter.get_executable_path(os.path.dirname(__file__))
+        pool = self.get_converter_pool(executable_path)
 
         # delete deprecated output path
         deprecated_output_path = os.path.join(os.path.dirname(__file__), "data", "untitled-fbx.txt")
@@ -1970,7 +2975,7 @@ class BetterExportFbx(Operator, ExportHelper):
             os.remove(deprecated_output_path)
 
         # write to inner format
-        output_path = os.path.join(os.path.dirname(__file__), "data", uuid.uuid4().hex + ".txt")
+        output_path = os.path.join(os.path.dirname(__file__), "data", uuid.uuid4().hex + (".bin" if self.use_binary_format else ".txt"))
         # get directory name
         dirname = os.path.dirname(self.filepath)
         # get subdirectory name
@@ -1982,26 +2987,28 @@ class BetterExportFbx(Operator, ExportHelper):
         packed_texture_filenames = []
 
         # batch export
-        if self.my_separate_files:
-            # export every context object separately
-            for context_object in context_objects:
-                write_some_data(context, output_path, [context_object], self.use_animation, self.my_animation_offset, self.my_animation_type, True if self.use_rigify_armature or self.use_only_selected_deform_bones else self.use_only_deform_bones, self.use_rigify_armature, self.use_rigify_root_bone, self.use_only_selected_deform_bones, self.my_max_bone_influences, self.use_vertex_animation, self.use_vertex_format, self.use_vertex_space, self.my_vertex_frame_start, self.my_vertex_frame_end, self.use_edge_crease, self.my_edge_crease_scale, self.my_edge_smoothing, self.use_apply_modifiers, self.use_include_armature_deform_modifier, self.use_concatenate_all, self.use_embed_media, self.use_copy_texture, subdirname, packed_texture_filenames)
+        if self.my_separate_files and not (self.use_stream_conversion and converter.is_stream_supported()):
+            returncode = self.write_and_convert_separately(context, executable_path, pool, dirname, context_objects, subdirname, packed_texture_filenames)
 
+            if returncode != 0:
+                self.clean_temporary_files(subdirname, output_path, packed_texture_filenames)
+                return {'CANCELLED'}
+        elif self.my_separate_files:
+            # export every context object separately, each one is streamed to its converter
+            for context_object in context_objects:
                 # add extension if not exists
                 filepath = bpy.path.ensure_ext(os.path.join(dirname, context_object.name), self.my_file_type)
-                result = subprocess.run([executable_path, output_path, filepath, str(self.my_scale), self.my_fbx_format, self.my_fbx_version, self.my_fbx_axis, "None", "None", "True" if self.use_optimize_for_game_engine else "False", "True" if self.use_ignore_armature_node else "False", "True" if self.use_reset_mesh_origin else "False", "None", "True" if self.use_triangulate else "False", "None", self.my_edge_smoothing, "True" if self.use_embed_media else "False", str(self.my_simplify_keyframe_factor) if self.use_simplify_keyframe else "0.0", self.my_material_style])
+                returncode = self.write_and_convert(context, executable_path, pool, output_path, filepath, [context_object], subdirname, packed_texture_filenames)
 
-                if result.returncode != 0:
+                if returncode != 0:
                     self.clean_temporary_files(subdirname, output_path, packed_texture_filenames)
                     return {'CANCELLED'}
         else:
-            write_some_data(context, output_path, context_objects, self.use_animation, self.my_animation_offset, self.my_animation_type, True if self.use_rigify_armature or self.use_only_selected_deform_bones else self.use_only_deform_bones, self.use_rigify_armature, self.use_rigify_root_bone, self.use_only_selected_deform_bones, self.my_max_bone_influences, self.use_vertex_animation, self.use_vertex_format, self.use_vertex_space, self.my_vertex_frame_start, self.my_vertex_frame_end, self.use_edge_crease, self.my_edge_crease_scale, self.my_edge_smoothing, self.use_apply_modifiers, self.use_include_armature_deform_modifier, self.use_concatenate_all, self.use_embed_media, self.use_copy_texture, subdirname, packed_texture_filenames)
-
             # add extension if not exists
             filepath = bpy.path.ensure_ext(self.filepath, self.my_file_type)
-            result = subprocess.run([executable_path, output_path, filepath, str(self.my_scale), self.my_fbx_format, self.my_fbx_version, self.my_fbx_axis, "None", "None", "True" if self.use_optimize_for_game_engine else "False", "True" if self.use_ignore_armature_node else "False", "True" if self.use_reset_mesh_origin else "False", "None", "True" if self.use_triangulate else "False", "None", self.my_edge_smoothing, "True" if self.use_embed_media else "False", str(self.my_simplify_keyframe_factor) if self.use_simplify_keyframe else "0.0", self.my_material_style])
+            returncode = self.write_and_convert(context, executable_path, pool, output_path, filepath, context_objects, subdirname, packed_texture_filenames)
 
-            if result.returncode != 0:
+            if returncode != 0:
                 self.clean_temporary_files(subdirname, output_path, packed_texture_filenames)
                 return {'CANCELLED'}
 
@@ -5,10 +5,13 @@ import mathutils
 import sys
 import os
 import time
-import platform
-import subprocess
 import uuid
+import functools
+import itertools
+import numpy as np
 from bpy.props import *
+from . import intermediate
+from . import converter
 
 
 def is_ill_matrix(matrix):
@@ -23,6 +26,47 @@ def compose_matrix(pose):
     return mathutils.Matrix([pose[0:4], pose[4:8], pose[8:12], pose[12:]]).transposed()
 
 
+# indexes of the parsed hierarchy, built once after parsing
+class SceneGraph:
+    def __init__(self, hierarchy_dic, node_dic):
+        # bone key: armature key
+        self.armature_keys = {}
+        # armature key: [bone key], parents before children
+        self.bone_keys = {}
+        # (node key, action name): pose key index
+        self.pose_keys = {}
+        for (key, hierarchy) in hierarchy_dic.items():
+            if hierarchy[0] == 'ARMATURE':
+                self.bone_keys[key] = []
+            elif hierarchy[0] == 'BONE':
+                tokens = key.split(".")
+                if len(tokens) == 2:
+                    self.armature_keys[key] = tokens[0]
+        # keep the order of the file, but move parents in front of their children
+        visited = set()
+        for (bone_key, armature_key) in self.armature_keys.items():
+            if armature_key not in self.bone_keys:
+                continue
+            chain = []
+            key = bone_key
+            while key not in visited and self.armature_keys.get(key) == armature_key:
+                visited.add(key)
+                chain.append(key)
+                key = hierarchy_dic[key][2]
+            self.bone_keys[armature_key].extend(reversed(chain))
+        for (key, node) in node_dic.items():
+            for action in node.get('PoseKey', []):
+                # the first pose key of an action wins
+                self.pose_keys.setdefault((key, action[0]), action[1])
+
+    # return the armature key of a bone, or None if the key is not a bone key
+    def get_armature_key(self, key):
+        return self.armature_keys.get(key)
+
+    def get_bone_keys(self, armature_key):
+        return self.bone_keys.get(armature_key, [])
+
+
 def load_unique_image(filename, max_uv):
     result = None
     for image in bpy.data.images:
@@ -285,6 +329,120 @@ def make_light_dic(context, hierarchy_dic, node_dic, bind_pose_dic, light_dic, m
                 ob.select_set(True)
 
 
+# return (loop count per polygon, vertex index per loop), a missing polygon has no loops
+def flatten_polygons(polygons):
+    polygons = [polygon if polygon != None else [] for polygon in polygons]
+    loop_totals = np.fromiter((len(polygon) for polygon in polygons), dtype=np.int32, count=len(polygons))
+    indices = np.fromiter(itertools.chain.from_iterable(polygons), dtype=np.int32, count=int(loop_totals.sum()))
+    return (loop_totals, indices)
+
+
+# return a mask of the polygons which can be built, a polygon needs at least 3 distinct existing vertices
+def get_valid_polygons(loop_totals, indices, vertex_count):
+    valid = loop_totals >= 3
+    polygon_indices = np.repeat(np.arange(len(loop_totals)), loop_totals)
+    # vertex does not exist
+    valid[polygon_indices[(indices < 0) | (indices >= vertex_count)]] = False
+    # vertex is used twice by the same polygon
+    order = np.lexsort((indices, polygon_indices))
+    (sorted_polygons, sorted_indices) = (polygon_indices[order], indices[order])
+    duplicated = (sorted_polygons[1:] == sorted_polygons[:-1]) & (sorted_indices[1:] == sorted_indices[:-1])
+    valid[sorted_polygons[1:][duplicated]] = False
+    return valid
+
+
+# keep the items of the built polygons or loops, mask is None if every polygon is built
+def mask_items(items, mask):
+    if mask is None:
+        return items
+    if isinstance(items, list):
+        return np.asarray(items)[mask].tolist()
+    return items[mask]
+
+
+# return float32 loop values with exactly loop_count rows, missing rows are zero
+def fit_loop_values(values, loop_count):
+    values = np.asarray(values, dtype=np.float32)
+    if len(values) >= loop_count:
+        return values[:loop_count]
+    result = np.zeros((loop_count, values.shape[1]), dtype=np.float32)
+    result[:len(values)] = values
+    return result
+
+
+# return int32 polygon values with exactly polygon_count rows, missing rows are zero
+def fit_polygon_values(values, polygon_count):
+    if isinstance(values, list):
+        # polygons without a line keep the first slot
+        values = [value if value != None else 0 for value in values]
+    values = np.asarray(values, dtype=np.int32)[:polygon_count]
+    result = np.zeros(polygon_count, dtype=np.int32)
+    result[:len(values)] = values
+    return result
+
+
+# add a uv layer, return None if the mesh can not have more uv layers
+def new_uv_layer(me, name):
+    if bpy.app.version < (2, 80):
+        uv_texture = me.uv_textures.new(name=name)
+        return me.uv_layers[uv_texture.name] if uv_texture != None else None
+    return me.uv_layers.new(name=name, do_init=False)
+
+
+# return the vertex pairs of the edges, shape (edge count, 2)
+def get_edge_vertices(me):
+    vertices = np.empty(len(me.edges) * 2, dtype=np.int32)
+    me.edges.foreach_get("vertices", vertices)
+    return vertices.reshape(-1, 2)
+
+
+# return one key per vertex pair, which does not depend on the order of the two vertices
+def get_edge_keys(pairs, vertex_count):
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    return pairs.min(axis=1) * vertex_count + pairs.max(axis=1)
+
+
+# return (edge mask, pair index per edge) of the edges which match one of the vertex pairs, the last pair of an edge wins
+def match_edges(edge_vertices, pairs, vertex_count):
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    edge_keys = get_edge_keys(edge_vertices, vertex_count)
+    # pairs with unknown vertices match no edge
+    pair_indices = np.flatnonzero(((pairs >= 0) & (pairs < vertex_count)).all(axis=1))
+    if len(pair_indices) == 0:
+        return (np.zeros(len(edge_keys), dtype=bool), np.zeros(len(edge_keys), dtype=np.int64))
+    pair_keys = get_edge_keys(pairs[pair_indices], vertex_count)
+    (unique_keys, reversed_positions) = np.unique(pair_keys[::-1], return_index=True)
+    unique_indices = pair_indices[len(pair_keys) - 1 - reversed_positions]
+    positions = np.minimum(np.searchsorted(unique_keys, edge_keys), len(unique_keys) - 1)
+    return (unique_keys[positions] == edge_keys, unique_indices[positions])
+
+
+# return per group whether its rows hold more than one distinct value
+def has_multiple_values(groups, values, group_count):
+    reference = np.zeros((group_count, values.shape[1]), dtype=values.dtype)
+    reference[groups] = values
+    differs = np.any(values != reference[groups], axis=1)
+    result = np.zeros(group_count, dtype=bool)
+    result[groups[differs]] = True
+    return result
+
+
+# fill an empty mesh from flat arrays in one go
+def build_mesh(me, vertices, loop_totals, indices):
+    me.vertices.add(len(vertices))
+    me.loops.add(len(indices))
+    me.polygons.add(len(loop_totals))
+    me.vertices.foreach_set("co", np.ascontiguousarray(vertices, dtype=np.float32).ravel())
+    me.loops.foreach_set("vertex_index", indices)
+    loop_starts = np.zeros(len(loop_totals), dtype=np.int32)
+    np.cumsum(loop_totals[:-1], out=loop_starts[1:])
+    me.polygons.foreach_set("loop_start", loop_starts)
+    # loop total is derived from the loop starts in newer versions
+    if not me.polygons.bl_rna.properties["loop_total"].is_readonly:
+        me.polygons.foreach_set("loop_total", loop_totals)
+    me.update(calc_edges=True)
+
+
 def make_mesh_dic(context, hierarchy_dic, node_dic, bind_pose_dic, vertex_dic, polygon_dic, uv_dic, color_dic, normal_dic, polygon_material_dic, mesh_material_dic, material_dic, exist_object_dic, my_import_normal, my_shade_mode, use_auto_smooth, my_angle, edge_crease_dic, use_edge_crease, my_edge_crease_scale, my_edge_smoothing, edge_smoothing_dic, use_import_materials, obj_name, my_rotation_mode):
     for (key, hierarchy) in hierarchy_dic.items():
         if hierarchy[0] == 'MESH':
@@ -321,61 +479,42 @@ def make_mesh_dic(context, hierarchy_dic, node_dic, bind_pose_dic, vertex_dic, p
                 # create a new empty mesh
                 me = bpy.data.meshes.new(name=mesh_name)
                 exist_object_dic[keyword] = me
-                # create a new bmesh
-                bm = bmesh.new()
+                vertices = vertex_dic[vertex_index]
+                (loop_totals, indices) = flatten_polygons(polygon_dic[polygon_index])
+                # the loop data is padded to the loops of the mesh
+                loop_sections = [("UV", uv_dic), ("Color", color_dic)] + ([("Normal", normal_dic)] if my_import_normal == 'Import' else [])
+                is_loop_data_missing = any([len(dic[item[1]]) < len(indices) for (section, dic) in loop_sections for item in node.get(section, [])])
+                # leave out the polygons which can not be built, and their loops
+                polygon_mask = get_valid_polygons(loop_totals, indices, len(vertices))
+                loop_mask = None
+                if polygon_mask.all():
+                    polygon_mask = None
+                else:
+                    print("skip {} invalid polygons".format(len(polygon_mask) - int(polygon_mask.sum())))
+                    loop_mask = np.repeat(polygon_mask, loop_totals)
+                    (loop_totals, indices) = (loop_totals[polygon_mask], indices[loop_mask])
                 # add some geometry
-                for v_co in vertex_dic[vertex_index]:
-                    bm.verts.new(v_co)
-                bm.verts.ensure_lookup_table()
-                for indices in polygon_dic[polygon_index]:
-                    bm.faces.new([bm.verts[index] for index in indices])
-                # write the bmesh to the mesh
-                bm.to_mesh(me)
-                me.update()
-                bm.free()  # free and prevent further access
-                # create a new layer
-                if 'UV' in node:
-                    # add uv layers
-                    bm = bmesh.new()
-                    bm.from_mesh(me)
-                    # multiple uv sets
-                    for uv in node['UV']:
-                        uv_name = uv[0]
-                        uv_index = uv[1]
-                        uvs = uv_dic[uv_index]
-                        uv_layer = bm.loops.layers.uv.new(uv_name)
+                build_mesh(me, vertices, loop_totals, indices)
+                loop_count = len(me.loops)
+                # multiple uv sets
+                for uv in node.get('UV', []):
+                    uv_name = uv[0]
+                    uv_index = uv[1]
+                    uv_layer = new_uv_layer(me, uv_name)
+                    if uv_layer != None:
+                        uvs = fit_loop_values(mask_items(uv_dic[uv_index], loop_mask), loop_count)
+                        uv_layer.data.foreach_set("uv", uvs.ravel())
+                # multiple color sets
+                for color in node.get('Color', []):
+                    color_name = color[0]
+                    color_index = color[1]
+                    color_layer = me.vertex_colors.new(name=color_name)
+                    if color_layer != None:
+                        colors = fit_loop_values(mask_items(color_dic[color_index], loop_mask), loop_count)
+                        # no alpha before 2.80
                         if bpy.app.version < (2, 80):
-                            bm.faces.layers.tex.verify()
-                        else:
-                            bm.faces.layers.face_map.verify()
-                        for (i, f) in enumerate(bm.faces):
-                            for (j, l) in enumerate(f.loops):
-                                luv = l[uv_layer]
-                                luv.uv = (uvs[i][j][0], uvs[i][j][1])
-                    bm.to_mesh(me)
-                    me.update()
-                    bm.free  # free and prevent further access
-                # create a new layer
-                if 'Color' in node:
-                    # add color layers
-                    bm = bmesh.new()
-                    bm.from_mesh(me)
-                    # multiple color sets
-                    for color in node['Color']:
-                        color_name = color[0]
-                        color_index = color[1]
-                        colors = color_dic[color_index]
-                        color_layer = bm.loops.layers.color.new(color_name)
-                        for (i, f) in enumerate(bm.faces):
-                            for (j, l) in enumerate(f.loops):
-                                lcolor = l[color_layer]
-                                if bpy.app.version < (2, 80):
-                                    (lcolor[0], lcolor[1], lcolor[2]) = (colors[i][j][0], colors[i][j][1], colors[i][j][2])
-                                else:
-                                    (lcolor[0], lcolor[1], lcolor[2], lcolor[3]) = (colors[i][j][0], colors[i][j][1], colors[i][j][2], colors[i][j][3])
-                    bm.to_mesh(me)
-                    me.update()
-                    bm.free  # free and prevent further access
+                            colors = colors[:, :3]
+                        color_layer.data.foreach_set("color", np.ascontiguousarray(colors).ravel())
                 if use_import_materials:
                     # add mesh material
                     if 'MeshMaterial' in node:
@@ -387,9 +526,12 @@ def make_mesh_dic(context, hierarchy_dic, node_dic, bind_pose_dic, vertex_dic, p
                     # assign material index for each polygon
                     if 'PolygonMaterial' in node:
                         polygon_material_index = node['PolygonMaterial'][0][1]
-                        polygon_materials = polygon_material_dic[polygon_material_index]
-                        for (i, material_index) in enumerate(polygon_materials):
-                            me.polygons[i].material_index = material_index
+                        polygon_materials = fit_polygon_values(mask_items(polygon_material_dic[polygon_material_index], polygon_mask), len(me.polygons))
+                        me.polygons.foreach_set("material_index", polygon_materials)
+                # let blender fix the geometry which get_valid_polygons does not catch, when polygons were left out or loop data is missing
+                if polygon_mask is not None or is_loop_data_missing:
+                    if me.validate():
+                        print("fixed invalid geometry of {}".format(mesh_name))
                 # create a new object
                 ob = bpy.data.objects.new(mesh_name, me)
                 # change default rotation mode from euler('XYZ') to quaternion
@@ -412,22 +554,13 @@ def make_mesh_dic(context, hierarchy_dic, node_dic, bind_pose_dic, vertex_dic, p
                     ob.select_set(True)
                 # use imported normals
                 if my_import_normal == 'Import' and 'Normal' in node:
-                    # create empty split vertex normals
-                    ob.data.create_normals_split()
-                    # fill split vertex normals, we just use the first normal set.
+                    # we just use the first normal set.
                     normal_index = node['Normal'][0][1]
-                    normals = normal_dic[normal_index]
-                    for (i, polygon) in enumerate(ob.data.polygons):
-                        for (j, loop_index) in enumerate(polygon.loop_indices):
-                            ob.data.loops[loop_index].normal = (normals[i][j][0], normals[i][j][1], normals[i][j][2])
-                    # apply split vertex normals
-                    loop_normals = [loop.normal for loop in ob.data.loops]
+                    normals = fit_loop_values(mask_items(normal_dic[normal_index], loop_mask), len(ob.data.loops))
                     # set smooth for each polygons
-                    ob.data.polygons.foreach_set("use_smooth", [True] * len(ob.data.polygons))
+                    ob.data.polygons.foreach_set("use_smooth", np.ones(len(ob.data.polygons), dtype=bool))
                     # define polygon loop normals
-                    ob.data.normals_split_custom_set(loop_normals)
-                    # free split vertex normals
-                    ob.data.free_normals_split()
+                    ob.data.normals_split_custom_set(normals)
                     # auto display split vertex normals
                     ob.data.use_auto_smooth = True
                 # generate normals
@@ -451,91 +584,64 @@ def make_mesh_dic(context, hierarchy_dic, node_dic, bind_pose_dic, vertex_dic, p
                 if use_edge_crease:
                     if 'EdgeCrease' in node:
                         edge_crease_index = node['EdgeCrease'][0][1]
-                        edge_creases = edge_crease_dic[edge_crease_index]
-                        # make a edge crease map to increase the search speed.
-                        edge_crease_map = {}
-                        for edge_crease in edge_creases:
-                            edge_crease_map[(edge_crease[0], edge_crease[1])] = edge_crease[2]
-                        for edge in ob.data.edges:
-                            edge_vertex_pair1 = (edge.vertices[0], edge.vertices[1])
-                            if edge_vertex_pair1 in edge_crease_map:
-                                edge.crease = edge_crease_map[edge_vertex_pair1] * my_edge_crease_scale
-                            edge_vertex_pair2 = (edge.vertices[1], edge.vertices[0])
-                            if edge_vertex_pair2 in edge_crease_map:
-                                edge.crease = edge_crease_map[edge_vertex_pair2] * my_edge_crease_scale
+                        # (vertex 0, vertex 1, crease) per row
+                        edge_creases = np.array([edge_crease for edge_crease in edge_crease_dic[edge_crease_index] if edge_crease != None], dtype=np.float64).reshape(-1, 3)
+                        (matched, crease_indices) = match_edges(get_edge_vertices(ob.data), edge_creases[:, :2], len(ob.data.vertices))
                         ob.data.use_customdata_edge_crease = True
+                        creases = np.empty(len(ob.data.edges), dtype=np.float32)
+                        ob.data.edges.foreach_get("crease", creases)
+                        creases[matched] = np.clip(edge_creases[crease_indices[matched], 2] * my_edge_crease_scale, 0.0, 1.0)
+                        ob.data.edges.foreach_set("crease", creases)
                 # set edge smoothing
                 if my_edge_smoothing == 'Import' or my_edge_smoothing == 'FBXSDK':
                     if 'EdgeSmoothing' in node:
                         edge_smoothing_index = node['EdgeSmoothing'][0][1]
-                        edge_smoothings = edge_smoothing_dic[edge_smoothing_index]
-                        # make a edge smoothing set to increase the search speed.
-                        edge_smoothing_set = set()
-                        for edge_smoothing in edge_smoothings:
-                            edge_smoothing_set.add((edge_smoothing[0], edge_smoothing[1]))
-                        for edge in ob.data.edges:
-                            edge_vertex_pair1 = (edge.vertices[0], edge.vertices[1])
-                            if edge_vertex_pair1 in edge_smoothing_set:
-                                edge.use_edge_sharp = True
-                            edge_vertex_pair2 = (edge.vertices[1], edge.vertices[0])
-                            if edge_vertex_pair2 in edge_smoothing_set:
-                                edge.use_edge_sharp = True
+                        edge_smoothings = [edge_smoothing for edge_smoothing in edge_smoothing_dic[edge_smoothing_index] if edge_smoothing != None]
+                        (matched, _) = match_edges(get_edge_vertices(ob.data), edge_smoothings, len(ob.data.vertices))
+                        sharp_edges = np.empty(len(ob.data.edges), dtype=bool)
+                        ob.data.edges.foreach_get("use_edge_sharp", sharp_edges)
+                        ob.data.edges.foreach_set("use_edge_sharp", sharp_edges | matched)
                 elif my_edge_smoothing == 'Blender':
                     # not flat shading
                     if not (not (my_import_normal == 'Import' and 'Normal' in node) and not (my_shade_mode == 'Smooth')):
                         # generate polygon loop normals
                         if not (my_import_normal == 'Import' and 'Normal' in node):
                             ob.data.calc_normals_split()
-                        # prepare to mark sharp edges
-                        vertex_normals_dict = {}
-                        edge_polygon_dict = {}
-                        edge_normals_dic = {}
+                        # loop normals, 3 floats per loop
                         if not (my_import_normal == 'Import' and 'Normal' in node):
-                            for (i, polygon) in enumerate(ob.data.polygons):
-                                # how many normals per vertex
-                                for (j, loop_index) in enumerate(polygon.loop_indices):
-                                    if vertex_normals_dict.get(ob.data.loops[loop_index].vertex_index) is None:
-                                        vertex_normals_dict[ob.data.loops[loop_index].vertex_index] = set()
-                                    vertex_normals_dict[ob.data.loops[loop_index].vertex_index].add(tuple(ob.data.loops[loop_index].normal))
-                                # how many polygons per edge
-                                for key in polygon.edge_keys:
-                                    if edge_polygon_dict.get(key) is None:
-                                        edge_polygon_dict[key] = 0
-                                    edge_polygon_dict[key] += 1
-                                    if edge_normals_dic.get(key) is None:
-                                        edge_normals_dic[key] = set()
-                                    edge_normals_dic[key].add(tuple(polygon.normal))
+                            loop_normals = np.empty(len(me.loops) * 3, dtype=np.float32)
+                            me.loops.foreach_get("normal", loop_normals)
+                            loop_normals = loop_normals.reshape(-1, 3)
                         else:
                             normal_index = node['Normal'][0][1]
-                            normals = normal_dic[normal_index]
-                            for (i, polygon) in enumerate(ob.data.polygons):
-                                # how many normals per vertex
-                                for (j, loop_index) in enumerate(polygon.loop_indices):
-                                    if vertex_normals_dict.get(ob.data.loops[loop_index].vertex_index) is None:
-                                        vertex_normals_dict[ob.data.loops[loop_index].vertex_index] = set()
-                                    vertex_normals_dict[ob.data.loops[loop_index].vertex_index].add((normals[i][j][0], normals[i][j][1], normals[i][j][2]))
-                                # how many polygons per edge
-                                for key in polygon.edge_keys:
-                                    if edge_polygon_dict.get(key) is None:
-                                        edge_polygon_dict[key] = 0
-                                    edge_polygon_dict[key] += 1
-                                    if edge_normals_dic.get(key) is None:
-                                        edge_normals_dic[key] = set()
-                                    edge_normals_dic[key].add(tuple(polygon.normal))
+                            loop_normals = fit_loop_values(mask_items(normal_dic[normal_index], loop_mask), len(me.loops))
+                        loop_vertices = np.empty(len(me.loops), dtype=np.int32)
+                        me.loops.foreach_get("vertex_index", loop_vertices)
+                        loop_edges = np.empty(len(me.loops), dtype=np.int32)
+                        me.loops.foreach_get("edge_index", loop_edges)
+                        # normal of the polygon of each loop
+                        polygon_normals = np.empty(len(me.polygons) * 3, dtype=np.float32)
+                        me.polygons.foreach_get("normal", polygon_normals)
+                        polygon_loop_totals = np.empty(len(me.polygons), dtype=np.int32)
+                        me.polygons.foreach_get("loop_total", polygon_loop_totals)
+                        loop_polygon_normals = np.repeat(polygon_normals.reshape(-1, 3), polygon_loop_totals, axis=0)
                         # free polygon loop normals
                         if not (my_import_normal == 'Import' and 'Normal' in node):
-                            ob.data.free_normals_split()
-                        # mark sharp edges
-                        for edge in ob.data.edges:
-                            # mark loose edge as sharp
-                            if edge.is_loose:
-                                edge.use_edge_sharp = True
-                            # mark boundary edge as sharp
-                            if edge_polygon_dict[edge.key] == 1:
-                                edge.use_edge_sharp = True
-                            # mark edge which both two vertices have multiple normals and the edge shares multiple face normals as sharp
-                            if len(vertex_normals_dict[edge.vertices[0]]) > 1 and len(vertex_normals_dict[edge.vertices[1]]) > 1 and len(edge_normals_dic[edge.key]) > 1:
-                                edge.use_edge_sharp = True
+                            me.free_normals_split()
+                        # how many normals per vertex
+                        split_vertices = has_multiple_values(loop_vertices, loop_normals, len(me.vertices))
+                        # how many polygons and polygon normals per edge
+                        edge_polygon_counts = np.bincount(loop_edges, minlength=len(me.edges))
+                        split_edges = has_multiple_values(loop_edges, loop_polygon_normals, len(me.edges))
+                        edge_vertices = get_edge_vertices(me)
+                        # mark loose edge and boundary edge as sharp
+                        sharp_edges = edge_polygon_counts <= 1
+                        # mark edge which both two vertices have multiple normals and the edge shares multiple face normals as sharp
+                        sharp_edges |= split_vertices[edge_vertices[:, 0]] & split_vertices[edge_vertices[:, 1]] & split_edges
+                        # keep sharp edges which are already marked
+                        marked_edges = np.empty(len(me.edges), dtype=bool)
+                        me.edges.foreach_get("use_edge_sharp", marked_edges)
+                        me.edges.foreach_set("use_edge_sharp", marked_edges | sharp_edges)
                         # show sharp edges
                         if bpy.app.version < (2, 80):
                             ob.data.show_edge_sharp = True
@@ -594,15 +700,14 @@ def make_custom_property(context, ob, custom_property_dic, custom_property_index
             ob[custom_property[0]] = [float(item) for item in custom_property[2:]]
 
 
-def make_custom_property_dic(context, hierarchy_dic, node_dic, custom_property_dic):
+def make_custom_property_dic(context, hierarchy_dic, node_dic, custom_property_dic, scene_graph):
     for (key, hierarchy) in hierarchy_dic.items():
         node = node_dic[key]
         if 'CustomProperty' in node:
             if hierarchy[0] != 'BONE':
                 ob = node['Object']
             else:
-                tokens = key.split(".")
-                armature_key = tokens[0]
+                armature_key = scene_graph.get_armature_key(key)
                 armature_node = node_dic[armature_key]
                 armature = armature_node['Object']
                 bone_name = hierarchy[1]
@@ -612,12 +717,11 @@ def make_custom_property_dic(context, hierarchy_dic, node_dic, custom_property_d
                 make_custom_property(context, ob, custom_property_dic, custom_property_index)
 
 
-def make_ik_dic(context, hierarchy_dic, node_dic, ik_dic):
+def make_ik_dic(context, hierarchy_dic, node_dic, ik_dic, scene_graph):
     for (key, hierarchy) in hierarchy_dic.items():
         node = node_dic[key]
         if 'IK' in node:
-            tokens = key.split(".")
-            armature_key = tokens[0]
+            armature_key = scene_graph.get_armature_key(key)
             armature_node = node_dic[armature_key]
             armature = armature_node['Object']
             bone_name = hierarchy[1]
@@ -632,7 +736,7 @@ def make_ik_dic(context, hierarchy_dic, node_dic, ik_dic):
             ik_constraint.use_tail = False
 
 
-def make_armature_dic(context, hierarchy_dic, node_dic, bind_pose_dic, my_leaf_bone, use_auto_bone_orientation, my_bone_length, my_calculate_roll, obj_name, my_rotation_mode):
+def make_armature_dic(context, hierarchy_dic, node_dic, bind_pose_dic, my_leaf_bone, use_auto_bone_orientation, my_bone_length, my_calculate_roll, obj_name, my_rotation_mode, scene_graph):
     for (key, hierarchy) in hierarchy_dic.items():
         if hierarchy[0] == 'ARMATURE':
             leaf_bone_scale = 1.0 if my_leaf_bone == 'Long' else 0.1
@@ -665,102 +769,86 @@ def make_armature_dic(context, hierarchy_dic, node_dic, bind_pose_dic, my_leaf_b
             # must be in edit mode to add bones
             bpy.ops.object.mode_set(mode='EDIT', toggle=False)
             edit_bones = ob.data.edit_bones
-            for (key2, hierarchy2) in hierarchy_dic.items():
-                if hierarchy2[0] == 'BONE':
-                    bone_key = key2
-                    bone_name = hierarchy2[1]
-                    tokens = bone_key.split(".")
-                    if len(tokens) == 2 and tokens[0] == armature_key:
-                        bone_node = node_dic[bone_key]
-                        b = edit_bones.new(bone_name)
-                        # set bone length
-                        b.head = (0.0, 0.0, 0.0)
-                        b.tail = (0.0, 0.0, my_bone_length)
-                        # add to dictionary for later use
-                        bone_node['Object'] = b
-                        # we also need bone name for later use
-                        bone_node['ObjectName'] = b.name
-                        pose = bind_pose_dic[bone_node['BindPose'][0][1]]
-                        matrix = compose_matrix(pose)
-                        # make armature space matrix
-                        if bpy.app.version < (2, 80):
-                            matrix = inverse_armature_matrix * matrix
-                        else:
-                            matrix = inverse_armature_matrix @ matrix
-                        # sometimes matrix has negative scale, in this case, we have to reconstruct the matrix.
-                        if matrix.is_negative:
-                            # decompose matrix to channels
-                            loc, rot, sca = matrix.decompose()
-                            mat_t = mathutils.Matrix.Translation(loc)
-                            mat_r = rot.to_matrix().to_4x4()
-                            if bpy.app.version < (2, 80):
-                                mat_s = mathutils.Matrix.Scale(abs(sca[0]), 4, (1.0, 0.0, 0.0)) * mathutils.Matrix.Scale(abs(sca[1]), 4, (0.0, 1.0, 0.0)) * mathutils.Matrix.Scale(abs(sca[2]), 4, (0.0, 0.0, 1.0))
-                                matrix = mat_t * mat_r * mat_s
-                            else:
-                                mat_s = mathutils.Matrix.Scale(abs(sca[0]), 4, (1.0, 0.0, 0.0)) @ mathutils.Matrix.Scale(abs(sca[1]), 4, (0.0, 1.0, 0.0)) @ mathutils.Matrix.Scale(abs(sca[2]), 4, (0.0, 0.0, 1.0))
-                                matrix = mat_t @ mat_r @ mat_s
-                        b.matrix = mathutils.Matrix() if is_ill_matrix(matrix) else matrix
+            bone_keys = scene_graph.get_bone_keys(armature_key)
+            for bone_key in bone_keys:
+                bone_name = hierarchy_dic[bone_key][1]
+                bone_node = node_dic[bone_key]
+                b = edit_bones.new(bone_name)
+                # set bone length
+                b.head = (0.0, 0.0, 0.0)
+                b.tail = (0.0, 0.0, my_bone_length)
+                # add to dictionary for later use
+                bone_node['Object'] = b
+                # we also need bone name for later use
+                bone_node['ObjectName'] = b.name
+                pose = bind_pose_dic[bone_node['BindPose'][0][1]]
+                matrix = compose_matrix(pose)
+                # make armature space matrix
+                if bpy.app.version < (2, 80):
+                    matrix = inverse_armature_matrix * matrix
+                else:
+                    matrix = inverse_armature_matrix @ matrix
+                # sometimes matrix has negative scale, in this case, we have to reconstruct the matrix.
+                if matrix.is_negative:
+                    # decompose matrix to channels
+                    loc, rot, sca = matrix.decompose()
+                    mat_t = mathutils.Matrix.Translation(loc)
+                    mat_r = rot.to_matrix().to_4x4()
+                    if bpy.app.version < (2, 80):
+                        mat_s = mathutils.Matrix.Scale(abs(sca[0]), 4, (1.0, 0.0, 0.0)) * mathutils.Matrix.Scale(abs(sca[1]), 4, (0.0, 1.0, 0.0)) * mathutils.Matrix.Scale(abs(sca[2]), 4, (0.0, 0.0, 1.0))
+                        matrix = mat_t * mat_r * mat_s
+                    else:
+                        mat_s = mathutils.Matrix.Scale(abs(sca[0]), 4, (1.0, 0.0, 0.0)) @ mathutils.Matrix.Scale(abs(sca[1]), 4, (0.0, 1.0, 0.0)) @ mathutils.Matrix.Scale(abs(sca[2]), 4, (0.0, 0.0, 1.0))
+                        matrix = mat_t @ mat_r @ mat_s
+                b.matrix = mathutils.Matrix() if is_ill_matrix(matrix) else matrix
             # set parent for bones
-            for (key2, hierarchy2) in hierarchy_dic.items():
-                if hierarchy2[0] == 'BONE':
-                    bone_key = key2
-                    tokens = bone_key.split(".")
-                    if len(tokens) == 2 and tokens[0] == armature_key:
-                        parent_key = hierarchy2[2]
-                        tokens2 = parent_key.split(".")
-                        # in same bone hierarchy
-                        if len(tokens2) == 2 and tokens2[0] == armature_key:
-                            bone_node = node_dic[bone_key]
-                            parent_node = node_dic[parent_key]
-                            bone_node['Object'].parent = parent_node['Object']
+            for bone_key in bone_keys:
+                parent_key = hierarchy_dic[bone_key][2]
+                # in same bone hierarchy
+                if scene_graph.get_armature_key(parent_key) == armature_key:
+                    bone_node = node_dic[bone_key]
+                    parent_node = node_dic[parent_key]
+                    bone_node['Object'].parent = parent_node['Object']
             if use_auto_bone_orientation:
                 # calculate old local matrix
-                for (key2, hierarchy2) in hierarchy_dic.items():
-                    if hierarchy2[0] == 'BONE':
-                        bone_key = key2
-                        tokens = bone_key.split(".")
-                        if len(tokens) == 2 and tokens[0] == armature_key:
-                            bone_node = node_dic[bone_key]
-                            parent_key = hierarchy2[2]
-                            parent_node = node_dic[parent_key]
-                            if bpy.app.version < (2, 80):
-                                mat_parent = mathutils.Matrix() if parent_key == armature_key else mathutils.Matrix.Translation(parent_node['Object'].tail - parent_node['Object'].head) * parent_node['Object'].matrix
-                                old_mat_local = mat_parent.inverted() * bone_node['Object'].matrix
-                            else:
-                                mat_parent = mathutils.Matrix() if parent_key == armature_key else mathutils.Matrix.Translation(parent_node['Object'].tail - parent_node['Object'].head) @ parent_node['Object'].matrix
-                                old_mat_local = mat_parent.inverted() @ bone_node['Object'].matrix
-                            # save for later use
-                            bone_node['MatParent'] = mat_parent
-                            bone_node['OldMatLocal'] = old_mat_local
+                for bone_key in bone_keys:
+                    bone_node = node_dic[bone_key]
+                    parent_key = hierarchy_dic[bone_key][2]
+                    parent_node = node_dic[parent_key]
+                    if bpy.app.version < (2, 80):
+                        mat_parent = mathutils.Matrix() if parent_key == armature_key else mathutils.Matrix.Translation(parent_node['Object'].tail - parent_node['Object'].head) * parent_node['Object'].matrix
+                        old_mat_local = mat_parent.inverted() * bone_node['Object'].matrix
+                    else:
+                        mat_parent = mathutils.Matrix() if parent_key == armature_key else mathutils.Matrix.Translation(parent_node['Object'].tail - parent_node['Object'].head) @ parent_node['Object'].matrix
+                        old_mat_local = mat_parent.inverted() @ bone_node['Object'].matrix
+                    # save for later use
+                    bone_node['MatParent'] = mat_parent
+                    bone_node['OldMatLocal'] = old_mat_local
                 # force connect children
-                for (key2, hierarchy2) in hierarchy_dic.items():
-                    if hierarchy2[0] == 'BONE':
-                        bone_key = key2
-                        tokens = bone_key.split(".")
-                        if len(tokens) == 2 and tokens[0] == armature_key:
-                            bone_node = node_dic[bone_key]
-                            b = bone_node['Object']
-                            # average head position of all children
-                            if len(b.children) > 0:
-                                loc = mathutils.Vector((0.0, 0.0, 0.0))
-                                for child in b.children:
-                                    loc += child.head
-                                loc /= len(b.children)
-                            # leaf bone, extrude out a bit.
-                            elif b.parent:
-                                loc = b.head + (b.head - b.parent.head) * leaf_bone_scale
-                            # single bone, use original bone tail
-                            else:
-                                loc = b.tail
-                            # bone length must not be zero
-                            if (loc - b.head).length > 1e-3:
-                                b.tail = loc
-                            # make the bone very short
-                            else:
-                                if bpy.app.version < (2, 80):
-                                    b.tail = b.head + b.matrix * mathutils.Vector((0.0, 1.0, 0.0)) * 0.01
-                                else:
-                                    b.tail = b.head + b.matrix @ mathutils.Vector((0.0, 1.0, 0.0)) * 0.01
+                for bone_key in bone_keys:
+                    bone_node = node_dic[bone_key]
+                    b = bone_node['Object']
+                    # average head position of all children
+                    if len(b.children) > 0:
+                        loc = mathutils.Vector((0.0, 0.0, 0.0))
+                        for child in b.children:
+                            loc += child.head
+                        loc /= len(b.children)
+                    # leaf bone, extrude out a bit.
+                    elif b.parent:
+                        loc = b.head + (b.head - b.parent.head) * leaf_bone_scale
+                    # single bone, use original bone tail
+                    else:
+                        loc = b.tail
+                    # bone length must not be zero
+                    if (loc - b.head).length > 1e-3:
+                        b.tail = loc
+                    # make the bone very short
+                    else:
+                        if bpy.app.version < (2, 80):
+                            b.tail = b.head + b.matrix * mathutils.Vector((0.0, 1.0, 0.0)) * 0.01
+                        else:
+                            b.tail = b.head + b.matrix @ mathutils.Vector((0.0, 1.0, 0.0)) * 0.01
                 # calculate roll for bones
                 if my_calculate_roll != "None":
                     # set bone selection status
@@ -771,35 +859,27 @@ def make_armature_dic(context, hierarchy_dic, node_dic, bind_pose_dic, my_leaf_b
                     for b in ob.data.edit_bones:
                         b.select = False
                 # calculate new local matrix
-                for (key2, hierarchy2) in hierarchy_dic.items():
-                    if hierarchy2[0] == 'BONE':
-                        bone_key = key2
-                        tokens = bone_key.split(".")
-                        if len(tokens) == 2 and tokens[0] == armature_key:
-                            bone_node = node_dic[bone_key]
-                            if bpy.app.version < (2, 80):
-                                new_mat_local = bone_node['MatParent'].inverted() * bone_node['Object'].matrix
-                            else:
-                                new_mat_local = bone_node['MatParent'].inverted() @ bone_node['Object'].matrix
-                            # save for later use
-                            bone_node['NewMatLocal'] = new_mat_local
+                for bone_key in bone_keys:
+                    bone_node = node_dic[bone_key]
+                    if bpy.app.version < (2, 80):
+                        new_mat_local = bone_node['MatParent'].inverted() * bone_node['Object'].matrix
+                    else:
+                        new_mat_local = bone_node['MatParent'].inverted() @ bone_node['Object'].matrix
+                    # save for later use
+                    bone_node['NewMatLocal'] = new_mat_local
                 # calculate inverse correct matrix
-                for (key2, hierarchy2) in hierarchy_dic.items():
-                    if hierarchy2[0] == 'BONE':
-                        bone_key = key2
-                        tokens = bone_key.split(".")
-                        if len(tokens) == 2 and tokens[0] == armature_key:
-                            bone_node = node_dic[bone_key]
-                            if bpy.app.version < (2, 80):
-                                inverse_correct_matrix = bone_node['NewMatLocal'].inverted() * bone_node['OldMatLocal']
-                            else:
-                                inverse_correct_matrix = bone_node['NewMatLocal'].inverted() @ bone_node['OldMatLocal']
-                            # save for later use
-                            bone_node['CorrectPose'] = inverse_correct_matrix.to_quaternion()
-                            # no longer use
-                            del bone_node['MatParent']
-                            del bone_node['OldMatLocal']
-                            del bone_node['NewMatLocal']
+                for bone_key in bone_keys:
+                    bone_node = node_dic[bone_key]
+                    if bpy.app.version < (2, 80):
+                        inverse_correct_matrix = bone_node['NewMatLocal'].inverted() * bone_node['OldMatLocal']
+                    else:
+                        inverse_correct_matrix = bone_node['NewMatLocal'].inverted() @ bone_node['OldMatLocal']
+                    # save for later use
+                    bone_node['CorrectPose'] = inverse_correct_matrix.to_quaternion()
+                    # no longer use
+                    del bone_node['MatParent']
+                    del bone_node['OldMatLocal']
+                    del bone_node['NewMatLocal']
             # exit edit mode to save bones
             bpy.ops.object.mode_set(mode='OBJECT')
 
@@ -823,7 +903,7 @@ def reset_all_matrix_parent_inverses(context, hierarchy_dic, node_dic):
             reset_matrix_parent_inverse(ob)
 
 
-def make_hierarchy_dic(context, hierarchy_dic, node_dic, default_pose_dic, bind_pose_dic):
+def make_hierarchy_dic(context, hierarchy_dic, node_dic, default_pose_dic, bind_pose_dic, scene_graph):
     # set parent for all nodes
     for (key, hierarchy) in hierarchy_dic.items():
         parent_key = hierarchy[2]
@@ -835,9 +915,8 @@ def make_hierarchy_dic(context, hierarchy_dic, node_dic, default_pose_dic, bind_
                 parent_node = node_dic[parent_key]
                 # parent is bone
                 if hierarchy_dic[parent_key][0] == 'BONE':
-                    tokens = parent_key.split(".")
-                    if len(tokens) == 2:
-                        armature_key = tokens[0]
+                    armature_key = scene_graph.get_armature_key(parent_key)
+                    if armature_key != None:
                         armature_node = node_dic[armature_key]
                         # set parent to armature
                         node['Object'].parent = armature_node['Object']
@@ -857,7 +936,7 @@ def make_hierarchy_dic(context, hierarchy_dic, node_dic, default_pose_dic, bind_
                     node['Object'].matrix_parent_inverse = parent_node['Object'].matrix_world.inverted()
 
 
-def fix_bind_pose(context, hierarchy_dic, node_dic, default_pose_dic, bind_pose_dic):
+def fix_bind_pose(context, hierarchy_dic, node_dic, default_pose_dic, bind_pose_dic, scene_graph):
     for (key, hierarchy) in hierarchy_dic.items():
         parent_key = hierarchy[2]
         # ignore root node
@@ -868,8 +947,7 @@ def fix_bind_pose(context, hierarchy_dic, node_dic, default_pose_dic, bind_pose_
                 parent_node = node_dic[parent_key]
                 # parent is bone
                 if hierarchy_dic[parent_key][0] == 'BONE':
-                    tokens = parent_key.split(".")
-                    if len(tokens) == 2:
+                    if scene_graph.get_armature_key(parent_key) != None:
                         parent_bind_matrix = compose_matrix(bind_pose_dic[parent_node['BindPose'][0][1]])
                         parent_default_matrix = compose_matrix(default_pose_dic[parent_node['DefaultPose'][0][1]])
                         node_default_matrix = compose_matrix(default_pose_dic[node['DefaultPose'][0][1]])
@@ -882,16 +960,15 @@ def fix_bind_pose(context, hierarchy_dic, node_dic, default_pose_dic, bind_pose_
                         node['Object'].matrix_world = node_bind_matrix
 
 
-def set_default_pose(context, hierarchy_dic, node_dic, default_pose_dic):
+def set_default_pose(context, hierarchy_dic, node_dic, default_pose_dic, scene_graph):
     for (key, hierarchy) in hierarchy_dic.items():
         if hierarchy[0] == 'BONE':
             bone_node = node_dic[key]
             bone_name = bone_node['ObjectName']
             parent_key = hierarchy[2]
             parent_node = node_dic[parent_key]
-            tokens = key.split(".")
-            if len(tokens) == 2:
-                armature_key = tokens[0]
+            armature_key = scene_graph.get_armature_key(key)
+            if armature_key != None:
                 armature_node = node_dic[armature_key]
                 armature = armature_node['Object']
                 pose_bone = armature.pose.bones[bone_name]
@@ -930,7 +1007,7 @@ def set_default_pose(context, hierarchy_dic, node_dic, default_pose_dic):
                 pose_bone.matrix_basis = node_local_matrix
 
 
-def bind_mesh_to_armature(context, hierarchy_dic, node_dic, weight_dic):
+def bind_mesh_to_armature(context, hierarchy_dic, node_dic, weight_dic, scene_graph):
     for (key, hierarchy) in hierarchy_dic.items():
         if hierarchy[0] == 'MESH':
             mesh_key = key
@@ -947,9 +1024,8 @@ def bind_mesh_to_armature(context, hierarchy_dic, node_dic, weight_dic):
                                 bone_key = weight[0]
                                 bone_node = node_dic[bone_key]
                                 bone_name = bone_node['ObjectName']
-                                tokens = bone_key.split(".")
-                                if len(tokens) == 2:
-                                    armature_key = tokens[0]
+                                armature_key = scene_graph.get_armature_key(bone_key)
+                                if armature_key != None:
                                     armature_key_set.add(armature_key)
                                 bone_weight = weight[1]
                                 # create vertex groups if not exists
@@ -1004,7 +1080,7 @@ def make_fcurves_list(action_ob, ob, parent_bind_pose, bind_pose, parent_pose_li
         local_bind_pose_matrix = parent_bind_pose_matrix.inverted() @ bind_pose_matrix
     for (frame_counter, pose) in enumerate(pose_list):
         key_frame = pose[0]
-        parent_pose_matrix = compose_matrix(parent_pose_list[frame_counter][1:]) if parent_pose_list != None else parent_bind_pose_matrix
+        parent_pose_matrix = compose_matrix(parent_pose_list[frame_counter][1:]) if parent_pose_list is not None else parent_bind_pose_matrix
         pose_matrix = compose_matrix(pose_list[frame_counter][1:])
         if bpy.app.version < (2, 80):
             local_pose_matrix = parent_pose_matrix.inverted() * pose_matrix
@@ -1057,17 +1133,12 @@ def make_fcurves_list(action_ob, ob, parent_bind_pose, bind_pose, parent_pose_li
             channel_scale[i].keyframe_points[frame_counter].interpolation = 'LINEAR'
 
 
-def get_pose_list(pose_key_dic, node, action_name):
-    if node != None and 'PoseKey' in node:
-        action_list = node['PoseKey']
-        for action in action_list:
-            if action_name == action[0]:
-                action_index = action[1]
-                return pose_key_dic[action_index]
-    return None
+def get_pose_list(scene_graph, pose_key_dic, key, action_name):
+    action_index = scene_graph.pose_keys.get((key, action_name))
+    return pose_key_dic[action_index] if action_index != None else None
 
 
-def make_pose_key_dic(context, hierarchy_dic, node_dic, bind_pose_dic, pose_key_dic, my_rotation_mode, my_animation_offset, use_animation_prefix):
+def make_pose_key_dic(context, hierarchy_dic, node_dic, bind_pose_dic, pose_key_dic, my_rotation_mode, my_animation_offset, use_animation_prefix, scene_graph):
     for (key, hierarchy) in hierarchy_dic.items():
         if hierarchy[0] != 'BONE':
             node = node_dic[key]
@@ -1090,7 +1161,7 @@ def make_pose_key_dic(context, hierarchy_dic, node_dic, bind_pose_dic, pose_key_
                     action_ob = bpy.data.actions.new(name=action_name)
                     action_ob.id_root = 'OBJECT'
                     # fill action
-                    parent_pose_list = get_pose_list(pose_key_dic, parent_node, action_name)
+                    parent_pose_list = get_pose_list(scene_graph, pose_key_dic, parent_key, action_name)
                     ob_bind_pose = bind_pose_dic[node['BindPose'][0][1]]
                     ob_parent_bind_pose = bind_pose_dic[parent_node['BindPose'][0][1]] if parent_node != None else None
                     make_fcurves_list(action_ob, ob, ob_parent_bind_pose, ob_bind_pose, parent_pose_list, pose_list, None, ob.type, my_rotation_mode, my_animation_offset)
@@ -1100,30 +1171,19 @@ def make_pose_key_dic(context, hierarchy_dic, node_dic, bind_pose_dic, pose_key_
                         ob.animation_data.action = action_ob
                     if hierarchy[0] == 'ARMATURE':
                         armature_key = key
-                        armature_node = node_dic[armature_key]
-                        for (key2, hierarchy2) in hierarchy_dic.items():
-                            if hierarchy2[0] == 'BONE':
-                                bone_key = key2
-                                tokens = bone_key.split(".")
-                                # same armature
-                                if len(tokens) == 2 and tokens[0] == armature_key:
-                                    bone_node = node_dic[bone_key]
-                                    bone_parent_key = hierarchy2[2]
-                                    bone_parent_node = node_dic[bone_parent_key]
-                                    bone_ob = ob.pose.bones[bone_node['ObjectName']]
-                                    if 'PoseKey' in bone_node:
-                                        bone_action_list = bone_node['PoseKey']
-                                        for bone_action in bone_action_list:
-                                            bone_action_name = bone_action[0]
-                                            # same action
-                                            if bone_action_name == action_name:
-                                                bone_action_index = bone_action[1]
-                                                bone_pose_list = pose_key_dic[bone_action_index]
-                                                # fill action
-                                                bone_parent_pose_list = get_pose_list(pose_key_dic, bone_parent_node, bone_action_name)
-                                                bone_ob_bind_pose = bind_pose_dic[bone_node['BindPose'][0][1]]
-                                                bone_ob_parent_bind_pose = bind_pose_dic[bone_parent_node['BindPose'][0][1]]
-                                                make_fcurves_list(action_ob, bone_ob, bone_ob_parent_bind_pose, bone_ob_bind_pose, bone_parent_pose_list, bone_pose_list, bone_node['CorrectPose'] if 'CorrectPose' in bone_node else None, None, my_rotation_mode, my_animation_offset)
+                        for bone_key in scene_graph.get_bone_keys(armature_key):
+                            # same action
+                            bone_pose_list = get_pose_list(scene_graph, pose_key_dic, bone_key, action_name)
+                            if bone_pose_list != None:
+                                bone_node = node_dic[bone_key]
+                                bone_parent_key = hierarchy_dic[bone_key][2]
+                                bone_parent_node = node_dic[bone_parent_key]
+                                bone_ob = ob.pose.bones[bone_node['ObjectName']]
+                                # fill action
+                                bone_parent_pose_list = get_pose_list(scene_graph, pose_key_dic, bone_parent_key, action_name)
+                                bone_ob_bind_pose = bind_pose_dic[bone_node['BindPose'][0][1]]
+                                bone_ob_parent_bind_pose = bind_pose_dic[bone_parent_node['BindPose'][0][1]]
+                                make_fcurves_list(action_ob, bone_ob, bone_ob_parent_bind_pose, bone_ob_bind_pose, bone_parent_pose_list, bone_pose_list, bone_node['CorrectPose'] if 'CorrectPose' in bone_node else None, None, my_rotation_mode, my_animation_offset)
 
 
 def make_shape_key_dic(context, hierarchy_dic, node_dic, bind_pose_dic, shape_key_dic, my_animation_offset, use_animation_prefix):
@@ -1174,8 +1234,8 @@ def make_vertex_animation(context, hierarchy_dic, node_dic, exist_object_dic):
                     mod.filepath = node['VertexPoseKey'][0][0]
 
 
-def parse_frame_rate(tokens):
-    return float(tokens[1])
+def parse_frame_rate(frame_rate, tokens):
+    frame_rate[0] = float(tokens[1])
 
 
 def parse_hierarchy_dic(hierarchy_dic, tokens):
@@ -1200,12 +1260,96 @@ def parse_bind_pose_dic(bind_pose_dic, tokens):
     bind_pose_dic[int(tokens[1])] = [float(token) for token in tokens[2:]]
 
 
-def parse_pose_key_dic(pose_key_dic, tokens):
+# bulk numeric sections are gathered line by line and converted to a float32 array once all lines of a key are read
+# section name: (values per element, values per line or None if a line holds any number of elements)
+BULK_SECTIONS = {
+    # frame, 16 floats, one frame per line
+    "PoseKey": (17, 17),
+    # 3 floats per vertex, one vertex per line
+    "Vertex": (3, 3),
+    # 2 floats per loop, the loops of one polygon per line
+    "UV": (2, None),
+    # 3 floats per loop, the loops of one polygon per line
+    "Normal": (3, None),
+    # 4 floats per loop, the loops of one polygon per line
+    "Color": (4, None),
+}
+
+
+# return a (element count, width) float32 array, or None if the key can not be used
+# missing lines of a section with a fixed line length are filled with zeros, any other missing line drops the key
+def convert_bulk_lines(section, key, lines):
+    (width, line_length) = BULK_SECTIONS[section]
+    missing_count = lines.count(None)
+    if missing_count > 0:
+        if line_length == None:
+            print("Drop {} {}: {} of {} lines are missing or invalid".format(section, key, missing_count, len(lines)))
+            return None
+        print("Fill {} {} with zeros: {} of {} lines are missing or invalid".format(section, key, missing_count, len(lines)))
+        zeros = ",".join(["0"] * line_length)
+        lines = [line if line != None else zeros for line in lines]
+    # lines of polygons without loops are empty
+    text = ",".join([line for line in lines if len(line) > 0])
+    values = np.fromstring(text, dtype=np.float32, sep=",")
+    # fall back to parse value by value if the text is not a plain list of floats
+    if len(text) > 0 and len(values) != text.count(",") + 1:
+        values = np.array([float(token) for token in text.split(",")], dtype=np.float32)
+    return values.reshape(-1, width)
+
+
+# pending_dic holds the data text of every line of the keys which are not completely read yet
+# tokens are section, key, index, length and the data text, a line whose value count does not fit the section counts as missing
+def parse_bulk_dic(bulk_dic, pending_dic, section, tokens):
     key = int(tokens[1])
-    if key not in pose_key_dic:
+    if key not in pending_dic:
         length = int(tokens[3])
-        pose_key_dic[key] = [None] * length
-    pose_key_dic[key][int(tokens[2])] = [int(tokens[4])] + [float(token) for token in tokens[5:]]
+        pending_dic[key] = [[None] * length, 0]
+    pending = pending_dic[key]
+    lines = pending[0]
+    index = int(tokens[2])
+    if index < 0 or index >= len(lines):
+        return
+    # the data of the line is a single token
+    data = tokens[4] if len(tokens) > 4 else ""
+    (width, line_length) = BULK_SECTIONS[section]
+    value_count = data.count(",") + 1 if len(data) > 0 else 0
+    if value_count % width != 0 or (line_length != None and value_count != line_length):
+        return
+    if lines[index] == None:
+        pending[1] += 1
+    lines[index] = data
+    # convert the whole key at once
+    if pending[1] == len(lines):
+        set_bulk_data(bulk_dic, key, convert_bulk_lines(section, key, lines))
+        del pending_dic[key]
+
+
+# a dropped key is left out of bulk_dic
+def set_bulk_data(bulk_dic, key, data):
+    if data is not None:
+        bulk_dic[key] = data
+
+
+# convert keys with missing lines
+def flush_bulk_dic(bulk_dic, pending_dic, section):
+    for (key, pending) in pending_dic.items():
+        set_bulk_data(bulk_dic, key, convert_bulk_lines(section, key, pending[0]))
+    pending_dic.clear()
+
+
+# forget the node references to bulk data which was dropped
+def remove_dropped_references(node_dic, section, bulk_dic):
+    for node in node_dic.values():
+        if section in node:
+            node[section] = [item for item in node[section] if item[1] in bulk_dic]
+            if len(node[section]) == 0:
+                del node[section]
+
+
+def get_max_uv(uv_dic, max_uv):
+    for uvs in uv_dic.values():
+        if len(uvs) > 0:
+            (max_uv[0], max_uv[1]) = (max(max_uv[0], float(uvs[:, 0].max())), max(max_uv[1], float(uvs[:, 1].max())))
 
 
 def parse_shape_key_dic(shape_key_dic, tokens):
@@ -1216,14 +1360,6 @@ def parse_shape_key_dic(shape_key_dic, tokens):
     shape_key_dic[key][int(tokens[2])] = [int(tokens[4])] + [(int(tokens[i]), float(tokens[i+1])) for i in range(5, len(tokens), 2)]
 
 
-def parse_vertex_dic(vertex_dic, tokens):
-    key = int(tokens[1])
-    if key not in vertex_dic:
-        length = int(tokens[3])
-        vertex_dic[key] = [None] * length
-    vertex_dic[key][int(tokens[2])] = [float(token) for token in tokens[4:]]
-
-
 def parse_weight_dic(weight_dic, tokens):
     key = int(tokens[1])
     if key not in weight_dic:
@@ -1263,40 +1399,6 @@ def parse_mesh_material_dic(mesh_material_dic, tokens):
     mesh_material_dic[int(tokens[1])] = [int(token) for token in tokens[2:]]
 
 
-def parse_uv_dic(uv_dic, tokens, max_uv):
-    key = int(tokens[1])
-    if key not in uv_dic:
-        length = int(tokens[3])
-        uv_dic[key] = [None] * length
-    index = int(tokens[2])
-    uv_dic[key][index] = []
-    for i in range(4, len(tokens), 2):
-        uv = (float(tokens[i]), float(tokens[i+1]))
-        # Add UV to uvlist
-        uv_dic[key][index].append(uv)
-        # get maximum UV
-        if uv[0] > max_uv[0]:
-            max_uv[0] = uv[0]
-        if uv[1] > max_uv[1]:
-            max_uv[1] = uv[1]
-
-
-def parse_normal_dic(normal_dic, tokens):
-    key = int(tokens[1])
-    if key not in normal_dic:
-        length = int(tokens[3])
-        normal_dic[key] = [None] * length
-    normal_dic[key][int(tokens[2])] = [(float(tokens[i]), float(tokens[i+1]), float(tokens[i+2])) for i in range(4, len(tokens), 3)]
-
-
-def parse_color_dic(color_dic, tokens):
-    key = int(tokens[1])
-    if key not in color_dic:
-        length = int(tokens[3])
-        color_dic[key] = [None] * length
-    color_dic[key][int(tokens[2])] = [(float(tokens[i]), float(tokens[i+1]), float(tokens[i+2]), float(tokens[i+3])) for i in range(4, len(tokens), 4)]
-
-
 def parse_polygon_material_dic(polygon_material_dic, tokens):
     key = int(tokens[1])
     if key not in polygon_material_dic:
@@ -1342,10 +1444,70 @@ def parse_ik_dic(ik_dic, tokens):
     ik_dic[key] = [tokens[2], tokens[3], int(tokens[4])]
 
 
-def read_some_data(context, filepath, my_leaf_bone, my_import_normal, my_shade_mode, use_auto_smooth, my_angle, use_auto_bone_orientation, my_bone_length, my_calculate_roll, use_vertex_animation, use_edge_crease, my_edge_crease_scale, my_edge_smoothing, use_import_materials, obj_name, my_rotation_mode, use_fix_bone_poses, my_animation_offset, use_animation_prefix):
+def unpack_pose_dic(pose_dic, entries):
+    for (key, arrays) in entries:
+        pose_dic[key] = arrays[0].tolist()
+
+
+def unpack_pose_key_dic(pose_key_dic, entries):
+    for (key, arrays) in entries:
+        (frames, poses) = arrays
+        pose_key_dic[key] = np.column_stack((np.array(frames, dtype=np.float32), np.array(poses, dtype=np.float32).reshape(-1, 16)))
+
+
+def unpack_vertex_dic(vertex_dic, entries):
+    for (key, arrays) in entries:
+        vertex_dic[key] = np.array(arrays[0], dtype=np.float32).reshape(-1, 3)
+
+
+def unpack_polygon_dic(polygon_dic, entries):
+    for (key, arrays) in entries:
+        (loop_totals, indices) = arrays
+        polygon_dic[key] = [[item[0] for item in polygon] for polygon in intermediate.split_loops(indices, loop_totals, 1)]
+
+
+# uv, normal and color are stored per loop, the loop count per polygon is implied by the polygons
+def unpack_loop_dic(loop_dic, entries, width):
+    for (key, arrays) in entries:
+        loop_dic[key] = np.array(arrays[1], dtype=np.float32).reshape(-1, width)
+
+
+def unpack_polygon_material_dic(polygon_material_dic, entries):
+    for (key, arrays) in entries:
+        polygon_material_dic[key] = arrays[0].tolist()
+
+
+def unpack_shape_dic(shape_dic, entries):
+    for (key, arrays) in entries:
+        (indices, positions) = arrays
+        shape_dic[key] = [(index, positions[i*3], positions[i*3+1], positions[i*3+2]) for (i, index) in enumerate(indices)]
+
+
+def unpack_shape_key_dic(shape_key_dic, entries):
+    for (key, arrays) in entries:
+        (frames, channel_counts, channels, values) = arrays
+        shape_key_dic[key] = [None] * len(frames)
+        offset = 0
+        for (i, frame) in enumerate(frames):
+            shape_key_dic[key][i] = [frame] + [(channels[j], values[j]) for j in range(offset, offset + channel_counts[i])]
+            offset += channel_counts[i]
+
+
+def unpack_edge_crease_dic(edge_crease_dic, entries):
+    for (key, arrays) in entries:
+        (pairs, creases) = arrays
+        edge_crease_dic[key] = [[pairs[i*2], pairs[i*2+1], crease] for (i, crease) in enumerate(creases)]
+
+
+def unpack_edge_smoothing_dic(edge_smoothing_dic, entries):
+    for (key, arrays) in entries:
+        edge_smoothing_dic[key] = [list(item) for item in intermediate.split_rows(arrays[0], 2)]
+
+
+def read_some_data(context, filepath, my_leaf_bone, my_import_normal, my_shade_mode, use_auto_smooth, my_angle, use_auto_bone_orientation, my_bone_length, my_calculate_roll, use_vertex_animation, use_edge_crease, my_edge_crease_scale, my_edge_smoothing, use_import_materials, obj_name, my_rotation_mode, use_fix_bone_poses, my_animation_offset, use_animation_prefix, use_animation):
     print("running read_some_data...")
     print("="*30)
-    frame_rate = 30.0
+    frame_rate = [30.0]
     hierarchy_dic = {}
     node_dic = {}
     default_pose_dic = {}
@@ -1371,144 +1533,107 @@ def read_some_data(context, filepath, my_leaf_bone, my_import_normal, my_shade_m
     edge_smoothing_dic = {}
     ik_dic = {}
     max_uv = [0.0, 0.0]
-    with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-        for line in f:
-            line = line.strip("\r\n")
-            # ignore empty line
-            if len(line) == 0:
-                continue
-            # section line
-            if line.startswith("[") and line.endswith("]"):
-                line = line[1:-1]
-                tokens = line.split(",")
-                for i in range(len(tokens)):
-                    tokens[i] = tokens[i].replace("\\;", ",")
-                    tokens[i] = tokens[i].replace("nan(ind)", "0.0")
-                if len(tokens) > 0:
-                    section = tokens[0]
-                    # parse frame rate
-                    if section == "FrameRate":
-                        # validate data length
-                        if len(tokens) == 2:
-                            frame_rate = parse_frame_rate(tokens)
-                    # parse hierarchy dictionary
-                    elif section == "Hierarchy":
-                        # validate data length
-                        if len(tokens) == 5:
-                            parse_hierarchy_dic(hierarchy_dic, tokens)
-                    # parse node dictionary
-                    elif section == "Node":
-                        # validate data length
-                        if len(tokens) == 5:
-                            parse_node_dic(node_dic, tokens)
-                    # parse default pose dictionary
-                    elif section == "DefaultPose":
-                        # validate data length
-                        if len(tokens) == 18:
-                            parse_default_pose_dic(default_pose_dic, tokens)
-                    # parse bind pose dictionary
-                    elif section == "BindPose":
-                        # validate data length
-                        if len(tokens) == 18:
-                            parse_bind_pose_dic(bind_pose_dic, tokens)
-                    # parse pose key dictionary
-                    elif section == "PoseKey":
-                        # validate data length
-                        if len(tokens) == 21:
-                            parse_pose_key_dic(pose_key_dic, tokens)
-                    # parse shape key dictionary
-                    elif section == "ShapeKey":
-                        # validate data length
-                        if len(tokens) >= 5:
-                            parse_shape_key_dic(shape_key_dic, tokens)
-                    # parse vertex dictionary
-                    elif section == "Vertex":
-                        # validate data length
-                        if len(tokens) == 7:
-                            parse_vertex_dic(vertex_dic, tokens)
-                    # parse weight dictionary
-                    elif section == "Weight":
-                        # validate data length
-                        if len(tokens) >= 4:
-                            parse_weight_dic(weight_dic, tokens)
-                    # parse shape dictionary
-                    elif section == "Shape":
-                        # validate data length
-                        if len(tokens) >= 2:
-                            parse_shape_dic(shape_dic, tokens)
-                    # parse polygon dictionary
-                    elif section == "Polygon":
-                        # validate data length
-                        if len(tokens) >= 4:
-                            parse_polygon_dic(polygon_dic, tokens)
-                    # parse texture dictionary
-                    elif section == "Texture":
-                        # validate data length
-                        if len(tokens) == 3:
-                            parse_texture_dic(texture_dic, tokens)
-                    # parse material dictionary
-                    elif section == "Material":
-                        # validate data length
-                        if len(tokens) == 44:
-                            parse_material_dic(material_dic, tokens)
-                    # parse mesh material dictionary
-                    elif section == "MeshMaterial":
-                        # validate data length
-                        if len(tokens) >= 2:
-                            parse_mesh_material_dic(mesh_material_dic, tokens)
-                    # parse uv dictionary
-                    elif section == "UV":
-                        # validate data length
-                        if len(tokens) >= 4:
-                            parse_uv_dic(uv_dic, tokens, max_uv)
-                    # parse normal dictionary
-                    elif section == "Normal":
-                        # validate data length
-                        if len(tokens) >= 4:
-                            parse_normal_dic(normal_dic, tokens)
-                    # parse color dictionary
-                    elif section == "Color":
-                        # validate data length
-                        if len(tokens) >= 4:
-                            parse_color_dic(color_dic, tokens)
-                    # parse polygon material dictionary
-                    elif section == "PolygonMaterial":
-                        # validate data length
-                        if len(tokens) == 5:
-                            parse_polygon_material_dic(polygon_material_dic, tokens)
-                    # parse camera dictionary
-                    elif section == "Camera":
-                        # validate data length
-                        if len(tokens) == 14:
-                            parse_camera_dic(camera_dic, tokens)
-                    # parse light dictionary
-                    elif section == "Light":
-                        # validate data length
-                        if len(tokens) == 7:
-                            parse_light_dic(light_dic, tokens)
-                    # parse custom property dictionary
-                    elif section == "CustomProperty":
-                        # validate data length
-                        if len(tokens) >= 7 and len(tokens) <= 10:
-                            parse_custom_property_dic(custom_property_dic, tokens)
-                    # parse edge crease dictionary
-                    elif section == "EdgeCrease":
-                        # validate data length
-                        if len(tokens) == 7:
-                            parse_edge_crease_dic(edge_crease_dic, tokens)
-                    # parse edge smoothing dictionary
-                    elif section == "EdgeSmoothing":
-                        # validate data length
-                        if len(tokens) == 6:
-                            parse_edge_smoothing_dic(edge_smoothing_dic, tokens)
-                    # parse IK dictionary
-                    elif section == "IK":
-                        # validate data length
-                        if len(tokens) == 5:
-                            parse_ik_dic(ik_dic, tokens)
+    # skip sections which are not used by the import options
+    skip_sections = set()
+    if not use_import_materials:
+        skip_sections.update(["Texture", "Material", "MeshMaterial", "PolygonMaterial"])
+    if not use_animation:
+        skip_sections.update(["PoseKey", "ShapeKey"])
+    if my_import_normal != 'Import':
+        skip_sections.add("Normal")
+    if not use_edge_crease:
+        skip_sections.add("EdgeCrease")
+    if my_edge_smoothing != 'Import' and my_edge_smoothing != 'FBXSDK':
+        skip_sections.add("EdgeSmoothing")
+    try:
+        binary_file = intermediate.read_binary_file(filepath, skip_sections)
+    except ValueError as e:
+        print(e)
+        return {'CANCELLED'}
+    if binary_file != None:
+        (version, sections) = binary_file
+        # unpack packed sections, text sections go through the line parser below
+        for (section, data) in sections:
+            if intermediate.is_packed_section(section):
+                entries = intermediate.unpack_section(section, data)
+                if section == "DefaultPose":
+                    unpack_pose_dic(default_pose_dic, entries)
+                elif section == "BindPose":
+                    unpack_pose_dic(bind_pose_dic, entries)
+                elif section == "PoseKey":
+                    unpack_pose_key_dic(pose_key_dic, entries)
+                elif section == "Vertex":
+                    unpack_vertex_dic(vertex_dic, entries)
+                elif section == "Polygon":
+                    unpack_polygon_dic(polygon_dic, entries)
+                elif section == "UV":
+                    unpack_loop_dic(uv_dic, entries, 2)
+                elif section == "Normal":
+                    unpack_loop_dic(normal_dic, entries, 3)
+                elif section == "Color":
+                    unpack_loop_dic(color_dic, entries, 4)
+                elif section == "PolygonMaterial":
+                    unpack_polygon_material_dic(polygon_material_dic, entries)
+                elif section == "Shape":
+                    unpack_shape_dic(shape_dic, entries)
+                elif section == "ShapeKey":
+                    unpack_shape_key_dic(shape_key_dic, entries)
+                elif section == "EdgeCrease":
+                    unpack_edge_crease_dic(edge_crease_dic, entries)
+                elif section == "EdgeSmoothing":
+                    unpack_edge_smoothing_dic(edge_smoothing_dic, entries)
+        token_stream = intermediate.iter_binary_text_tokens(sections)
+    else:
+        token_stream = intermediate.iter_text_tokens(filepath, skip_sections, BULK_SECTIONS)
+    pending_dics = {section: {} for section in BULK_SECTIONS}
+    # section name: (minimum data length, maximum data length, parser)
+    # bulk lines have 5 tokens at most, parse_bulk_dic checks the length of their data
+    section_parsers = {
+        "FrameRate": (2, 2, functools.partial(parse_frame_rate, frame_rate)),
+        "Hierarchy": (5, 5, functools.partial(parse_hierarchy_dic, hierarchy_dic)),
+        "Node": (5, 5, functools.partial(parse_node_dic, node_dic)),
+        "DefaultPose": (18, 18, functools.partial(parse_default_pose_dic, default_pose_dic)),
+        "BindPose": (18, 18, functools.partial(parse_bind_pose_dic, bind_pose_dic)),
+        "PoseKey": (4, 5, functools.partial(parse_bulk_dic, pose_key_dic, pending_dics["PoseKey"], "PoseKey")),
+        "ShapeKey": (5, sys.maxsize, functools.partial(parse_shape_key_dic, shape_key_dic)),
+        "Vertex": (4, 5, functools.partial(parse_bulk_dic, vertex_dic, pending_dics["Vertex"], "Vertex")),
+        "Weight": (4, sys.maxsize, functools.partial(parse_weight_dic, weight_dic)),
+        "Shape": (2, sys.maxsize, functools.partial(parse_shape_dic, shape_dic)),
+        "Polygon": (4, sys.maxsize, functools.partial(parse_polygon_dic, polygon_dic)),
+        "Texture": (3, 3, functools.partial(parse_texture_dic, texture_dic)),
+        "Material": (44, 44, functools.partial(parse_material_dic, material_dic)),
+        "MeshMaterial": (2, sys.maxsize, functools.partial(parse_mesh_material_dic, mesh_material_dic)),
+        "UV": (4, 5, functools.partial(parse_bulk_dic, uv_dic, pending_dics["UV"], "UV")),
+        "Normal": (4, 5, functools.partial(parse_bulk_dic, normal_dic, pending_dics["Normal"], "Normal")),
+        "Color": (4, 5, functools.partial(parse_bulk_dic, color_dic, pending_dics["Color"], "Color")),
+        "PolygonMaterial": (5, 5, functools.partial(parse_polygon_material_dic, polygon_material_dic)),
+        "Camera": (14, 14, functools.partial(parse_camera_dic, camera_dic)),
+        "Light": (7, 7, functools.partial(parse_light_dic, light_dic)),
+        "CustomProperty": (7, 10, functools.partial(parse_custom_property_dic, custom_property_dic)),
+        "EdgeCrease": (7, 7, functools.partial(parse_edge_crease_dic, edge_crease_dic)),
+        "EdgeSmoothing": (6, 6, functools.partial(parse_edge_smoothing_dic, edge_smoothing_dic)),
+        "IK": (5, 5, functools.partial(parse_ik_dic, ik_dic)),
+    }
+    for tokens in token_stream:
+        section_parser = section_parsers.get(tokens[0])
+        # validate data length
+        if section_parser != None and section_parser[0] <= len(tokens) <= section_parser[1]:
+            section_parser[2](tokens)
+    for (section, bulk_dic) in [("PoseKey", pose_key_dic), ("Vertex", vertex_dic), ("UV", uv_dic), ("Normal", normal_dic), ("Color", color_dic)]:
+        flush_bulk_dic(bulk_dic, pending_dics[section], section)
+    # the nodes can not refer to the keys of the skipped sections and to the dropped keys
+    for section in skip_sections:
+        remove_dropped_references(node_dic, section, {})
+    for (section, bulk_dic) in [("PoseKey", pose_key_dic), ("UV", uv_dic), ("Normal", normal_dic), ("Color", color_dic)]:
+        if section not in skip_sections:
+            remove_dropped_references(node_dic, section, bulk_dic)
+    # index the hierarchy once for all stages below
+    scene_graph = SceneGraph(hierarchy_dic, node_dic)
+    # get maximum UV
+    get_max_uv(uv_dic, max_uv)
     # set frame rate
-    context.scene.render.fps = int(frame_rate + 0.5)
-    context.scene.render.fps_base = int(frame_rate + 0.5) / frame_rate
+    context.scene.render.fps = int(frame_rate[0] + 0.5)
+    context.scene.render.fps_base = int(frame_rate[0] + 0.5) / frame_rate[0]
     # make texture dic
     make_texture_dic(context, texture_dic, max_uv)
     # make material dic
@@ -1525,29 +1650,29 @@ def read_some_data(context, filepath, my_leaf_bone, my_import_normal, my_shade_m
     # make shape dic
     make_shape_dic(context, hierarchy_dic, node_dic, shape_dic)
     # make armature dic
-    make_armature_dic(context, hierarchy_dic, node_dic, bind_pose_dic, my_leaf_bone, use_auto_bone_orientation, my_bone_length, my_calculate_roll, obj_name, my_rotation_mode)
+    make_armature_dic(context, hierarchy_dic, node_dic, bind_pose_dic, my_leaf_bone, use_auto_bone_orientation, my_bone_length, my_calculate_roll, obj_name, my_rotation_mode, scene_graph)
     # make hierarchy dic
-    make_hierarchy_dic(context, hierarchy_dic, node_dic, default_pose_dic, bind_pose_dic)
+    make_hierarchy_dic(context, hierarchy_dic, node_dic, default_pose_dic, bind_pose_dic, scene_graph)
     # fix bind pose for nodes which attach to bones from default pose
-    fix_bind_pose(context, hierarchy_dic, node_dic, default_pose_dic, bind_pose_dic)
+    fix_bind_pose(context, hierarchy_dic, node_dic, default_pose_dic, bind_pose_dic, scene_graph)
     # bind mesh to armature
-    bind_mesh_to_armature(context, hierarchy_dic, node_dic, weight_dic)
+    bind_mesh_to_armature(context, hierarchy_dic, node_dic, weight_dic, scene_graph)
     # reset all matrix parent inverses
     reset_all_matrix_parent_inverses(context, hierarchy_dic, node_dic)
     # set default pose, may have bug, use at your own risk!!!
     if use_fix_bone_poses:
-        set_default_pose(context, hierarchy_dic, node_dic, default_pose_dic)
+        set_default_pose(context, hierarchy_dic, node_dic, default_pose_dic, scene_graph)
     # make pose key dic
-    make_pose_key_dic(context, hierarchy_dic, node_dic, bind_pose_dic, pose_key_dic, my_rotation_mode, my_animation_offset, use_animation_prefix)
+    make_pose_key_dic(context, hierarchy_dic, node_dic, bind_pose_dic, pose_key_dic, my_rotation_mode, my_animation_offset, use_animation_prefix, scene_graph)
     # make shape key dic
     make_shape_key_dic(context, hierarchy_dic, node_dic, bind_pose_dic, shape_key_dic, my_animation_offset, use_animation_prefix)
     # make vertex animation
     if use_vertex_animation:
         make_vertex_animation(context, hierarchy_dic, node_dic, exist_object_dic)
     # make custom property dic
-    make_custom_property_dic(context, hierarchy_dic, node_dic, custom_property_dic)
+    make_custom_property_dic(context, hierarchy_dic, node_dic, custom_property_dic, scene_graph)
     # make IK dic
-    make_ik_dic(context, hierarchy_dic, node_dic, ik_dic)
+    make_ik_dic(context, hierarchy_dic, node_dic, ik_dic, scene_graph)
     # set visibility
     for node in node_dic.values():
         if 'Object' in node:
@@ -1786,6 +1911,22 @@ class BetterImportFbx(Operator, ImportHelper):
             default='QUATERNION',
             )
 
+    my_converter_mode: EnumProperty(
+            name="Converter Mode",
+            description="How the fbx-utility is run",
+            items=(('DIRECT', "Direct", "Start a new fbx-utility process for every file"),
+                   ('WORKER', "Worker", "Send every file to a pool of worker processes, the bundled worker still starts a new fbx-utility process for every file")),
+            default='DIRECT',
+            options={'HIDDEN'},
+            )
+
+    my_max_concurrent_conversions: IntProperty(
+        name = "Max Concurrent Conversions",
+        description = "Maximum number of files converted at the same time when importing multiple files",
+        default = converter.DEFAULT_MAX_WORKERS,
+        min = 1,
+        max = 64)
+
     def draw(self, context):
         layout = self.layout
 
@@ -1835,33 +1976,25 @@ class BetterImportFbx(Operator, ImportHelper):
         box.prop(self, 'use_edge_crease')
         box.prop(self, 'my_edge_crease_scale')
 
+        box = layout.box()
+        box.label(text="Batch Options:")
+        box.prop(self, 'my_max_concurrent_conversions')
+
+
+    def get_converter_pool(self, executable_path):
+        if self.my_converter_mode != 'WORKER':
+            return None
+        python_path = getattr(bpy.app, "binary_path_python", sys.executable)
+        return converter.get_pool(converter.make_worker_command(python_path, executable_path), self.my_max_concurrent_conversions)
+
+    def make_converter_command(self, executable_path, filepath, output_path):
+        return [executable_path, filepath, output_path, str(self.my_scale), "None", "None", "None", "True" if self.use_only_deform_bones else "False", "True" if self.use_animation else "False", "None", "None", "True" if self.use_reset_mesh_origin else "False", "True" if self.use_fix_attributes else "False", "True" if self.use_triangulate else "False", "True" if self.use_optimize_for_blender else "False", self.my_edge_smoothing, "None", "None", "None"]
 
     def execute(self, context):
         start_time = time.time()
         # do the job in background
-        executable_path = None
-        if platform.system() == 'Windows':
-            if platform.machine().endswith('64'):
-                executable_path = os.path.join(os.path.dirname(__file__), "bin", platform.system(), "x64", "fbx-utility")
-            else:
-                executable_path = os.path.join(os.path.dirname(__file__), "bin", platform.system(), "x86", "fbx-utility")
-        else:
-            if platform.system() == 'Linux':
-                glibc_version = os.confstr('CS_GNU_LIBC_VERSION').split(" ")
-                if glibc_version[0] == 'glibc' and glibc_version[1] >= '2.29':
-                    executable_path = os.path.join(os.path.dirname(__file__), "bin", platform.system(), "fbx-utility")
-                else:
-                    executable_path = os.path.join(os.path.dirname(__file__), "bin", platform.system(), "fbx-utility2")
-            elif platform.system() == 'Darwin':
-                if platform.mac_ver()[0] >= '10.15':
-                    executable_path = os.path.join(os.path.dirname(__file__), "bin", platform.system(), "fbx-utility")
-                elif platform.mac_ver()[0] >= '10.13':
-                    executable_path = os.path.join(os.path.dirname(__file__), "bin", platform.system(), "fbx-utility2")
-                else:
-                    executable_path = os.path.join(os.path.dirname(__file__), "bin", platform.system(), "fbx-utility3")
-            # chmod
-            if not os.access(executable_path, os.X_OK):
-                os.chmod(executable_path, 0o755)
+        executable_path = converter.get_executable_path(os.path.dirname(__file__))
+        pool = self.get_converter_pool(executable_path)
 
         # delete deprecated output path
         deprecated_output_path = os.path.join(os.path.dirname(__file__), "data", "untitled-fbx.txt")
@@ -1873,29 +2006,34 @@ class BetterImportFbx(Operator, ImportHelper):
 
         if self.files:
             dirname = os.path.dirname(self.filepath)
-            for file in self.files:
-                path = os.path.join(dirname, file.name)
-                result = subprocess.run([executable_path, path, output_path, str(self.my_scale), "None", "None", "None", "True" if self.use_only_deform_bones else "False", "True" if self.use_animation else "False", "None", "None", "True" if self.use_reset_mesh_origin else "False", "True" if self.use_fix_attributes else "False", "True" if self.use_triangulate else "False", "True" if self.use_optimize_for_blender else "False", self.my_edge_smoothing, "None", "None", "None"])
-                if result.returncode != 0:
+            # every file has its own output, the converters run in parallel while the finished files are read in order
+            output_paths = [os.path.join(os.path.dirname(__file__), "data", uuid.uuid4().hex + ".txt") for file in self.files]
+            commands = [self.make_converter_command(executable_path, os.path.join(dirname, file.name), output_path) for (file, output_path) in zip(self.files, output_paths)]
+            returncodes = converter.iter_converters(commands, self.my_max_concurrent_conversions, pool)
+            try:
+                for (file, output_path, returncode) in zip(self.files, output_paths, returncodes):
+                    if returncode != 0:
+                        return {'CANCELLED'}
+                    result = read_some_data(context, output_path, self.my_leaf_bone, self.my_import_normal, self.my_shade_mode, self.use_auto_smooth, self.my_angle, self.use_auto_bone_orientation, self.my_bone_length, self.my_calculate_roll, self.use_vertex_animation, self.use_edge_crease, self.my_edge_crease_scale, self.my_edge_smoothing, self.use_import_materials, file.name[:file.name.rfind(".")] if self.use_rename_by_filename else None, self.my_rotation_mode, self.use_fix_bone_poses, self.my_animation_offset, self.use_animation_prefix, self.use_animation)
+                    if result != {'FINISHED'}:
+                        return {'CANCELLED'}
                     if os.path.exists(output_path):
                         os.remove(output_path)
-                    return {'CANCELLED'}
-                result = read_some_data(context, output_path, self.my_leaf_bone, self.my_import_normal, self.my_shade_mode, self.use_auto_smooth, self.my_angle, self.use_auto_bone_orientation, self.my_bone_length, self.my_calculate_roll, self.use_vertex_animation, self.use_edge_crease, self.my_edge_crease_scale, self.my_edge_smoothing, self.use_import_materials, file.name[:file.name.rfind(".")] if self.use_rename_by_filename else None, self.my_rotation_mode, self.use_fix_bone_poses, self.my_animation_offset, self.use_animation_prefix)
-                if result != {'FINISHED'}:
+            finally:
+                # wait for running converters before removing their outputs
+                returncodes.close()
+                for output_path in output_paths:
                     if os.path.exists(output_path):
                         os.remove(output_path)
-                    return {'CANCELLED'}
-            if os.path.exists(output_path):
-                os.remove(output_path)
             print("Finished in: {:.2f} seconds.".format(time.time() - start_time))
             return {'FINISHED'}
         else:
-            result = subprocess.run([executable_path, self.filepath, output_path, str(self.my_scale), "None", "None", "None", "True" if self.use_only_deform_bones else "False", "True" if self.use_animation else "False", "None", "None", "True" if self.use_reset_mesh_origin else "False", "True" if self.use_fix_attributes else "False", "True" if self.use_triangulate else "False", "True" if self.use_optimize_for_blender else "False", self.my_edge_smoothing, "None", "None", "None"])
-            if result.returncode != 0:
+            returncode = converter.run_converter(self.make_converter_command(executable_path, self.filepath, output_path), pool)
+            if returncode != 0:
                 if os.path.exists(output_path):
                     os.remove(output_path)
                 return {'CANCELLED'}
-            result = read_some_data(context, output_path, self.my_leaf_bone, self.my_import_normal, self.my_shade_mode, self.use_auto_smooth, self.my_angle, self.use_auto_bone_orientation, self.my_bone_length, self.my_calculate_roll, self.use_vertex_animation, self.use_edge_crease, self.my_edge_crease_scale, self.my_edge_smoothing, self.use_import_materials, None, self.my_rotation_mode, self.use_fix_bone_poses, self.my_animation_offset, self.use_animation_prefix)
+            result = read_some_data(context, output_path, self.my_leaf_bone, self.my_import_normal, self.my_shade_mode, self.use_auto_smooth, self.my_angle, self.use_auto_bone_orientation, self.my_bone_length, self.my_calculate_roll, self.use_vertex_animation, self.use_edge_crease, self.my_edge_crease_scale, self.my_edge_smoothing, self.use_import_materials, None, self.my_rotation_mode, self.use_fix_bone_poses, self.my_animation_offset, self.use_animation_prefix, self.use_animation)
             if os.path.exists(output_path):
                 os.remove(output_path)
             print("Finished in: {:.2f} seconds.".format(time.time() - start_time))
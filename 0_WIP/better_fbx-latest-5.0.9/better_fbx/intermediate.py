@@ -0,0 +1,254 @@
+import mmap
+import struct
+import sys
+from array import array
+
+
+# binary intermediate container:
+#   header: magic, version, table entry count
+#   table: (section name, dictionary key, byte offset, byte length) per dictionary key of a packed section and per text section
+#   sections: packed sections hold entries of little-endian int32/float32 arrays,
+#             text sections hold the same "[Section,...]" lines as the text format
+# version 1 has no dictionary key in the table, one table entry per section
+BINARY_MAGIC = b"BFBX"
+BINARY_VERSION = 2
+HEADER_FORMAT = "<4sII"
+TABLE_ENTRY_FORMATS = {
+    1: "<16sQQ",
+    2: "<16siQQ",
+}
+# dictionary key of the table entry of a text section
+TEXT_SECTION_KEY = -1
+ENTRY_KEY_FORMAT = "<i"
+ARRAY_LENGTH_FORMAT = "<I"
+
+# array layout of each packed section, 'i' for int32 arrays and 'f' for float32 arrays, every other section is a text section
+PACKED_SECTIONS = {
+    # 16 floats
+    "DefaultPose": "f",
+    "BindPose": "f",
+    # frames, 16 floats per frame
+    "PoseKey": "if",
+    # 3 floats per vertex
+    "Vertex": "f",
+    # loop count per polygon, vertex index per loop
+    "Polygon": "ii",
+    # loop count per polygon, 2 floats per loop
+    "UV": "if",
+    # loop count per polygon, 3 floats per loop
+    "Normal": "if",
+    # loop count per polygon, 4 floats per loop
+    "Color": "if",
+    # material index per polygon
+    "PolygonMaterial": "i",
+    # vertex indices, 3 floats per vertex
+    "Shape": "if",
+    # frames, channel count per frame, channel indices, channel values
+    "ShapeKey": "iiif",
+    # 2 vertex indices per edge, crease per edge
+    "EdgeCrease": "if",
+    # 2 vertex indices per edge
+    "EdgeSmoothing": "i",
+    # frames, 6 floats per vertex per frame
+    "VertexPoseKey": "if",
+}
+
+
+# point cache file, the PC2 layout read by Blender's Mesh Cache modifier and 3ds Max:
+#   header: magic, version, point count, start frame, sample rate, sample count
+#   samples: 3 little-endian float32 per point per sample
+PC2_MAGIC = b"POINTCACHE2\0"
+PC2_VERSION = 1
+PC2_HEADER_FORMAT = "<12siiffi"
+
+
+def is_packed_section(section):
+    return section in PACKED_SECTIONS
+
+
+def pack_entry(key, arrays, layout):
+    chunks = [struct.pack(ENTRY_KEY_FORMAT, key)]
+    for (typecode, values) in zip(layout, arrays):
+        data = array(typecode, values)
+        # the container is always little-endian
+        if sys.byteorder != 'little':
+            data.byteswap()
+        chunks.append(struct.pack(ARRAY_LENGTH_FORMAT, len(data)))
+        chunks.append(data.tobytes())
+    return b"".join(chunks)
+
+
+# entry data which is too large to be kept in memory, chunks() yields the bytes of the entry piece by piece
+class StreamedData:
+    def __init__(self, length, chunks):
+        self.length = length
+        self.chunks = chunks
+
+    def __len__(self):
+        return self.length
+
+
+# pack an entry whose last array is streamed, arrays are the leading arrays,
+# length is the item count of the last array and chunks() yields its little-endian bytes
+def pack_streamed_entry(key, arrays, layout, length, chunks):
+    head = pack_entry(key, arrays, layout[:-1]) + struct.pack(ARRAY_LENGTH_FORMAT, length)
+    def entry_chunks():
+        yield head
+        yield from chunks()
+    return StreamedData(len(head) + length * array(layout[-1]).itemsize, entry_chunks)
+
+
+# return [(key, data)], one table entry per dictionary key
+def pack_section(section, entries):
+    layout = PACKED_SECTIONS[section]
+    return [(key, pack_entry(key, arrays, layout)) for (key, arrays) in entries]
+
+
+def unpack_section(section, data):
+    layout = PACKED_SECTIONS[section]
+    entries = []
+    offset = 0
+    key_size = struct.calcsize(ENTRY_KEY_FORMAT)
+    length_size = struct.calcsize(ARRAY_LENGTH_FORMAT)
+    while offset < len(data):
+        key = struct.unpack_from(ENTRY_KEY_FORMAT, data, offset)[0]
+        offset += key_size
+        arrays = []
+        for typecode in layout:
+            length = struct.unpack_from(ARRAY_LENGTH_FORMAT, data, offset)[0]
+            offset += length_size
+            values = array(typecode)
+            values.frombytes(data[offset:offset + length * values.itemsize])
+            if sys.byteorder != 'little':
+                values.byteswap()
+            offset += length * values.itemsize
+            arrays.append(values)
+        entries.append((key, arrays))
+    return entries
+
+
+# sections: [(section name, data)], data is bytes for text sections and [(key, data)] for packed sections
+def write_binary_file(f, sections):
+    table = []
+    for (section, data) in sections:
+        if is_packed_section(section):
+            table.extend([(section, key, entry) for (key, entry) in data])
+        else:
+            table.append((section, TEXT_SECTION_KEY, data))
+    table_entry_format = TABLE_ENTRY_FORMATS[BINARY_VERSION]
+    f.write(struct.pack(HEADER_FORMAT, BINARY_MAGIC, BINARY_VERSION, len(table)))
+    offset = struct.calcsize(HEADER_FORMAT) + struct.calcsize(table_entry_format) * len(table)
+    for (section, key, data) in table:
+        f.write(struct.pack(table_entry_format, section.encode('ascii'), key, offset, len(data)))
+        offset += len(data)
+    for (section, key, data) in table:
+        if isinstance(data, StreamedData):
+            for chunk in data.chunks():
+                f.write(chunk)
+        else:
+            f.write(data)
+
+
+# return [(section name, key, byte offset, byte length)], key is None for version 1 tables
+def read_binary_table(data, version, count):
+    table_entry_format = TABLE_ENTRY_FORMATS[version]
+    table_entry_size = struct.calcsize(table_entry_format)
+    table_offset = struct.calcsize(HEADER_FORMAT)
+    table = []
+    for i in range(count):
+        fields = struct.unpack_from(table_entry_format, data, table_offset + i * table_entry_size)
+        section = fields[0].rstrip(b"\0").decode('ascii')
+        if version == 1:
+            table.append((section, None, fields[1], fields[2]))
+        else:
+            table.append((section, fields[1], fields[2], fields[3]))
+    return table
+
+
+# return (version, [(section name, data)]), or None if the file is not a binary container
+# the file is memory mapped and only the sections which are not in skip_sections are read
+# raise ValueError if the container version is not supported
+def read_binary_file(filepath, skip_sections=frozenset()):
+    with open(filepath, 'rb') as f:
+        if f.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+            return None
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        (magic, version, count) = struct.unpack_from(HEADER_FORMAT, data, 0)
+        if version not in TABLE_ENTRY_FORMATS:
+            raise ValueError("Unsupported binary intermediate format version: {}".format(version))
+        sections = []
+        section_chunks = {}
+        for (section, key, offset, length) in read_binary_table(data, version, count):
+            if section in skip_sections:
+                continue
+            if section not in section_chunks:
+                section_chunks[section] = []
+                sections.append(section)
+            section_chunks[section].append(data[offset:offset + length])
+        sections = [(section, b"".join(section_chunks[section])) for section in sections]
+    finally:
+        data.close()
+    return (version, sections)
+
+
+def write_pc2_header(f, point_count, start_frame, sample_count):
+    f.write(struct.pack(PC2_HEADER_FORMAT, PC2_MAGIC, PC2_VERSION, point_count, start_frame, 1.0, sample_count))
+
+
+def unescape_token(token):
+    return token.replace("\\;", ",").replace("nan(ind)", "0.0")
+
+
+def get_section_prefixes(sections):
+    return tuple([b"[" + section.encode('ascii') + b"," for section in sections])
+
+
+# yield the tokens of every "[Section,...]" line which is not in skip_sections, lines are bytes
+# lines of bulk_sections are split into section, key, index, length and one token with the rest of the data, if any
+def iter_section_tokens(lines, skip_sections=frozenset(), bulk_sections=frozenset()):
+    skip_prefixes = get_section_prefixes(skip_sections)
+    bulk_prefixes = get_section_prefixes(bulk_sections)
+    for line in lines:
+        line = line.strip(b"\r\n")
+        # ignore empty line and any line which is not a section line
+        if not (line.startswith(b"[") and line.endswith(b"]")):
+            continue
+        # skip the line before decoding it
+        if skip_prefixes and line.startswith(skip_prefixes):
+            continue
+        # the data of a bulk line is converted with the other lines of its key, there is no need to split it
+        if bulk_prefixes and line.startswith(bulk_prefixes):
+            tokens = line[1:-1].decode('utf-8', errors='ignore').split(",", 4)
+        else:
+            tokens = line[1:-1].decode('utf-8', errors='ignore').split(",")
+        # only a few lines contain escaped commas or invalid floats
+        if b"\\" in line or b"nan" in line:
+            tokens = [unescape_token(token) for token in tokens]
+        yield tokens
+
+
+def iter_text_tokens(filepath, skip_sections=frozenset(), bulk_sections=frozenset()):
+    with open(filepath, 'rb') as f:
+        yield from iter_section_tokens(f, skip_sections, bulk_sections)
+
+
+def iter_binary_text_tokens(sections):
+    for (section, data) in sections:
+        if not is_packed_section(section):
+            yield from iter_section_tokens(data.split(b"\n"))
+
+
+# split a flat array into tuples of the given width
+def split_rows(values, width):
+    return [tuple(values[i:i + width]) for i in range(0, len(values), width)]
+
+
+# split a flat array into per polygon lists of tuples, by loop count per polygon
+def split_loops(values, loop_totals, width):
+    result = [None] * len(loop_totals)
+    offset = 0
+    for (i, loop_total) in enumerate(loop_totals):
+        result[i] = split_rows(values[offset:offset + loop_total * width], width)
+        offset += loop_total * width
+    return result